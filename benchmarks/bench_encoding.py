@@ -0,0 +1,54 @@
+"""
+Compare the two ways of getting the datamatrix module matrix:
+
+- direct: libdmtx draws the symbol with one pixel per module
+- bitmap: pylibdmtx.encode draws a 5x RGB bitmap, which is downsampled
+
+Run from the repository root:
+
+    python benchmarks/bench_encoding.py --count 2000
+"""
+
+import timeit
+
+import click
+import numpy as np
+
+from pinned_datamatrix.datamatrix_generator import DataMatrix
+
+
+@click.command()
+@click.option("--count", "-c", default=2000, help="Number of payloads to encode")
+@click.option("--repeat", "-r", default=3, help="Number of timing repeats")
+def main(count: int, repeat: int):
+    payloads = [str(number).zfill(9) for number in range(count)]
+    datamatrices = [DataMatrix(payload) for payload in payloads]
+
+    # Both paths must produce the same modules before their timings mean anything
+    for dm in datamatrices:
+        if not np.array_equal(dm.dm_array, dm._get_datamatrix_bit_array_from_bitmap()):
+            raise click.ClickException(f"Module matrices differ for {dm.data!r}")
+
+    paths = {
+        "direct": DataMatrix._get_datamatrix_bit_array,
+        "bitmap": DataMatrix._get_datamatrix_bit_array_from_bitmap,
+    }
+    results = {}
+    for name, encode in paths.items():
+        seconds = min(
+            timeit.repeat(
+                lambda encode=encode: [encode(dm) for dm in datamatrices],
+                number=1,
+                repeat=repeat,
+            )
+        )
+        results[name] = seconds
+        click.echo(
+            f"{name:>6}: {seconds:.3f}s, {count / seconds:,.0f} symbols/s, "
+            f"{seconds / count * 1e6:.1f}us/symbol"
+        )
+    click.echo(f"speedup: {results['bitmap'] / results['direct']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
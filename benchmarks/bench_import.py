@@ -0,0 +1,82 @@
+"""
+Time the startup of the command line interface and the imports of the package, each
+in a fresh Python process:
+
+- cli_help: pinned_datamatrix --help
+- cli_invalid: pinned_datamatrix with invalid arguments, failing validation
+- import_*: importing a module of the package
+
+Run from the repository root:
+
+    python benchmarks/bench_import.py --repeat 10
+
+Pass --importtime to print the slowest imports of a case, as reported by
+`python -X importtime`.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+CASES = {
+    "cli_help": ["-m", "pinned_datamatrix", "--help"],
+    "cli_invalid": ["-m", "pinned_datamatrix", "-s", "NHMD", "-n", "abc", "-o", "x"],
+    "import_label_generator": ["-c", "import pinned_datamatrix.label_generator"],
+    "import_sheet_generator": ["-c", "import pinned_datamatrix.sheet_generator"],
+}
+
+
+def run(args: list[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in [os.getcwd(), env.get("PYTHONPATH")] if path
+    )
+    options = ["-X", "importtime"] if importtime else []
+    return subprocess.run(
+        [sys.executable, *options, *args], capture_output=True, text=True, env=env
+    )
+
+
+def slowest_imports(stderr: str, count: int) -> list[tuple[int, str]]:
+    """The cumulative microseconds and names of the slowest imports"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+@click.command()
+@click.option("--repeat", "-r", default=10, help="Number of runs per case")
+@click.option("--importtime", is_flag=True, help="Print the slowest imports per case")
+def main(repeat: int, importtime: bool):
+    # Start the interpreter once, so the first case does not pay for a cold disk cache
+    run(["-c", "pass"])
+    baseline = min(_time(["-c", "pass"]) for _ in range(repeat))
+    click.echo(f"{'python -c pass':<24}{baseline * 1e3:>8.1f}ms")
+    for name, args in CASES.items():
+        timings = [_time(args) for _ in range(repeat)]
+        click.echo(
+            f"{name:<24}{min(timings) * 1e3:>8.1f}ms best"
+            f"{statistics.median(timings) * 1e3:>8.1f}ms median"
+            f"{(min(timings) - baseline) * 1e3:>8.1f}ms over python"
+        )
+        if importtime:
+            for cumulative, module in slowest_imports(run(args, True).stderr, 10):
+                click.echo(f"    {cumulative / 1e3:>8.1f}ms {module}")
+
+
+def _time(args: list[str]) -> float:
+    start = time.perf_counter()
+    run(args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure the memory footprint of labels kept in a list, e.g. by a caller collecting the
+labels of a run before placing them on a sheet.
+
+Labels are created with each style and kept alive, and the memory they allocate is
+measured with tracemalloc, so the figures are independent of the allocator and of
+what the interpreter had allocated before. The footprint per label includes its
+datamatrix, but not the template shared by all labels of a style.
+
+Run from the repository root:
+
+    python benchmarks/bench_memory.py --count 100000
+"""
+
+import gc
+import time
+import tracemalloc
+from functools import partial
+
+import click
+
+
+def measure(label_func, count: int) -> tuple[float, float]:
+    """The bytes allocated per label kept alive, and the seconds per label"""
+    # Create a label first, so lazily created module state is not counted
+    label_func(0)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    labels = [label_func(number) for number in range(1, count + 1)]
+    seconds = time.perf_counter() - start
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del labels
+    return allocated / count, seconds / count
+
+
+@click.command()
+@click.option("--count", "-n", default=10_000, help="Number of labels per style")
+def main(count: int):
+    from pinned_datamatrix.styles import NHMA, NHMD
+
+    styles = {
+        "NHMD": NHMD,
+        "NHMA": partial(NHMA, bottom_text="ENTOMOLOGY"),
+    }
+    for name, label_func in styles.items():
+        per_label, seconds = measure(label_func, count)
+        click.echo(
+            f"{name:<8}{per_label:>10,.0f} bytes per label"
+            f"{per_label * count / 2**20:>10.1f} MiB for {count:,} labels"
+            f"{seconds * 1e6:>10.1f}us per label"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmark the label and sheet pipeline, and compare the results against a baseline.
+
+Every case runs in a fresh Python process, so its peak RSS is its own. Its timing is
+the best of a few repeats within that process:
+
+- encode: DataMatrix encoding
+- encode_copies: DataMatrix encoding of 4 copies of each payload, e.g. a reprint
+- encode_many: DataMatrix.create_many encoding all payloads as one block
+- label_NHMD, label_NHMA: label construction per style
+- check_overlap: Label._check_overlap
+- svg_to_string: Label.svg_to_string
+- svg2rlg: converting the label SVG with svglib
+- sheet_single[N], sheet_double[N]: Sheet.generate and saving the PDF for N labels,
+  single- and double-sided. The labels are created before the timing starts.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --output baseline.json
+    python benchmarks/bench_pipeline.py --output results.json --baseline baseline.json
+
+With a baseline, the command fails if a case got slower, or used more memory, by more
+than the threshold.
+"""
+
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from functools import partial
+
+import click
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def bench_encode(count: int, copies: int = 1) -> dict:
+    from pinned_datamatrix.datamatrix_generator import DataMatrix, encode_modules
+
+    payloads = [str(number // copies).zfill(9) for number in range(count)]
+    # Time the encoding, rather than the memo filled by an earlier repeat
+    encode_modules.cache_clear()
+    start = time.perf_counter()
+    for payload in payloads:
+        DataMatrix(payload)
+    return {"seconds": time.perf_counter() - start}
+
+
+def bench_encode_many(count: int) -> dict:
+    from pinned_datamatrix.datamatrix_generator import DataMatrix
+
+    payloads = [str(number).zfill(9) for number in range(count)]
+    start = time.perf_counter()
+    DataMatrix.create_many(payloads)
+    return {"seconds": time.perf_counter() - start}
+
+
+def bench_label(style: str, count: int) -> dict:
+    from pinned_datamatrix.datamatrix_generator import encode_modules
+    from pinned_datamatrix.styles import NHMA, NHMD
+
+    label_func = NHMD if style == "NHMD" else partial(NHMA, bottom_text="ENTOMOLOGY")
+    encode_modules.cache_clear()
+    start = time.perf_counter()
+    for number in range(count):
+        label_func(number)
+    return {"seconds": time.perf_counter() - start}
+
+
+def bench_label_method(method: Callable, count: int) -> dict:
+    from pinned_datamatrix.styles import NHMD
+
+    labels = [NHMD(number) for number in range(count)]
+    start = time.perf_counter()
+    for label in labels:
+        method(label)
+    return {"seconds": time.perf_counter() - start}
+
+
+def check_overlap(label) -> None:
+    label._check_overlap()
+
+
+def svg_to_string(label) -> None:
+    label.svg_to_string()
+
+
+def svg2rlg(label) -> None:
+    from svglib.svglib import svg2rlg
+
+    svg2rlg(io.StringIO(label.svg_to_string()))
+
+
+def bench_sheet(double_sided: bool, count: int) -> dict:
+    from pinned_datamatrix.sheet_generator import Sheet
+    from pinned_datamatrix.styles import NHMD
+
+    labels = [NHMD(number) for number in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "labels.pdf")
+        start = time.perf_counter()
+        sheet = Sheet(labels, output_path, double_sided=double_sided)
+        sheet.generate(progress=False)
+        sheet.c.save()
+        seconds = time.perf_counter() - start
+        return {"seconds": seconds, "pdf_size": os.path.getsize(output_path)}
+
+
+CASES: dict[str, Callable[[int], dict]] = {
+    "encode": bench_encode,
+    "encode_copies": partial(bench_encode, copies=4),
+    "encode_many": bench_encode_many,
+    "label_NHMD": partial(bench_label, "NHMD"),
+    "label_NHMA": partial(bench_label, "NHMA"),
+    "check_overlap": partial(bench_label_method, check_overlap),
+    "svg_to_string": partial(bench_label_method, svg_to_string),
+    "svg2rlg": partial(bench_label_method, svg2rlg),
+}
+SHEET_CASES: dict[str, Callable[[int], dict]] = {
+    "sheet_single": partial(bench_sheet, False),
+    "sheet_double": partial(bench_sheet, True),
+}
+
+
+def peak_rss() -> int | None:
+    """The peak resident set size of this process in bytes, if it is known"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def run_case(name: str, count: int, repeat: int) -> dict:
+    """Run a case in a fresh process, and return its results"""
+    process = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run-case",
+            name,
+            "--count",
+            str(count),
+            "--repeat",
+            str(repeat),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise click.ClickException(f"{name} failed:\n{process.stderr}")
+    result = json.loads(process.stdout)
+    result["count"] = count
+    result["labels_per_second"] = count / result["seconds"]
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compare results against a baseline.
+    Returns:
+        A description of each regression beyond the threshold.
+    """
+    regressions = []
+    click.echo(f"\n{'case':<22}{'labels/s':>14}{'change':>10}{'peak RSS':>12}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        speed = result["labels_per_second"] / base["labels_per_second"] - 1
+        rss = None
+        if result.get("peak_rss") and base.get("peak_rss"):
+            rss = result["peak_rss"] / base["peak_rss"] - 1
+        rss_change = f"{rss:+.1%}" if rss is not None else "n/a"
+        click.echo(
+            f"{name:<22}{result['labels_per_second']:>14,.0f}{speed:>+10.1%}"
+            f"{rss_change:>12}"
+        )
+        if speed < -threshold:
+            regressions.append(f"{name} is {-speed:.1%} slower")
+        if rss is not None and rss > threshold:
+            regressions.append(f"{name} uses {rss:.1%} more memory")
+    return regressions
+
+
+@click.command()
+@click.option("--count", "-c", default=1000, help="Number of labels per micro case")
+@click.option("--repeat", "-r", default=3, help="Number of timing repeats per case")
+@click.option(
+    "--sizes",
+    "-s",
+    default="100,1000,10000",
+    help="Comma separated numbers of labels for the sheet cases",
+)
+@click.option(
+    "--case",
+    "cases",
+    multiple=True,
+    help="Only run cases starting with this name, e.g. sheet_double (repeatable)",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False),
+    help="Save the results as JSON to this path",
+)
+@click.option(
+    "--baseline",
+    "-b",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Compare the results against these saved results",
+)
+@click.option(
+    "--threshold",
+    "-t",
+    default=0.2,
+    help="Relative slowdown or memory growth reported as regression (default: 0.2)",
+)
+@click.option("--run-case", "run_case_name", hidden=True)
+def main(count, repeat, sizes, cases, output, baseline, threshold, run_case_name):
+    if run_case_name is not None:
+        # Inside the process of a single case: print its results for the parent
+        func = CASES.get(run_case_name) or SHEET_CASES[run_case_name]
+        result = min(
+            (func(count) for _ in range(repeat)), key=lambda run: run["seconds"]
+        )
+        result["peak_rss"] = peak_rss()
+        click.echo(json.dumps(result))
+        return
+
+    runs = [(name, count) for name in CASES]
+    runs += [
+        (name, int(size)) for name in SHEET_CASES for size in sizes.split(",") if size
+    ]
+    results = {}
+    for name, case_count in runs:
+        key = name if name in CASES else f"{name}[{case_count}]"
+        if cases and not any(key.startswith(case) for case in cases):
+            continue
+        result = run_case(name, case_count, repeat)
+        results[key] = result
+        rss = result["peak_rss"]
+        pdf_size = result.get("pdf_size")
+        click.echo(
+            f"{key:<22}{result['labels_per_second']:>12,.0f} labels/s"
+            + (f"{rss / 2**20:>10.1f} MB RSS" if rss is not None else "")
+            + (f"{pdf_size / 2**10:>10,.0f} KB PDF" if pdf_size is not None else "")
+        )
+
+    if output is not None:
+        from pinned_datamatrix import __version__
+
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "version": __version__,
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "date": datetime.now(timezone.utc).isoformat(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if baseline is not None:
+        with open(baseline) as f:
+            baseline_results = json.load(f)["results"]
+        regressions = compare(results, baseline_results, threshold)
+        if regressions:
+            raise click.ClickException("Regressions:\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,47 @@
+from __future__ import annotations
+
 import click
-from tqdm import tqdm
+import cProfile
+import json
+import os
+import signal
+import sys
+import time
 from functools import partial as Partial
+from collections.abc import Iterable, Sequence
+from contextlib import closing, nullcontext
+from typing import TYPE_CHECKING
+
+from .number_ranges import NumberRanges
+from .stats import collect, timed
+
+# The label and sheet modules import ReportLab, NumPy and libdmtx, which takes longer
+# than many small jobs. They are imported when labels are generated, so --help and
+# invalid arguments return immediately.
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from .cache import LabelCache
+    from .label_generator import Label
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    A group of commands that runs its default command when the arguments do not start
+    with the name of a command, so `pinned_datamatrix -s NHMD ...` runs `generate`.
+    A bare `--help` shows the help of the group, which lists the commands.
+    """
 
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
 
-from .sheet_generator import Sheet
-from .label_generator import Label
-from .styles import NHMD, NHMA
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (
+            args[0] not in self.commands and args[0] not in ctx.help_option_names
+        ):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
 
 
 def validate_non_negative(
@@ -16,28 +52,33 @@ def validate_non_negative(
     return value
 
 
+def validate_positive_int(
+    ctx: click.Context, param: click.Parameter, value: int
+) -> int:
+    if value < 1:
+        raise click.BadParameter("Must be a positive integer")
+    return value
+
+
 def parse_number_range(
     ctx: click.Context | None, param: click.Parameter | None, value: str
-) -> list[int]:
+) -> NumberRanges:
     try:
-        result = []
-        parts = value.split(",")
-        for part in parts:
-            if "-" in part:
-                start, end = map(int, part.split("-"))
-                result.extend(range(start, end + 1))
-            else:
-                result.append(int(part))
-
-        if not result:
-            raise ValueError
-
-        return result
+        return NumberRanges.parse(value)
     except ValueError:
         raise click.BadParameter("Invalid integer range or list format.")
 
 
-@click.command()
+@click.group(cls=DefaultCommandGroup, default_command="generate")
+def main():
+    """
+    Generate datamatrix labels. Without the name of a command, the options are those
+    of `generate`, e.g. `pinned_datamatrix -s NHMD -n 1-100 -o labels.pdf`. Run a
+    command with --help for its options.
+    """
+
+
+@main.command()
 @click.option(
     "--style",
     "-s",
@@ -63,7 +104,14 @@ def parse_number_range(
     "-o",
     type=click.Path(exists=False, file_okay=True, dir_okay=False),
     required=True,
-    help="The output path of the PDF file",
+    help="The output path of the PDF file, or of the label images as a .zip of PNG "
+    "images or a multi-page .tif",
+)
+@click.option(
+    "--dpi",
+    default=600,
+    help="The resolution of the label images (default: 600)",
+    callback=validate_positive_int,
 )
 @click.option(
     "--label-padding",
@@ -72,35 +120,442 @@ def parse_number_range(
     help="The padding around the label in mm (default: 0.25)",
     callback=validate_non_negative,
 )
-def main(style, bottom_text, numbers, output, label_padding):
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    help="The number of processes generating labels (default: 1)",
+    callback=validate_positive_int,
+)
+@click.option(
+    "--parallel-pages",
+    is_flag=True,
+    help="Also draw the pages in the worker processes and merge them (requires pypdf)",
+)
+@click.option(
+    "--pipeline",
+    is_flag=True,
+    help="Also build the label drawings in the worker processes, or in a background "
+    "thread without workers, while the pages are drawn",
+)
+@click.option(
+    "--pages-per-file",
+    type=click.IntRange(min=1),
+    metavar="INTEGER",
+    default=None,
+    help="Write the PDF as numbered files of this many pages, e.g. labels_0001.pdf, "
+    "recording the progress in labels.state.json",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted run of --pages-per-file after its last complete file",
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    help="Cache the encoded datamatrices for later runs in the user cache directory",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, dir_okay=True),
+    default=None,
+    help="Cache the encoded datamatrices for later runs in this directory",
+)
+@click.option(
+    "--stats",
+    "show_stats",
+    is_flag=True,
+    help="Print the time spent in each stage of the pipeline",
+)
+@click.option(
+    "--stats-json",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Save the time spent in each stage of the pipeline as JSON to this path",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Save a cProfile dump of the run to this path, e.g. for snakeviz",
+)
+def generate(
+    style,
+    bottom_text,
+    numbers,
+    output,
+    label_padding,
+    dpi,
+    workers,
+    parallel_pages,
+    pipeline,
+    pages_per_file,
+    resume,
+    use_cache,
+    cache_dir,
+    show_stats,
+    stats_json,
+    profile,
+):
+    """
+    Generate a PDF with datamatrix labels. This is the default command, and runs
+    without its name. See `batch` to run many jobs in one process.
+    """
+    if resume and pages_per_file is None:
+        raise click.UsageError("--resume requires --pages-per-file")
+    collecting = show_stats or stats_json is not None
+    cache = get_cache(use_cache, cache_dir)
+    with (
+        collect() if collecting else nullcontext() as stats,
+        cProfile.Profile() if profile is not None else nullcontext() as profiler,
+        closing(cache) if cache is not None else nullcontext(),
+    ):
+        generate_sheet(
+            style,
+            bottom_text,
+            numbers,
+            output,
+            label_padding,
+            dpi,
+            workers,
+            parallel_pages,
+            cache=cache,
+            pages_per_file=pages_per_file,
+            resume=resume,
+            pipeline=pipeline,
+        )
+
+    if profile is not None:
+        profiler.dump_stats(profile)
+    if show_stats:
+        click.echo(stats.format())
+    if stats_json is not None:
+        with open(stats_json, "w") as f:
+            json.dump(stats.to_dict(), f, indent=2)
+
+
+@main.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    help="The number of processes generating labels, shared by all jobs (default: 1)",
+    callback=validate_positive_int,
+)
+@click.option(
+    "--parallel-pages",
+    is_flag=True,
+    help="Also draw the pages in the worker processes and merge them (requires pypdf)",
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    help="Cache the encoded datamatrices for later runs in the user cache directory",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, dir_okay=True),
+    default=None,
+    help="Cache the encoded datamatrices for later runs in this directory",
+)
+@click.option(
+    "--summary",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Save the summary of the jobs as JSON to this path",
+)
+def batch(manifest, workers, parallel_pages, use_cache, cache_dir, summary):
     """
-    Generate a PDF with datamatrix labels
+    Run the jobs of a manifest in one process. The manifest is a CSV, JSON or YAML
+    file listing jobs with a style, numbers, output and optionally bottom_text,
+    label_padding and dpi. Relative outputs are relative to the manifest. The jobs
+    share the worker processes and the cache, and a failed job does not stop the
+    jobs after it.
     """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .batch import load_manifest
+
+    try:
+        jobs = load_manifest(manifest)
+    except (ImportError, ValueError) as e:
+        raise click.UsageError(str(e)) from e
+    # Check all number ranges before the first job runs
+    job_numbers = []
+    for index, job in enumerate(jobs, start=1):
+        try:
+            job_numbers.append(parse_number_range(None, None, job.numbers))
+        except click.BadParameter as e:
+            raise click.UsageError(f"Job {index}: {e.message}") from e
+
+    cache = get_cache(use_cache, cache_dir)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    results = []
+    with pool as executor, closing(cache) if cache is not None else nullcontext():
+        for index, (job, numbers) in enumerate(zip(jobs, job_numbers, strict=True)):
+            click.echo(f"Job {index + 1}/{len(jobs)}: {job.style} -> {job.output}")
+            start = time.perf_counter()
+            error = None
+            try:
+                generate_sheet(
+                    job.style,
+                    job.bottom_text,
+                    numbers,
+                    job.output,
+                    job.label_padding,
+                    job.dpi,
+                    workers,
+                    parallel_pages,
+                    cache=cache,
+                    executor=executor,
+                )
+            except Exception as e:
+                error = (
+                    e.format_message()
+                    if isinstance(e, click.ClickException)
+                    else str(e) or type(e).__name__
+                )
+                click.echo(f"Job {index + 1} failed: {error}", err=True)
+            results.append(
+                {
+                    "job": index + 1,
+                    "style": job.style,
+                    "numbers": job.numbers,
+                    "labels": len(numbers),
+                    "output": job.output,
+                    "seconds": time.perf_counter() - start,
+                    "error": error,
+                }
+            )
+
+    click.echo(format_summary(results))
+    if summary is not None:
+        with open(summary, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = sum(result["error"] is not None for result in results)
+    if failed:
+        raise click.ClickException(f"{failed} of {len(results)} jobs failed")
+
+
+@main.command()
+@click.option(
+    "--port",
+    default=8000,
+    help="The port to listen on, on localhost (default: 8000)",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on this Unix socket instead of a port",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    help="The number of processes rendering requests, i.e. requests rendered at a "
+    "time (default: 1)",
+    callback=validate_positive_int,
+)
+@click.option(
+    "--queue-size",
+    type=click.IntRange(min=0),
+    metavar="INTEGER",
+    default=16,
+    help="The number of requests waiting for a process before requests are refused "
+    "(default: 16)",
+)
+@click.option(
+    "--max-labels",
+    default=10_000,
+    help="The largest number of labels of a request (default: 10000)",
+    callback=validate_positive_int,
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    help="Cache the encoded datamatrices for later runs in the user cache directory",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, dir_okay=True),
+    default=None,
+    help="Cache the encoded datamatrices for later runs in this directory",
+)
+def serve(port, socket_path, workers, queue_size, max_labels, use_cache, cache_dir):
+    """
+    Render labels for local clients, from processes that stay warm between requests.
+    POST a JSON object with a style, numbers and optionally bottom_text and
+    label_padding to /render, and the PDF of the double sided sheet is returned.
+    GET /status returns the number of pending and completed requests.
+    """
+    from .server import Renderer, make_server
+
+    renderer = Renderer(
+        workers=workers,
+        queue_size=queue_size,
+        max_labels=max_labels,
+        cache=get_cache(use_cache, cache_dir),
+    )
+    try:
+        server = make_server(renderer, port=port, socket_path=socket_path)
+    except OSError as e:
+        renderer.close()
+        raise click.ClickException(f"Cannot listen: {e}") from e
+    address = socket_path or f"http://127.0.0.1:{server.server_port}"
+    click.echo(f"Rendering labels with {workers} workers on {address}")
+    # Stop the workers as well when the server is stopped by a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        renderer.close()
+
+
+def format_summary(results: list[dict]) -> str:
+    lines = [f"{'job':>4}  {'style':<6}{'labels':>10}{'seconds':>10}  result"]
+    for result in results:
+        outcome = result["output"] if result["error"] is None else "failed"
+        lines.append(
+            f"{result['job']:>4}  {result['style']:<6}{result['labels']:>10,}"
+            f"{result['seconds']:>10.2f}  {outcome}"
+        )
+    return "\n".join(lines)
+
+
+def get_cache(use_cache: bool, cache_dir: str | None) -> LabelCache | None:
+    from .cache import DEFAULT_CACHE_DIR, LabelCache
+
+    if use_cache or cache_dir is not None:
+        return LabelCache(cache_dir or DEFAULT_CACHE_DIR)
+    return None
+
+
+def generate_sheet(
+    style: str,
+    bottom_text: str,
+    numbers: Sequence[int],
+    output: str,
+    label_padding: float,
+    dpi: int,
+    workers: int,
+    parallel_pages: bool,
+    cache: LabelCache | None = None,
+    executor: Executor | None = None,
+    pages_per_file: int | None = None,
+    resume: bool = False,
+    pipeline: bool = False,
+):
+    from .chunked import write_chunked
+    from .parallel import render_sheet
+    from .raster import RASTER_FORMATS, save_label_images
+    from .styles import NHMA, NHMD
+
+    raster = os.path.splitext(output)[1].lower() in RASTER_FORMATS
+    if raster and parallel_pages:
+        raise click.UsageError("--parallel-pages only applies to PDF output")
+    if raster and pages_per_file is not None:
+        raise click.UsageError("--pages-per-file only applies to PDF output")
+    if raster and pipeline:
+        raise click.UsageError("--pipeline only applies to PDF output")
+    if parallel_pages and pipeline:
+        raise click.UsageError(
+            "--pipeline does not apply to --parallel-pages, which draws the pages in "
+            "the workers"
+        )
 
     label_func = (
-        Partial(NHMD) if style == "NHMD" else Partial(NHMA, bottom_text=bottom_text)
+        Partial(NHMD, cache=cache)
+        if style == "NHMD"
+        else Partial(NHMA, bottom_text=bottom_text, cache=cache)
     )
-    labels = generate_labels(label_func, numbers)
+    if pages_per_file is not None:
+        try:
+            paths = write_chunked(
+                label_func,
+                numbers,
+                output,
+                pages_per_file,
+                resume=resume,
+                settings={"style": style, "bottom_text": bottom_text},
+                workers=workers,
+                parallel_pages=parallel_pages,
+                pipeline=pipeline,
+                double_sided=True,
+                label_padding=label_padding,
+            )
+        except (ImportError, ValueError) as e:
+            raise click.UsageError(str(e)) from e
+        click.echo(f"Wrote {len(paths)} files from {paths[0]} to {paths[-1]}")
+        return
+    if parallel_pages:
+        try:
+            render_sheet(
+                label_func,
+                numbers,
+                output,
+                workers=workers,
+                executor=executor,
+                double_sided=True,
+                label_padding=label_padding,
+            )
+        except ImportError as e:
+            raise click.UsageError(str(e)) from e
+        return
+    labels = generate_labels(
+        label_func, numbers, workers=workers, executor=executor, pipeline=pipeline
+    )
+    if raster:
+        count = save_label_images(labels, output, dpi=dpi)
+        click.echo(f"Wrote {count} label images to {output}")
+        return
     generate_pdf(labels, output, double_sided=True, label_padding=label_padding)
 
 
-def generate_labels(label_func: Partial, numbers: list[int]) -> list[Label]:
-    numbers_it = tqdm(iterable=numbers, desc="Generating labels")
-    labels = map(label_func, numbers_it)
-    return list(labels)
+def generate_labels(
+    label_func: Partial,
+    numbers: Sequence[int],
+    workers: int = 1,
+    executor: Executor | None = None,
+    pipeline: bool = False,
+) -> Iterable[Label]:
+    """Lazily generate the labels, so they can be drawn while they are created."""
+    from tqdm import tqdm
+
+    from .parallel import map_labels
+
+    labels = map_labels(
+        label_func, numbers, workers=workers, executor=executor, pipeline=pipeline
+    )
+    return tqdm(iterable=labels, total=len(numbers), desc="Generating labels")
 
 
 def generate_pdf(
-    labels: list[Label], output: str, double_sided: bool, label_padding: float
+    labels: Iterable[Label], output: str, double_sided: bool, label_padding: float
 ):
+    from .sheet_generator import Sheet
+
     sheet = Sheet(
         labels=labels,
         output_path=output,
         double_sided=double_sided,
         label_padding=label_padding,
     )
+    page_count = sheet.page_count()
+    if page_count is not None:
+        click.echo(f"Writing {page_count} pages to {output}")
     sheet.generate()
-    sheet.c.save()
+    with timed("save"):
+        sheet.c.save()
 
 
 if __name__ == "__main__":
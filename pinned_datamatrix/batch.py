@@ -0,0 +1,114 @@
+import csv
+import json
+import os
+from dataclasses import dataclass, fields
+
+STYLES = ["NHMD", "NHMA"]
+# The file formats of manifests, by file extension
+MANIFEST_FORMATS = {".csv": "csv", ".json": "json", ".yaml": "yaml", ".yml": "yaml"}
+
+
+@dataclass
+class BatchJob:
+    """A sheet or set of label images to generate, as listed in a manifest."""
+
+    style: str
+    numbers: str  # a range or list, as given to --numbers
+    output: str
+    bottom_text: str = ""
+    label_padding: float = 0.25
+    dpi: int = 600
+
+    def __post_init__(self):
+        if self.style not in STYLES:
+            raise ValueError(f"style must be one of {STYLES}")
+        if isinstance(self.numbers, int):
+            self.numbers = str(self.numbers)
+        elif isinstance(self.numbers, list):
+            self.numbers = ",".join(str(number) for number in self.numbers)
+        if not isinstance(self.numbers, str) or not self.numbers:
+            raise ValueError("numbers must be a range or list")
+        if not self.output:
+            raise ValueError("output must not be empty")
+        if self.bottom_text is None:
+            self.bottom_text = ""
+        self.label_padding = float(self.label_padding)
+        if self.label_padding < 0:
+            raise ValueError("label_padding must not be negative")
+        self.dpi = int(self.dpi)
+        if self.dpi < 1:
+            raise ValueError("dpi must be positive")
+
+
+def load_manifest(path: str) -> list[BatchJob]:
+    """
+    Load the jobs of a manifest. The format follows the file extension:
+
+    - .csv: a header row with the job fields, and a row per job
+    - .json, .yaml or .yml: a list of jobs, or a mapping with a list of "jobs" and
+      optional "defaults" shared by all jobs. YAML requires PyYAML.
+
+    Relative output paths are relative to the directory of the manifest.
+    Args:
+        path: The path of the manifest.
+    Returns:
+        The jobs, in the order of the manifest.
+    Raises:
+        ValueError: If the manifest or one of its jobs is invalid.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in MANIFEST_FORMATS:
+        raise ValueError(
+            f"Manifest must be one of {', '.join(MANIFEST_FORMATS)}, not {path}"
+        )
+    manifest_format = MANIFEST_FORMATS[extension]
+    with open(path, newline="") as f:
+        if manifest_format == "csv":
+            # Empty cells fall back to the defaults of the fields
+            entries = [
+                {key: value for key, value in row.items() if value not in ("", None)}
+                for row in csv.DictReader(f)
+            ]
+        elif manifest_format == "json":
+            entries = json.load(f)
+        else:
+            entries = _load_yaml(f)
+
+    defaults = {}
+    if isinstance(entries, dict):
+        defaults = entries.get("defaults", {})
+        entries = entries.get("jobs")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"Manifest {path} does not list any jobs")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    field_names = {field.name for field in fields(BatchJob)}
+    jobs = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Job {index + 1} of {path} is not a mapping")
+        entry = {**defaults, **entry}
+        unknown = set(entry) - field_names
+        if unknown:
+            raise ValueError(
+                f"Job {index + 1} of {path} has unknown fields: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        try:
+            job = BatchJob(**entry)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Job {index + 1} of {path} is invalid: {e}") from e
+        job.output = os.path.join(directory, os.path.expanduser(job.output))
+        jobs.append(job)
+    return jobs
+
+
+def _load_yaml(f):
+    try:
+        import yaml
+    except ImportError as e:
+        raise ImportError(
+            "YAML manifests require PyYAML. Install it with "
+            "`pip install pinned_datamatrix[yaml]`."
+        ) from e
+    return yaml.safe_load(f)
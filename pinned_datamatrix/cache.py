@@ -0,0 +1,277 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "pinned_datamatrix",
+)
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # bytes of stored entries
+# Number of buffered writes that are committed together
+FLUSH_INTERVAL = 256
+# Seconds within which the last use of an entry is not recorded again. Eviction only
+# needs to tell old entries from recent ones.
+TOUCH_INTERVAL = 3600
+
+# The bytes of an entry, as an SQL expression of the row {0}
+_ENTRY_SIZE = (
+    "(LENGTH({0}.modules) + LENGTH({0}.polygon_lengths) "
+    "+ LENGTH({0}.polygon_corners))"
+)
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS labels ("
+    "key TEXT PRIMARY KEY, "
+    "rows INTEGER NOT NULL, "
+    "columns INTEGER NOT NULL, "
+    "modules BLOB NOT NULL, "
+    "polygon_lengths BLOB NOT NULL, "
+    "polygon_corners BLOB NOT NULL, "
+    "last_used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used)",
+    # The bytes of all entries, kept up to date by triggers, so every process and run
+    # can check the size after writing without reading every entry
+    "CREATE TABLE IF NOT EXISTS stored_size (bytes INTEGER NOT NULL)",
+    "INSERT INTO stored_size "
+    f"SELECT COALESCE(SUM({_ENTRY_SIZE.format('labels')}), 0) FROM labels "
+    "WHERE NOT EXISTS (SELECT 1 FROM stored_size)",
+    "CREATE TRIGGER IF NOT EXISTS labels_insert AFTER INSERT ON labels BEGIN "
+    f"UPDATE stored_size SET bytes = bytes + {_ENTRY_SIZE.format('NEW')}; END",
+    "CREATE TRIGGER IF NOT EXISTS labels_delete AFTER DELETE ON labels BEGIN "
+    f"UPDATE stored_size SET bytes = bytes - {_ENTRY_SIZE.format('OLD')}; END",
+]
+
+
+class LabelCache:
+    """
+    A persistent cache of encoded datamatrices, shared between runs.
+
+    Entries are keyed by `LabelTemplate.cache_key`, i.e. by the data, the datamatrix
+    parameters and the package version. They store the bit-packed module matrix and
+    the black module polygons, so a cached label is neither encoded nor traced again.
+    Whenever new entries are committed and the entries exceed `max_size` bytes, the
+    least recently used entries are evicted. The cache is kept in a SQLite database, so it can be shared by worker
+    processes, and by threads.
+
+    New entries and the last use of entries are buffered and committed together,
+    every `FLUSH_INTERVAL` writes and when the cache is flushed, closed, pickled or
+    garbage collected. Call `close` when done with the cache.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike = DEFAULT_CACHE_DIR,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        """
+        Args:
+            directory: The directory of the cache. It is created if it does not exist.
+            max_size: The maximum number of bytes of stored entries.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self.path = os.path.join(self.directory, "labels.sqlite3")
+        self._connection: sqlite3.Connection | None = None
+        # Rows of new entries by key, and the last use of entries by key, not yet
+        # committed
+        self._pending_puts: dict[str, tuple] = {}
+        self._pending_touches: dict[str, float] = {}
+        # Guards the buffers and the connection, e.g. when labels are created in a
+        # background thread and the cache is closed in the main thread
+        self._lock = threading.RLock()
+
+    def __getstate__(self) -> dict:
+        # Connections cannot be pickled, each process opens its own. Buffered writes
+        # are committed first, so the other process sees them.
+        self.flush()
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __del__(self):
+        # The interpreter may be shutting down, then the writes are lost
+        with contextlib.suppress(Exception):
+            self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # Used from whichever thread holds the lock
+            connection = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None, check_same_thread=False
+            )
+            # The cache can always be rebuilt, so durability is traded for speed
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            # The rows replaced by INSERT OR REPLACE fire the delete trigger as well
+            connection.execute("PRAGMA recursive_triggers=ON")
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    def get(self, key: str) -> tuple[np.ndarray, list[list[tuple[int, int]]]] | None:
+        """
+        Get a cached datamatrix.
+        Args:
+            key: The cache key of the label.
+        Returns:
+            The module matrix as a boolean array and the black module polygons, or None
+            if the label is not cached.
+        """
+        with self._lock:
+            pending = self._pending_puts.get(key)
+            if pending is not None:
+                row = pending[1:6]
+            else:
+                row = self.connection.execute(
+                    "SELECT rows, columns, modules, polygon_lengths, polygon_corners, "
+                    "last_used FROM labels WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if now - row[5] >= TOUCH_INTERVAL:
+                    self._pending_touches[key] = now
+                    self._flush_if_full()
+        rows, columns, modules, polygon_lengths, polygon_corners = row[:5]
+        bits = np.unpackbits(np.frombuffer(modules, dtype=np.uint8))
+        dm_array = bits[: rows * columns].reshape(rows, columns).astype(bool)
+        lengths = np.frombuffer(polygon_lengths, dtype=np.uint16)
+        corners = list(
+            map(tuple, np.frombuffer(polygon_corners, np.uint8).reshape(-1, 2).tolist())
+        )
+        polygons = []
+        start = 0
+        for length in lengths.tolist():
+            polygons.append(corners[start : start + length])
+            start += length
+        return dm_array, polygons
+
+    def put(
+        self, key: str, dm_array: np.ndarray, polygons: list[list[tuple[int, int]]]
+    ) -> None:
+        """
+        Store a datamatrix.
+        Args:
+            key: The cache key of the label.
+            dm_array: The module matrix as a boolean array.
+            polygons: The black module polygons.
+        """
+        rows, columns = dm_array.shape
+        # Symbols are at most 148 modules wide with the quiet zone, so every corner
+        # coordinate fits in a byte
+        lengths = np.array([len(polygon) for polygon in polygons], dtype=np.uint16)
+        corners = np.array(
+            [
+                coordinate
+                for polygon in polygons
+                for corner in polygon
+                for coordinate in corner
+            ],
+            dtype=np.uint8,
+        )
+        with self._lock:
+            self._pending_puts[key] = (
+                key,
+                rows,
+                columns,
+                np.packbits(dm_array).tobytes(),
+                lengths.tobytes(),
+                corners.tobytes(),
+                time.time(),
+            )
+            self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self._pending_puts) + len(self._pending_touches) >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Commit the buffered new entries and last uses in one transaction, and evict
+        entries if new entries made the cache exceed max_size.
+        """
+        with self._lock:
+            if not self._pending_puts and not self._pending_touches:
+                return
+            connection = self.connection
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._pending_puts.values(),
+                )
+                connection.executemany(
+                    "UPDATE labels SET last_used = ? WHERE key = ?",
+                    (
+                        (last_used, key)
+                        for key, last_used in self._pending_touches.items()
+                    ),
+                )
+            stored_entries = bool(self._pending_puts)
+            self._pending_puts.clear()
+            self._pending_touches.clear()
+            if stored_entries:
+                self._evict_to_max_size()
+
+    def close(self) -> None:
+        """Commit the buffered writes and close the database connection."""
+        with self._lock:
+            self.flush()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def evict(self) -> None:
+        """Evict the least recently used entries until the cache fits in max_size."""
+        with self._lock:
+            self.flush()
+            self._evict_to_max_size()
+
+    def _evict_to_max_size(self) -> None:
+        connection = self.connection
+        (size,) = connection.execute("SELECT bytes FROM stored_size").fetchone()
+        if size <= self.max_size:
+            return
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # Another process may have evicted entries in the meantime
+            (size,) = connection.execute("SELECT bytes FROM stored_size").fetchone()
+            cursor = connection.execute(
+                f"SELECT key, {_ENTRY_SIZE.format('labels')} FROM labels "
+                "ORDER BY last_used"
+            )
+            evicted = []
+            for key, length in cursor:
+                if size <= self.max_size:
+                    break
+                evicted.append((key,))
+                size -= length
+            connection.executemany("DELETE FROM labels WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._pending_puts.clear()
+            self._pending_touches.clear()
+            self.connection.execute("DELETE FROM labels")
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.flush()
+            return self.connection.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
@@ -0,0 +1,190 @@
+import io
+import json
+import os
+from collections.abc import Callable, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+
+from tqdm import tqdm
+
+from . import __version__
+from .label_generator import Label
+from .number_ranges import NumberRanges
+from .parallel import map_labels, render_sheet
+from .sheet_generator import Sheet
+from .stats import timed
+
+
+def chunk_path(output_path: str, index: int) -> str:
+    """
+    Args:
+        output_path: The output path of the whole run, e.g. labels.pdf.
+        index: The index of the file, from 0.
+    Returns:
+        The path of a file of the run, e.g. labels_0001.pdf for index 0.
+    """
+    root, extension = os.path.splitext(output_path)
+    return f"{root}_{index + 1:04d}{extension}"
+
+
+def state_path(output_path: str) -> str:
+    """
+    Args:
+        output_path: The output path of the whole run, e.g. labels.pdf.
+    Returns:
+        The path of the state file of the run, e.g. labels.state.json.
+    """
+    return f"{os.path.splitext(output_path)[0]}.state.json"
+
+
+def write_chunked(
+    label_func: Callable[[int], Label],
+    numbers: Sequence[int],
+    output_path: str,
+    pages_per_file: int,
+    resume: bool = False,
+    settings: dict | None = None,
+    workers: int = 1,
+    parallel_pages: bool = False,
+    pipeline: bool = False,
+    progress: bool = True,
+    **sheet_kwargs,
+) -> list[str]:
+    """
+    Write the labels to a series of PDF files of a fixed number of pages, so a crash
+    only loses the file being written. Each file is written to a temporary path and
+    renamed once it is complete, and the completed files are recorded in a state file
+    next to the output, so an interrupted run can be resumed.
+    Args:
+        label_func: The function creating a label from a number. It must be picklable
+            when workers are used.
+        numbers: The numbers to create labels for. Slicing them must be cheap, e.g. a
+            NumberRanges or a list.
+        output_path: The output path of the run. The files are named after it, see
+            `chunk_path`.
+        pages_per_file: The number of pages per file, not counting back sides.
+        resume: Whether to continue after the files completed by an earlier run with
+            the same numbers and settings. Otherwise the run starts from the first file.
+        settings: Anything else that determines the labels, e.g. the style, which
+            must match for a run to be resumed. Must be JSON serializable.
+        workers: The number of worker processes creating the labels.
+        parallel_pages: Whether to draw the pages in the worker processes as well.
+        pipeline: Whether to build the label drawings ahead of the pages, see
+            `map_labels`.
+        progress: Whether to show progress bars.
+        **sheet_kwargs: Keyword arguments for `Sheet`, e.g. label_padding.
+    Returns:
+        The paths of all files of the run, in order.
+    Raises:
+        ValueError: If the run cannot be resumed, as the state file belongs to a run
+            with other numbers or settings.
+    """
+    if pages_per_file < 1:
+        raise ValueError("pages_per_file must be at least 1")
+    if len(numbers) == 0:
+        raise ValueError("numbers must contain at least one number")
+    # All labels have the size of the first, which sets the number of labels per page
+    first_sheet = Sheet([label_func(numbers[0])], io.BytesIO(), **sheet_kwargs)
+    labels_per_file = first_sheet.layout.labels_per_page * pages_per_file
+    num_files = -(-len(numbers) // labels_per_file)
+    paths = [chunk_path(output_path, index) for index in range(num_files)]
+
+    state = {
+        "version": __version__,
+        "numbers": _format_numbers(numbers),
+        "pages_per_file": pages_per_file,
+        # Round trip through JSON, so tuples compare equal to the stored lists
+        "settings": json.loads(json.dumps(settings or {})),
+        "sheet": json.loads(json.dumps(sheet_kwargs)),
+        "completed": 0,
+    }
+    completed = 0
+    if resume:
+        completed = _resume(state_path(output_path), state, paths)
+    if completed == num_files:
+        return paths
+    state["completed"] = completed
+    _write_state(state_path(output_path), state)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    with pool as executor:
+        for index in tqdm(
+            range(completed, num_files),
+            initial=completed,
+            total=num_files,
+            desc="Writing files",
+            disable=not progress,
+        ):
+            chunk = numbers[index * labels_per_file : (index + 1) * labels_per_file]
+            temporary_path = paths[index] + ".tmp"
+            _write_file(
+                label_func,
+                chunk,
+                temporary_path,
+                workers,
+                parallel_pages,
+                pipeline,
+                executor,
+                sheet_kwargs,
+            )
+            os.replace(temporary_path, paths[index])
+            state["completed"] = index + 1
+            _write_state(state_path(output_path), state)
+    return paths
+
+
+def _write_file(
+    label_func: Callable[[int], Label],
+    numbers: Sequence[int],
+    path: str,
+    workers: int,
+    parallel_pages: bool,
+    pipeline: bool,
+    executor: Executor | None,
+    sheet_kwargs: dict,
+) -> None:
+    if parallel_pages:
+        render_sheet(
+            label_func, numbers, path, workers, executor=executor, **sheet_kwargs
+        )
+        return
+    labels = map_labels(
+        label_func, numbers, workers=workers, executor=executor, pipeline=pipeline
+    )
+    sheet = Sheet(labels, path, **sheet_kwargs)
+    sheet.generate(progress=False)
+    with timed("save"):
+        sheet.c.save()
+
+
+def _format_numbers(numbers: Sequence[int]) -> str:
+    # As ranges, which stay short for long runs of numbers
+    if not isinstance(numbers, NumberRanges):
+        numbers = NumberRanges(range(number, number + 1) for number in numbers)
+    return str(numbers)
+
+
+def _resume(path: str, state: dict, paths: list[str]) -> int:
+    # The number of files completed by the earlier run, which are kept
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        previous = json.load(f)
+    for key, value in state.items():
+        if key != "completed" and previous.get(key) != value:
+            raise ValueError(
+                f"Cannot resume from {path}, it belongs to a run with another {key}"
+            )
+    completed = min(previous["completed"], len(paths))
+    # Files removed since are written again
+    for index in range(completed):
+        if not os.path.exists(paths[index]):
+            return index
+    return completed
+
+
+def _write_state(path: str, state: dict) -> None:
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temporary_path, path)
@@ -1,24 +1,295 @@
-from pylibdmtx.pylibdmtx import encode, ENCODING_SIZE_NAMES
+from pylibdmtx.pylibdmtx import encode, ENCODING_SIZE_NAMES, PyLibDMTXError
+from pylibdmtx.wrapper import (
+    c_ubyte_p,
+    dmtxEncodeCreate,
+    dmtxEncodeDataMatrix,
+    dmtxEncodeDestroy,
+    dmtxEncodeSetProp,
+    dmtxImageGetProp,
+    DmtxProperty,
+    DmtxScheme,
+    DmtxSymbolSize,
+)
+from collections.abc import Sequence
+from contextlib import contextmanager
+import ctypes
+import functools
 import numpy as np
 from PIL.Image import frombytes
 from xml.etree import ElementTree as ET
+from reportlab.graphics.shapes import Group, Path, Rect
+from reportlab.graphics.shapes import _MOVETO, _LINETO, _CLOSEPATH
+from reportlab.lib.colors import black, white
+
+from .stats import timed
+
+QUIET_ZONE_SIZE = 2  # white modules around the symbol, as drawn by pylibdmtx.encode
+BITMAP_MODULE_SIZE = 5  # pixels per module in the pylibdmtx.encode bitmap
+# The number of symbols remembered by `encode_modules`, a few hundred bytes each
+ENCODE_CACHE_SIZE = 16384
+
+# How the black modules are written as a path:
+#   modules: one square per module
+#   runs: one rectangle per horizontal run of modules
+#   outline: one polygon per outline of a connected region of modules
+PATH_MODES = ["modules", "runs", "outline"]
+
+# Outline edges of a black module, clockwise (y-down), as (start, end) corner offsets,
+# together with the (dx, dy) offset of the neighbouring module on the other side.
+_MODULE_EDGES = [
+    ((0, 0), (1, 0), (0, -1)),  # top
+    ((1, 0), (1, 1), (1, 0)),  # right
+    ((1, 1), (0, 1), (0, 1)),  # bottom
+    ((0, 1), (0, 0), (-1, 0)),  # left
+]
+
+
+@contextmanager
+def _encoder():
+    encoder = dmtxEncodeCreate()
+    if not encoder:
+        raise PyLibDMTXError("Could not create encoder")
+    try:
+        yield encoder
+    finally:
+        dmtxEncodeDestroy(ctypes.byref(encoder))
+
+
+@functools.lru_cache(maxsize=ENCODE_CACHE_SIZE)
+def encode_modules(
+    data: str, size: str = "SquareAuto"
+) -> tuple[tuple[int, int], bytes]:
+    """
+    Encode data as a datamatrix, remembering the most recently encoded data, so labels
+    of the same data, e.g. reprints or copies, are encoded once per process. Use
+    `encode_modules.cache_info()` for the hits and misses of the memo, and
+    `encode_modules.cache_clear()` to empty it.
+    Args:
+        data: The data to encode.
+        size: The symbol size, one of pylibdmtx's ENCODING_SIZE_NAMES.
+    Returns:
+        The shape of the module matrix, and the matrix packed with np.packbits. Both
+        are immutable, so they are shared by every DataMatrix of the data.
+    """
+    with timed("encode"):
+        dm_array = _encode(data, size)
+    return dm_array.shape, np.packbits(dm_array).tobytes()
+
+
+def _encode(data: str, size: str, out: np.ndarray | None = None) -> np.ndarray:
+    # libdmtx is asked to draw the symbol with one pixel per module, so the bitmap
+    # already is the module matrix, including the quiet zone. It is written to out if
+    # given, which must have the shape of the symbol.
+    if not isinstance(data, str):
+        # Specify which type was given, and what was expected
+        raise TypeError(f"Expected data to be of type str, got {type(data).__name__}")
+    encoded = data.encode("utf-8")
+    with _encoder() as encoder:
+        dmtxEncodeSetProp(
+            encoder, DmtxProperty.DmtxPropScheme, DmtxScheme.DmtxSchemeAscii
+        )
+        dmtxEncodeSetProp(
+            encoder,
+            DmtxProperty.DmtxPropSizeRequest,
+            getattr(DmtxSymbolSize, f"DmtxSymbol{size}"),
+        )
+        dmtxEncodeSetProp(encoder, DmtxProperty.DmtxPropModuleSize, 1)
+        dmtxEncodeSetProp(encoder, DmtxProperty.DmtxPropMarginSize, QUIET_ZONE_SIZE)
+
+        data_pointer = ctypes.cast(encoded, c_ubyte_p)
+        if dmtxEncodeDataMatrix(encoder, len(encoded), data_pointer) == 0:
+            raise PyLibDMTXError(
+                "Could not encode data, possibly because the image is not "
+                "large enough to contain the data"
+            )
+
+        width, height, bits_per_pixel = (
+            dmtxImageGetProp(encoder[0].image, prop)
+            for prop in (
+                DmtxProperty.DmtxPropWidth,
+                DmtxProperty.DmtxPropHeight,
+                DmtxProperty.DmtxPropBitsPerPixel,
+            )
+        )
+        bytes_per_pixel = bits_per_pixel // 8
+        pixels = ctypes.string_at(
+            encoder[0].image[0].pxl, width * height * bytes_per_pixel
+        )
+
+    img = np.frombuffer(pixels, dtype=np.uint8)
+    img = img.reshape(height, width, bytes_per_pixel)
+    if out is not None and out.shape != (height, width):
+        raise ValueError(
+            f"{data!r} is encoded as a {height}x{width} symbol, "
+            f"not {out.shape[0]}x{out.shape[1]}"
+        )
+    # True where black
+    return np.all(img == 0, axis=-1, out=out)
+
+
+def _check_batch(payloads: Sequence[str], size: str) -> None:
+    if size not in ENCODING_SIZE_NAMES:
+        raise ValueError(f"Invalid size: {size}")
+    if len(payloads) == 0:
+        raise ValueError("payloads must contain at least one payload")
 
 
 class DataMatrix:
-    def __init__(self, data: str, size: str = "SquareAuto"):
+    # A label keeps its datamatrix, so the module matrix is stored as packed bits, an
+    # eighth of the size of a boolean array
+    __slots__ = ("data", "size", "path_mode", "shape", "_packed_modules", "_polygons")
+
+    def __init__(
+        self,
+        data: str,
+        size: str = "SquareAuto",
+        path_mode: str = "outline",
+        dm_array: np.ndarray | None = None,
+        polygons: list[list[tuple[int, int]]] | None = None,
+    ):
+        """
+        Args:
+            data: The data to encode.
+            size: The symbol size, one of pylibdmtx's ENCODING_SIZE_NAMES.
+            path_mode: How the black modules are written as a path, see PATH_MODES.
+            dm_array: The module matrix of the data, e.g. from a LabelCache, to use
+                instead of encoding the data.
+            polygons: The black module polygons of the module matrix in this path
+                mode, e.g. from a LabelCache, to use instead of tracing them.
+        """
         if size not in ENCODING_SIZE_NAMES:
             raise ValueError(f"Invalid size: {size}")
+        if path_mode not in PATH_MODES:
+            raise ValueError(f"path_mode must be one of {PATH_MODES}")
 
         self.data = data
         self.size = size
+        self.path_mode = path_mode
+
+        if dm_array is None:
+            self.shape, self._packed_modules = encode_modules(data, size)
+        else:
+            self.dm_array = dm_array
+        self._polygons = polygons
+
+    @staticmethod
+    def encode_many(payloads: Sequence[str], size: str = "SquareAuto") -> np.ndarray:
+        """
+        Encode many payloads of the same symbol size into one stacked array, e.g. the
+        zero padded numbers of a run of labels. The array is allocated once, and every
+        symbol is written into it.
+        Args:
+            payloads: The data to encode.
+            size: The symbol size, one of pylibdmtx's ENCODING_SIZE_NAMES.
+        Returns:
+            A (N, rows, columns) boolean array of the module matrices, True where
+            black, in the order of the payloads.
+        Raises:
+            ValueError: If there are no payloads, or they are encoded to symbols of
+                different sizes.
+        """
+        _check_batch(payloads, size)
+        with timed("encode", count=len(payloads)):
+            first = _encode(payloads[0], size)
+            modules = np.empty((len(payloads), *first.shape), dtype=bool)
+            modules[0] = first
+            for i in range(1, len(payloads)):
+                _encode(payloads[i], size, out=modules[i])
+        return modules
 
-        self.dm_array = self._get_datamatrix_bit_array()
+    @staticmethod
+    def encode_many_packed(
+        payloads: Sequence[str], size: str = "SquareAuto"
+    ) -> tuple[tuple[int, int], np.ndarray]:
+        """
+        Encode many payloads of the same symbol size into one block of packed module
+        matrices, as they are kept by DataMatrix. Every symbol is encoded into the
+        same buffer and packed into its row of the block.
+        Args:
+            payloads: The data to encode.
+            size: The symbol size, one of pylibdmtx's ENCODING_SIZE_NAMES.
+        Returns:
+            The shape of the module matrices, and a (N, bytes) array of the flattened
+            matrices packed with np.packbits, in the order of the payloads.
+        Raises:
+            ValueError: If there are no payloads, or they are encoded to symbols of
+                different sizes.
+        """
+        _check_batch(payloads, size)
+        with timed("encode", count=len(payloads)):
+            symbol = _encode(payloads[0], size)
+            packed = np.empty((len(payloads), -(-symbol.size // 8)), dtype=np.uint8)
+            packed[0] = np.packbits(symbol)
+            for i in range(1, len(payloads)):
+                _encode(payloads[i], size, out=symbol)
+                packed[i] = np.packbits(symbol)
+        return symbol.shape, packed
+
+    @classmethod
+    def create_many(
+        cls,
+        payloads: Sequence[str],
+        size: str = "SquareAuto",
+        path_mode: str = "outline",
+    ) -> list["DataMatrix"]:
+        """
+        Create the datamatrices of many payloads of the same symbol size, encoding and
+        packing them as one block, see `encode_many_packed`.
+        Args:
+            payloads: The data to encode.
+            size: The symbol size, one of pylibdmtx's ENCODING_SIZE_NAMES.
+            path_mode: How the black modules are written as a path, see PATH_MODES.
+        Returns:
+            The datamatrices, in the order of the payloads.
+        """
+        if path_mode not in PATH_MODES:
+            raise ValueError(f"path_mode must be one of {PATH_MODES}")
+        shape, packed = cls.encode_many_packed(payloads, size)
+        datamatrices = []
+        for data, packed_modules in zip(payloads, packed, strict=True):
+            dm = cls.__new__(cls)
+            dm.data = data
+            dm.size = size
+            dm.path_mode = path_mode
+            dm.shape = shape
+            dm._packed_modules = packed_modules.tobytes()
+            dm._polygons = None
+            datamatrices.append(dm)
+        return datamatrices
+
+    @property
+    def dm_array(self) -> np.ndarray:
+        """
+        The module matrix as a boolean array, True where black, including the quiet
+        zone. It is unpacked on every access, use `shape` for its size.
+        """
+        rows, columns = self.shape
+        modules = np.unpackbits(
+            np.frombuffer(self._packed_modules, dtype=np.uint8), count=rows * columns
+        )
+        return modules.view(bool).reshape(rows, columns)
+
+    @dm_array.setter
+    def dm_array(self, dm_array: np.ndarray) -> None:
+        self.shape: tuple[int, int] = dm_array.shape
+        self._packed_modules = np.packbits(dm_array).tobytes()
+        self._polygons = None
 
     def _get_datamatrix_bit_array(self) -> np.ndarray:
         """
-        Get the datamatrix as a boolean array.
+        Get the datamatrix as a boolean array, without the memo of `encode_modules`.
         Returns:
-            A 2D NumPy array of booleans representing black and white pixels.
+            A 2D NumPy array of booleans representing black and white modules.
+        """
+        return _encode(self.data, self.size)
+
+    def _get_datamatrix_bit_array_from_bitmap(self) -> np.ndarray:
+        """
+        Get the datamatrix as a boolean array from the bitmap rendered by
+        pylibdmtx.encode. This is slower than `_get_datamatrix_bit_array` and only kept
+        as a reference for it.
+        Returns:
+            A 2D NumPy array of booleans representing black and white modules.
         """
         if not isinstance(self.data, str):
             # Specify which type was given, and what was expected
@@ -29,8 +300,8 @@ class DataMatrix:
 
         img = frombytes("RGB", (datamatrix.width, datamatrix.height), datamatrix.pixels)
         img = np.array(img)
-        # Downscale 5x
-        img = img[::5, ::5, :]
+        # Downscale to one pixel per module
+        img = img[::BITMAP_MODULE_SIZE, ::BITMAP_MODULE_SIZE, :]
         # True where black
         img = np.all(img == [0, 0, 0], axis=-1)
 
@@ -41,9 +312,9 @@ class DataMatrix:
 
         root.set("baseProfile", "tiny")
         root.set("version", "1.2")
-        root.set("viewBox", f"0 0 {self.dm_array.shape[0]} {self.dm_array.shape[1]}")
-        root.set("width", f"{self.dm_array.shape[0]}")
-        root.set("height", f"{self.dm_array.shape[1]}")
+        root.set("viewBox", f"0 0 {self.shape[0]} {self.shape[1]}")
+        root.set("width", f"{self.shape[0]}")
+        root.set("height", f"{self.shape[1]}")
         root.set("xmlns", "http://www.w3.org/2000/svg")
 
         root.append(self._get_white_modules())
@@ -51,21 +322,162 @@ class DataMatrix:
 
         return root
 
+    def create_rlg(self) -> Group:
+        """
+        Create the datamatrix as a ReportLab group, with the same geometry as the SVG.
+        Returns:
+            A group with a white background and the black modules, one unit per module.
+        """
+        group = Group()
+        group.add(
+            Rect(
+                x=0,
+                y=0,
+                width=self.shape[0],
+                height=self.shape[1],
+                fillColor=white,
+                strokeColor=None,
+            )
+        )
+        group.add(self._get_black_modules_path())
+        return group
+
     def _get_white_modules(self) -> ET.Element:
         element = ET.Element("rect")
-        element.set("width", f"{self.dm_array.shape[0]}")
-        element.set("height", f"{self.dm_array.shape[1]}")
+        element.set("width", f"{self.shape[0]}")
+        element.set("height", f"{self.shape[1]}")
         element.set("fill", "#fff")  # white
         return element
 
     def _get_black_modules(self) -> ET.Element:
-        black_modules = []
-        for x in range(self.dm_array.shape[1]):
-            for y in range(self.dm_array.shape[0]):
-                if self.dm_array[y, x]:
-                    black_modules.append(f"M{x} {y}h1v1h-1z")
-        d_attribute = "".join(black_modules)
+        subpaths = []
+        for polygon in self._get_black_module_polygons():
+            x, y = polygon[0]
+            subpath = [f"M{x} {y}"]
+            # Every edge is horizontal or vertical, so each corner is a h or v step
+            for x_next, y_next in polygon[1:]:
+                if y_next == y:
+                    subpath.append(f"h{x_next - x}")
+                else:
+                    subpath.append(f"v{y_next - y}")
+                x, y = x_next, y_next
+            subpath.append("z")
+            subpaths.append("".join(subpath))
+        d_attribute = "".join(subpaths)
 
         element = ET.Element("path")
         element.set("d", d_attribute)
         return element
+
+    def _get_black_modules_path(self) -> Path:
+        points = []
+        operators = []
+        for polygon in self._get_black_module_polygons():
+            for x, y in polygon:
+                points.extend((x, y))
+            operators.append(_MOVETO)
+            operators.extend([_LINETO] * (len(polygon) - 1))
+            operators.append(_CLOSEPATH)
+        return Path(
+            points=points, operators=operators, fillColor=black, strokeColor=None
+        )
+
+    def _get_black_module_polygons(self) -> list[list[tuple[int, int]]]:
+        """
+        Get the black modules as closed polygons, according to the path mode. They are
+        computed once, as both the SVG and the drawings of the label need them.
+        Returns:
+            A list of polygons, each a list of (x, y) corners in module units.
+        """
+        if self._polygons is None:
+            if self.path_mode == "modules":
+                self._polygons = self._get_module_squares()
+            elif self.path_mode == "runs":
+                self._polygons = self._get_module_runs()
+            else:  # self.path_mode == "outline"
+                self._polygons = self._get_module_outlines()
+        return self._polygons
+
+    def _get_module_squares(self) -> list[list[tuple[int, int]]]:
+        # Column by column
+        return [
+            [(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1)]
+            for x, y in zip(
+                *(coords.tolist() for coords in np.nonzero(self.dm_array.T)),
+                strict=True,
+            )
+        ]
+
+    def _get_module_runs(self) -> list[list[tuple[int, int]]]:
+        runs = []
+        for y, row in enumerate(self.dm_array):
+            # Pad with white, so every run has a start and an end
+            edges = np.flatnonzero(
+                np.diff(np.concatenate(([0], row, [0])).astype(np.int8))
+            )
+            for start, end in zip(
+                edges[::2].tolist(), edges[1::2].tolist(), strict=True
+            ):
+                runs.append([(start, y), (end, y), (end, y + 1), (start, y + 1)])
+        return runs
+
+    def _get_module_outlines(self) -> list[list[tuple[int, int]]]:
+        dm_array = self.dm_array
+        height, width = dm_array.shape
+        padded = np.pad(dm_array, 1)
+
+        # All edges between a black and a white module, directed clockwise around the
+        # black modules, keyed by their start corner
+        edges: dict[tuple[int, int], list[tuple[int, int]]] = {}
+        for y, x in zip(
+            *(coords.tolist() for coords in np.nonzero(dm_array)), strict=True
+        ):
+            for (x0, y0), (x1, y1), (dx, dy) in _MODULE_EDGES:
+                if not padded[y + dy + 1, x + dx + 1]:
+                    edges.setdefault((x + x0, y + y0), []).append((x + x1, y + y1))
+
+        polygons = []
+        while edges:
+            start = min(edges)
+            polygon = [start]
+            corner = start
+            direction = None
+            while True:
+                ends = edges[corner]
+                if len(ends) > 1 and direction is not None:
+                    # Two regions touching diagonally. Turn right, so the outline keeps
+                    # to one region.
+                    right = (-direction[1], direction[0])
+                    end = next(
+                        (
+                            e
+                            for e in ends
+                            if (e[0] - corner[0], e[1] - corner[1]) == right
+                        ),
+                        ends[0],
+                    )
+                else:
+                    end = ends[0]
+                ends.remove(end)
+                if not ends:
+                    del edges[corner]
+                new_direction = (end[0] - corner[0], end[1] - corner[1])
+                if new_direction == direction:
+                    # Straight on: extend the previous edge instead of adding a corner
+                    polygon[-1] = end
+                else:
+                    polygon.append(end)
+                direction = new_direction
+                corner = end
+                if corner == start:
+                    break
+            # The polygon is closed: drop the repeated start corner, and the start
+            # corner itself if it lies in the middle of a straight edge
+            polygon.pop()
+            if len(polygon) > 1 and (
+                (polygon[-1][0] == polygon[0][0] == polygon[1][0])
+                or (polygon[-1][1] == polygon[0][1] == polygon[1][1])
+            ):
+                polygon.pop(0)
+            polygons.append(polygon)
+        return polygons
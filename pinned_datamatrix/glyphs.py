@@ -0,0 +1,515 @@
+import functools
+import hashlib
+import struct
+
+from reportlab.graphics.shapes import (
+    _CLOSEPATH,
+    _CURVETO,
+    _LINETO,
+    _MOVETO,
+    DirectDraw,
+    Path,
+)
+from reportlab.lib.colors import black
+from reportlab.pdfbase.ttfonts import TTFontFile
+from reportlab.pdfgen.canvas import FILL_NON_ZERO, Canvas
+
+from .label_generator import FONT_PATH
+
+# Flags of the points of a simple glyph, see the TrueType glyf table
+_ON_CURVE = 0x01
+_X_SHORT = 0x02
+_Y_SHORT = 0x04
+_REPEAT = 0x08
+_X_SAME_OR_POSITIVE = 0x10
+_Y_SAME_OR_POSITIVE = 0x20
+# Flags of the components of a composite glyph
+_ARGS_ARE_WORDS = 0x0001
+_ARGS_ARE_XY_VALUES = 0x0002
+_HAVE_SCALE = 0x0008
+_MORE_COMPONENTS = 0x0020
+_HAVE_X_AND_Y_SCALE = 0x0040
+_HAVE_TWO_BY_TWO = 0x0080
+
+# The ReportLab path operators of the commands of `_cubic_segments`
+_COMMAND_OPERATORS = {"M": _MOVETO, "L": _LINETO, "C": _CURVETO, "Z": _CLOSEPATH}
+
+# A contour is a closed list of (x, y, on_curve) points in font units
+Contour = tuple[tuple[float, float, bool], ...]
+
+
+class Glyph:
+    """The outline and metrics of a glyph, in font units with the y axis up."""
+
+    __slots__ = ("glyph_id", "advance", "contours", "bounds")
+
+    def __init__(self, glyph_id: int, advance: float, contours: list[Contour]):
+        self.glyph_id = glyph_id
+        self.advance = advance
+        self.contours = contours
+        points = [(x, y) for contour in contours for x, y, _ in contour]
+        # The bounds of the control points, which contain the curves
+        self.bounds = (
+            (
+                min(x for x, _ in points),
+                min(y for _, y in points),
+                max(x for x, _ in points),
+                max(y for _, y in points),
+            )
+            if points
+            else None
+        )
+
+
+class GlyphOutlines:
+    """
+    The glyph outlines of a TrueType font, read from the font file once per character.
+
+    Text composed from the outlines is laid out like ReportLab lays out a string of the
+    font, so it can be drawn as paths, or as a form per glyph, instead of as text in an
+    embedded font.
+    """
+
+    def __init__(self, font_path: str = FONT_PATH):
+        """
+        Args:
+            font_path: The path of the TrueType font.
+        """
+        self.font_path = font_path
+        self._font = TTFontFile(font_path)
+        self._glyf = self._font.get_table("glyf")
+        self.units_per_em = self._font.unitsPerEm
+        # Forms of the glyphs are named after the font, and are referenced for every
+        # glyph drawn, so the name is short
+        self.name = hashlib.sha1(font_path.encode("utf-8")).hexdigest()[:6]
+        self._glyphs: dict[str, Glyph] = {}
+
+    def glyph(self, char: str) -> Glyph:
+        """
+        Args:
+            char: A character of the font.
+        Returns:
+            The glyph of the character, or of the missing glyph if the font does not
+            have one.
+        """
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            glyph_id = self._font.charToGlyph.get(ord(char), 0)
+            advance = self._font.hmetrics[min(glyph_id, len(self._font.hmetrics) - 1)]
+            glyph = Glyph(glyph_id, advance[0], self._read_contours(glyph_id))
+            self._glyphs[char] = glyph
+        return glyph
+
+    def string_width(self, text: str, font_size: float) -> float:
+        """
+        Args:
+            text: The text.
+            font_size: The font size.
+        Returns:
+            The advance width of the text, as ReportLab's stringWidth.
+        """
+        units = sum(self.glyph(char).advance for char in text)
+        return units * font_size / self.units_per_em
+
+    def layout(
+        self, text: str, x: float, y: float, font_size: float, anchor: str = "start"
+    ) -> list[tuple[Glyph, float]]:
+        """
+        Lay out text on a baseline.
+        Args:
+            text: The text.
+            x: The x position of the anchor.
+            y: The y position of the baseline, only used for the anchor.
+            font_size: The font size.
+            anchor: The text anchor, start, middle or end, as for a ReportLab String.
+        Returns:
+            Each glyph with the x position of its origin.
+        """
+        if anchor == "middle":
+            x -= self.string_width(text, font_size) / 2
+        elif anchor == "end":
+            x -= self.string_width(text, font_size)
+        scale = font_size / self.units_per_em
+        positions = []
+        for char in text:
+            glyph = self.glyph(char)
+            positions.append((glyph, x))
+            x += glyph.advance * scale
+        return positions
+
+    def extents(
+        self, text: str, x: float, y: float, font_size: float, anchor: str = "start"
+    ) -> tuple[float, float, float, float] | None:
+        """
+        Args:
+            text: The text.
+            x: The x position of the anchor.
+            y: The y position of the baseline, with the y axis up.
+            font_size: The font size.
+            anchor: The text anchor, start, middle or end.
+        Returns:
+            The (x0, y0, x1, y1) bounds of the ink of the text, or None if it has no
+            ink, e.g. only spaces.
+        """
+        scale = font_size / self.units_per_em
+        bounds = [
+            (
+                glyph_x + glyph.bounds[0] * scale,
+                y + glyph.bounds[1] * scale,
+                glyph_x + glyph.bounds[2] * scale,
+                y + glyph.bounds[3] * scale,
+            )
+            for glyph, glyph_x in self.layout(text, x, y, font_size, anchor)
+            if glyph.bounds is not None
+        ]
+        if not bounds:
+            return None
+        return (
+            min(b[0] for b in bounds),
+            min(b[1] for b in bounds),
+            max(b[2] for b in bounds),
+            max(b[3] for b in bounds),
+        )
+
+    def text_path(
+        self,
+        text: str,
+        x: float,
+        y: float,
+        font_size: float,
+        anchor: str = "start",
+        **kwargs,
+    ) -> Path:
+        """
+        Args:
+            text: The text.
+            x: The x position of the anchor.
+            y: The y position of the baseline, with the y axis up.
+            font_size: The font size.
+            anchor: The text anchor, start, middle or end.
+            **kwargs: Properties of the path, e.g. fillColor.
+        Returns:
+            The outlines of the text as a single path.
+        """
+        scale = font_size / self.units_per_em
+        points: list[float] = []
+        operators: list[int] = []
+        for glyph, glyph_x in self.layout(text, x, y, font_size, anchor):
+            _add_contours(glyph.contours, scale, glyph_x, y, points, operators)
+        kwargs.setdefault("fillColor", black)
+        kwargs.setdefault("strokeColor", None)
+        # TrueType outlines are filled by the nonzero winding rule
+        kwargs.setdefault("fillMode", FILL_NON_ZERO)
+        return Path(points=points, operators=operators, **kwargs)
+
+    def svg_path(self, text: str, anchor: str = "start") -> str:
+        """
+        Args:
+            text: The text.
+            anchor: The text anchor, start, middle or end.
+        Returns:
+            The path data of the outlines of the text anchored at the origin, in font
+            units with the y axis up.
+        """
+        commands = []
+        for glyph, glyph_x in self.layout(text, 0, 0, self.units_per_em, anchor):
+            for contour in glyph.contours:
+                for command, *coordinates in _segments(contour):
+                    commands.append(
+                        command
+                        + " ".join(
+                            f"{value + glyph_x if i % 2 == 0 else value:g}"
+                            for i, value in enumerate(coordinates)
+                        )
+                    )
+        return "".join(commands)
+
+    def form_name(self, canvas: Canvas, glyph: Glyph) -> str:
+        """
+        Get the form of a glyph in a PDF, defining it on first use. The form is in font
+        units.
+        Args:
+            canvas: The canvas of the PDF.
+            glyph: The glyph.
+        Returns:
+            The name of the form.
+        """
+        name = f"g{self.name}_{glyph.glyph_id}"
+        if not canvas.hasForm(name):
+            x0, y0, x1, y1 = glyph.bounds
+            canvas.beginForm(name, x0 - 1, y0 - 1, x1 + 1, y1 + 1)
+            canvas.setFillColor(black)
+            pdf_path = canvas.beginPath()
+            for contour in glyph.contours:
+                for command, *coordinates in _cubic_segments(contour):
+                    if command == "M":
+                        pdf_path.moveTo(*coordinates)
+                    elif command == "L":
+                        pdf_path.lineTo(*coordinates)
+                    elif command == "C":
+                        pdf_path.curveTo(*coordinates)
+                    else:
+                        pdf_path.close()
+            canvas.drawPath(pdf_path, stroke=0, fill=1, fillMode=FILL_NON_ZERO)
+            canvas.endForm()
+        return name
+
+    def _read_contours(self, glyph_id: int) -> list[Contour]:
+        start = self._font.glyphPos[glyph_id]
+        end = self._font.glyphPos[glyph_id + 1]
+        if end <= start:  # no outline, e.g. a space
+            return []
+        data = self._glyf
+        (num_contours,) = struct.unpack_from(">h", data, start)
+        if num_contours < 0:
+            return self._read_composite(start + 10)
+        offset = start + 10
+        end_points = struct.unpack_from(f">{num_contours}H", data, offset)
+        offset += 2 * num_contours
+        (instruction_length,) = struct.unpack_from(">H", data, offset)
+        offset += 2 + instruction_length
+        num_points = end_points[-1] + 1 if end_points else 0
+
+        flags = []
+        while len(flags) < num_points:
+            flag = data[offset]
+            offset += 1
+            repeat = 0
+            if flag & _REPEAT:
+                repeat = data[offset]
+                offset += 1
+            flags.extend([flag] * (repeat + 1))
+        xs, offset = _read_coordinates(
+            data, offset, flags, _X_SHORT, _X_SAME_OR_POSITIVE
+        )
+        ys, offset = _read_coordinates(
+            data, offset, flags, _Y_SHORT, _Y_SAME_OR_POSITIVE
+        )
+
+        contours = []
+        first = 0
+        for last in end_points:
+            contours.append(
+                tuple(
+                    (xs[i], ys[i], bool(flags[i] & _ON_CURVE))
+                    for i in range(first, last + 1)
+                )
+            )
+            first = last + 1
+        return contours
+
+    def _read_composite(self, offset: int) -> list[Contour]:
+        # A composite glyph places transformed copies of other glyphs
+        data = self._glyf
+        contours = []
+        flags = _MORE_COMPONENTS
+        while flags & _MORE_COMPONENTS:
+            flags, component_id = struct.unpack_from(">HH", data, offset)
+            offset += 4
+            if flags & _ARGS_ARE_WORDS:
+                dx, dy = struct.unpack_from(">hh", data, offset)
+                offset += 4
+            else:
+                dx, dy = struct.unpack_from(">bb", data, offset)
+                offset += 2
+            if not flags & _ARGS_ARE_XY_VALUES:
+                # Components aligned by matching points are not used by the font
+                dx = dy = 0
+            a, b, c, d = 1.0, 0.0, 0.0, 1.0
+            if flags & _HAVE_SCALE:
+                a = d = _f2dot14(data, offset)
+                offset += 2
+            elif flags & _HAVE_X_AND_Y_SCALE:
+                a, d = _f2dot14(data, offset), _f2dot14(data, offset + 2)
+                offset += 4
+            elif flags & _HAVE_TWO_BY_TWO:
+                a, b, c, d = (_f2dot14(data, offset + 2 * i) for i in range(4))
+                offset += 8
+            for contour in self._read_contours(component_id):
+                contours.append(
+                    tuple(
+                        (a * x + c * y + dx, b * x + d * y + dy, on_curve)
+                        for x, y, on_curve in contour
+                    )
+                )
+        return contours
+
+
+@functools.cache
+def get_glyph_outlines(font_path: str = FONT_PATH) -> GlyphOutlines:
+    """
+    Args:
+        font_path: The path of the TrueType font.
+    Returns:
+        The glyph outlines of the font, shared by all labels.
+    """
+    return GlyphOutlines(font_path)
+
+
+class GlyphRun(DirectDraw):
+    """
+    A line of text drawn from glyph outlines, as a drop-in for a ReportLab String. In a
+    PDF, each glyph is a form that is defined once and referenced wherever the glyph is
+    used, so neither the font nor the outlines are repeated. Other renderers draw the
+    outlines as a path.
+    """
+
+    def __init__(
+        self,
+        outlines: GlyphOutlines,
+        x: float,
+        y: float,
+        text: str,
+        font_size: float,
+        anchor: str = "start",
+    ):
+        self.outlines = outlines
+        self.x = x
+        self.y = y
+        self.text = text
+        self.font_size = font_size
+        self.anchor = anchor
+
+    def getBounds(self) -> tuple[float, float, float, float]:
+        bounds = self.outlines.extents(
+            self.text, self.x, self.y, self.font_size, self.anchor
+        )
+        return bounds if bounds is not None else (self.x, self.y, self.x, self.y)
+
+    def copy(self) -> "GlyphRun":
+        return GlyphRun(
+            self.outlines, self.x, self.y, self.text, self.font_size, self.anchor
+        )
+
+    def drawDirectly(self, renderer) -> None:
+        canvas = getattr(renderer, "_canvas", None)
+        if not isinstance(canvas, Canvas):
+            renderer.drawNode(self.to_path())
+            return
+        positions = self.outlines.layout(
+            self.text, self.x, self.y, self.font_size, self.anchor
+        )
+        if not positions:
+            return
+        names = [
+            self.outlines.form_name(canvas, glyph) if glyph.bounds is not None else None
+            for glyph, _ in positions
+        ]
+        # Draw in font units from the first glyph, and step to each glyph by its
+        # advance, which keeps the content stream short
+        canvas.saveState()
+        scale = self.font_size / self.outlines.units_per_em
+        canvas.transform(scale, 0, 0, scale, positions[0][1], self.y)
+        step = 0
+        for (glyph, _), name in zip(positions, names, strict=True):
+            if name is not None:
+                if step:
+                    canvas.translate(step, 0)
+                    step = 0
+                canvas.doForm(name)
+            step += glyph.advance
+        canvas.restoreState()
+
+    def to_path(self) -> Path:
+        """
+        Returns:
+            The outlines of the text as a path.
+        """
+        return self.outlines.text_path(
+            self.text, self.x, self.y, self.font_size, self.anchor
+        )
+
+
+def _read_coordinates(
+    data: bytes, offset: int, flags: list[int], short: int, same_or_positive: int
+) -> tuple[list[int], int]:
+    # The coordinates are deltas from the previous point
+    coordinates = []
+    value = 0
+    for flag in flags:
+        if flag & short:
+            delta = data[offset]
+            offset += 1
+            value += delta if flag & same_or_positive else -delta
+        elif not flag & same_or_positive:
+            (delta,) = struct.unpack_from(">h", data, offset)
+            offset += 2
+            value += delta
+        coordinates.append(value)
+    return coordinates, offset
+
+
+def _f2dot14(data: bytes, offset: int) -> float:
+    (value,) = struct.unpack_from(">h", data, offset)
+    return value / (1 << 14)
+
+
+def _segments(contour: Contour):
+    # The contour as M, L, Q and Z commands. Between two off-curve points of a
+    # quadratic spline lies an implied on-curve point at their midpoint.
+    if not contour:
+        return
+    points = list(contour)
+    start = next((i for i, (_, _, on_curve) in enumerate(points) if on_curve), None)
+    if start is None:
+        # Only off-curve points: start at the midpoint of the first two
+        (x0, y0, _), (x1, y1, _) = points[0], points[1 % len(points)]
+        points.insert(0, ((x0 + x1) / 2, (y0 + y1) / 2, True))
+        start = 0
+    points = points[start:] + points[:start]
+    x, y, _ = points[0]
+    yield ("M", x, y)
+    control = None
+    for px, py, on_curve in points[1:] + [points[0]]:
+        if on_curve:
+            if control is None:
+                yield ("L", px, py)
+            else:
+                yield ("Q", *control, px, py)
+                control = None
+        elif control is None:
+            control = (px, py)
+        else:
+            mx, my = (control[0] + px) / 2, (control[1] + py) / 2
+            yield ("Q", *control, mx, my)
+            control = (px, py)
+    yield ("Z",)
+
+
+def _cubic_segments(contour: Contour):
+    # The contour as M, L, C and Z commands, with the quadratic curves raised to cubic
+    x, y = 0.0, 0.0
+    for command, *coordinates in _segments(contour):
+        if command == "Q":
+            cx, cy, ex, ey = coordinates
+            yield (
+                "C",
+                x + 2 / 3 * (cx - x),
+                y + 2 / 3 * (cy - y),
+                ex + 2 / 3 * (cx - ex),
+                ey + 2 / 3 * (cy - ey),
+                ex,
+                ey,
+            )
+            x, y = ex, ey
+        else:
+            if command != "Z":
+                x, y = coordinates
+            yield (command, *coordinates)
+
+
+def _add_contours(
+    contours: list[Contour],
+    scale: float,
+    dx: float,
+    dy: float,
+    points: list[float],
+    operators: list[int],
+) -> None:
+    # Append the contours, scaled and then moved by (dx, dy), to the points and
+    # operators of a ReportLab path
+    for contour in contours:
+        for command, *coordinates in _cubic_segments(contour):
+            for i, value in enumerate(coordinates):
+                points.append(value * scale + (dx if i % 2 == 0 else dy))
+            operators.append(_COMMAND_OPERATORS[command])
@@ -1,25 +1,58 @@
 import xml.etree.ElementTree as ET
-from svglib.svglib import svg2rlg
-from svglib.fonts import register_font
-import io
+import functools
+import importlib.resources
 import numpy as np
-import pkg_resources
-from .datamatrix_generator import DataMatrix
+from reportlab.graphics.shapes import (
+    Circle,
+    Drawing,
+    Group,
+    String,
+    getPointsBounds,
+    mmult,
+    rotate,
+    transformPoint,
+    translate,
+)
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.colors import black
+from reportlab.lib.units import mm
+import hashlib
+from collections.abc import Sequence
+from . import __version__
+from .cache import LabelCache
+from .datamatrix_generator import DataMatrix, PATH_MODES
+from .stats import timed
 from .utils import are_overlapping
 
-
-FONT_PATH = "resources/fonts/Inconsolata/Inconsolata-ExtraBold.ttf"
-FONT_PATH = pkg_resources.resource_filename("pinned_datamatrix", FONT_PATH)
+FONT_PATH = str(
+    importlib.resources.files("pinned_datamatrix").joinpath(
+        "resources/fonts/Inconsolata/Inconsolata-ExtraBold.ttf"
+    )
+)
+# The name svglib registers the font under, see `register_label_font`
+FONT_NAME = "Inconsolata-800"
 SVG_NAMESPACE = "http://www.w3.org/2000/svg"
 PT_TO_MM = 0.352778  # 1pt = 0.352778mm
 
-# register font
-register_font(
-    font_name="Inconsolata",
-    font_path=FONT_PATH,
-    style="normal",
-    weight="800",
-)
+
+@functools.cache
+def register_label_font() -> None:
+    """
+    Register the label font with svglib and ReportLab. Parsing the font file takes a
+    while, so it is registered when the first label template is created rather than on
+    import.
+    """
+    from svglib.fonts import register_font
+
+    font_name, registered = register_font(
+        font_name="Inconsolata",
+        font_path=FONT_PATH,
+        style="normal",
+        weight="800",
+    )
+    if not registered or font_name != FONT_NAME:
+        raise RuntimeError(f"Could not register the label font {FONT_PATH}")
+
 
 ORITENTATION_ROTATION_MAP = {
     "top": 0,
@@ -47,13 +80,19 @@ ALIGNMENT_OPTIONS = [
 ]
 
 
-class Label:
+class LabelTemplate:
+    """
+    The fixed layout of a label.
+
+    Validates the label geometry and computes the position of the datamatrix, the pin dot
+    and the text once. Labels that only differ in their data and text lines are then
+    created with `create_label`, which only builds the parts that change between labels.
+    """
+
     def __init__(
         self,
-        data: str,
         width: float,
         height: float,
-        text_lines: list[str],
         font_size: float,
         text_oritentation: str = "top",  # top, right, bottom, left
         text_align="right",  # left, center, right
@@ -64,9 +103,11 @@ class Label:
             1.3,
         ),  # mm (top, right, bottom, left)
         text_line_spacing: float = 0.5,  # mm
+        text_outlines: bool = False,  # draw the text as glyph outlines, not in the font
         datamatrix_length: float = 5,  # 5x5 mm
         datamatrix_alignment: str = "top_right",
         datamatrix_offset: tuple[float, float] = (0, 0),  # (x, y) in mm
+        datamatrix_path_mode: str = "outline",  # modules, runs, outline
         dot_radius: float = 0.25,  # 0.25 mm
         dot_offset: tuple[float, float] = (0.7, 0),  # 0.7 mm from left side
         dot_alignment: str | None = "center_left",
@@ -76,10 +117,6 @@ class Label:
             raise ValueError("width and height must be positive")
         if font_size <= 0:
             raise ValueError("font_size must be positive")
-        if len(text_lines) == 0:
-            raise ValueError("text_lines must contain at least one line")
-        if not all(isinstance(line, str) for line in text_lines):
-            raise TypeError("text_lines must contain only strings")
         if text_oritentation not in ORITENTATION_ROTATION_MAP.keys():
             raise ValueError(
                 "text_orientation must be either top, right, bottom, or left"
@@ -92,72 +129,307 @@ class Label:
             raise ValueError(f"datamatrix_alignment must be one of {ALIGNMENT_OPTIONS}")
         if datamatrix_length <= 0:
             raise ValueError("datamatrix_length must be positive")
+        if datamatrix_path_mode not in PATH_MODES:
+            raise ValueError(f"datamatrix_path_mode must be one of {PATH_MODES}")
+        register_label_font()
 
-        self.data = data
         self.width = width
         self.height = height
 
-        self.text_lines = text_lines
         self.font_size = font_size
         self.text_orientation = text_oritentation
         self.text_align = text_align
         self.text_area_margins = text_area_margins
         self.text_line_spacing = text_line_spacing
+        self.text_outlines = text_outlines
 
         self.datamatrix_length = datamatrix_length
         self.datamatrix_offset = datamatrix_offset
         self.datamatrix_alignment = datamatrix_alignment
+        self.datamatrix_path_mode = datamatrix_path_mode
 
         self.dot_radius = dot_radius
         self.dot_offset = dot_offset
         self.dot_alignment = dot_alignment
 
-        self.svg: ET.Element = self._setup_svg()
-        self.datamatrix = self._add_datamatrix()
-        if self.dot_alignment is not None:
-            self.dot = self._add_dot()
-        self.text = self._add_text()
+        self.check_overlap = check_overlap
 
-        if check_overlap:
-            self._check_overlap()
+        self.datamatrix_position = self._get_datamatrix_position()
+        self.dot_position = (
+            self._get_dot_position() if self.dot_alignment is not None else None
+        )
+        (
+            self.text_anchor,
+            self.text_x,
+            self.text_translation,
+            self.text_rotation,
+        ) = self._get_text_layout()
+        self.text_transform = self._get_text_transform()
+        self.text_group_transform = self._get_text_group_transform()
+
+        # Every parameter of the template and the package version, identifying it
+        self._cache_key_prefix = repr(
+            (
+                __version__,
+                width,
+                height,
+                font_size,
+                text_oritentation,
+                text_align,
+                text_area_margins,
+                text_line_spacing,
+                text_outlines,
+                datamatrix_length,
+                datamatrix_alignment,
+                datamatrix_offset,
+                datamatrix_path_mode,
+                dot_radius,
+                dot_offset,
+                dot_alignment,
+                check_overlap,
+            )
+        )
 
-    def svg_to_string(self) -> str:
-        return ET.tostring(self.svg, encoding="unicode")
+        self._text_y_positions: dict[int, list[float]] = {}
+        # The text is set in a monospaced font, so the bounds of every object on the
+        # label only depend on the number of characters in each text line, and on the
+        # number of modules of the datamatrix.
+        self._checked_shapes: set[tuple[int, tuple[int, ...]]] = set()
+
+    def __setstate__(self, state: dict) -> None:
+        # Templates sent from worker processes skip __init__, but their labels are
+        # still drawn with the label font
+        register_label_font()
+        self.__dict__.update(state)
+
+    def create_label(
+        self, data: str, text_lines: list[str], cache: LabelCache | None = None
+    ) -> "Label":
+        """
+        Create a label with this layout.
+        Args:
+            data: The data to encode in the datamatrix.
+            text_lines: The text lines to print on the label.
+            cache: A cache of datamatrix module matrices, to skip encoding the data of
+                labels that were created before.
+        Returns:
+            The label.
+        """
+        label = Label.__new__(Label)
+        label._init_from_template(self, data, text_lines, cache=cache)
+        return label
+
+    def create_labels(
+        self,
+        entries: Sequence[tuple[str, list[str]]],
+        cache: LabelCache | None = None,
+    ) -> list["Label"]:
+        """
+        Create many labels with this layout. The datamatrices of the data that is not
+        cached are encoded as one block, see `DataMatrix.create_many`, and labels of
+        the same data share their datamatrix.
+        Args:
+            entries: The data to encode in the datamatrix and the text lines of each
+                label.
+            cache: A cache of datamatrix module matrices, to skip encoding the data of
+                labels that were created before.
+        Returns:
+            The labels, in the order of the entries.
+        """
+        datamatrices: dict[str, DataMatrix] = {}
+        if cache is not None:
+            for data, _ in entries:
+                if data in datamatrices:
+                    continue
+                cached = cache.get(self.cache_key(data))
+                if cached is not None:
+                    dm_array, polygons = cached
+                    datamatrices[data] = DataMatrix(
+                        data,
+                        path_mode=self.datamatrix_path_mode,
+                        dm_array=dm_array,
+                        polygons=polygons,
+                    )
+        missing = list(
+            dict.fromkeys(data for data, _ in entries if data not in datamatrices)
+        )
+        if missing:
+            try:
+                created = DataMatrix.create_many(
+                    missing, path_mode=self.datamatrix_path_mode
+                )
+            except ValueError:
+                # The data is encoded to symbols of different sizes
+                created = [
+                    DataMatrix(data, path_mode=self.datamatrix_path_mode)
+                    for data in missing
+                ]
+            for dm in created:
+                datamatrices[dm.data] = dm
+                if cache is not None:
+                    cache.put(
+                        self.cache_key(dm.data),
+                        dm.dm_array,
+                        dm._get_black_module_polygons(),
+                    )
+        labels = []
+        for data, text_lines in entries:
+            label = Label.__new__(Label)
+            label._init_from_template(self, data, text_lines, dm=datamatrices[data])
+            labels.append(label)
+        return labels
+
+    def cache_key(self, data: str) -> str:
+        """
+        Get the key of the datamatrix of a label in a LabelCache. The cached module
+        matrix and polygons only depend on the data, the symbol size and the path
+        mode, so labels of other templates or with other text share the entry.
+        Args:
+            data: The data to encode in the datamatrix.
+        Returns:
+            A hash of the data, the datamatrix parameters and the package version.
+        """
+        key = repr((__version__, "SquareAuto", self.datamatrix_path_mode, data))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def text_y_positions(self, num_lines: int) -> list[float]:
+        """
+        Get the y positions of the text lines, relative to the top of the text area.
+        Args:
+            num_lines: The number of text lines.
+        Returns:
+            The y position of each text line.
+        """
+        if num_lines not in self._text_y_positions:
+            font_size = self.font_size * PT_TO_MM
+            total_height = (font_size + self.text_line_spacing) * (num_lines - 1)
+            y_positions = np.linspace(
+                -total_height / 2,
+                total_height / 2,
+                num_lines,
+            )
+            # svglib doesn't support dominant-baseline, so we have to manually adjust the y positions
+            y_positions += font_size * 0.3
+            self._text_y_positions[num_lines] = list(y_positions)
+        return self._text_y_positions[num_lines]
+
+    def object_bounds(
+        self, text_lines: list[str], datamatrix_modules: int
+    ) -> list[tuple[str, tuple[float, float, float, float]]]:
+        """
+        Compute the bounds of the objects on a label from the layout and the font
+        metrics, without drawing the label. The bounds equal those of the objects in
+        `Label.to_drawing`.
+        Args:
+            text_lines: The text lines of the label.
+            datamatrix_modules: The number of modules along a side of the datamatrix,
+                including the quiet zone.
+        Returns:
+            The id and (x0, y0, x1, y1) bounds in mm of the datamatrix, the pin dot
+            (if any) and the text.
+        """
+        x, y = self.datamatrix_position
+        scale = self.datamatrix_length / float(datamatrix_modules)
+        datamatrix_transform = (scale, 0, 0, scale, x, y)
+        objects = [
+            (
+                "datamatrix",
+                _transform_bounds(
+                    datamatrix_transform, (0, 0, datamatrix_modules, datamatrix_modules)
+                ),
+            )
+        ]
 
-    def svg_to_file(self, path: str) -> None:
-        ET.ElementTree(self.svg).write(path)
+        if self.dot_position is not None:
+            x, y = self.dot_position
+            r = self.dot_radius
+            objects.append(("pin_dot", (x - r, y - r, x + r, y + r)))
 
-    def _setup_svg(self) -> ET.Element:
-        ET.register_namespace("", SVG_NAMESPACE)
-        svg = ET.Element(
-            "svg",
-            {
-                "baseProfile": "tiny",
-                "version": "1.2",
-                "viewBox": f"0 0 {self.width} {self.height}",
-                "width": f"{self.width}mm",
-                "height": f"{self.height}mm",
-                "style": "background-color: white",
-                "{http://www.w3.org/XML/1998/namespace}space": "preserve",
-            },
+        # The bounds of each line as ReportLab gives them for a String: from 0.2 times
+        # the font size below the baseline to the font size above it. The lines are
+        # flipped upright, which swaps the two around the baseline.
+        font_size = self.font_size * PT_TO_MM
+        top = self.text_area_margins[0]
+        y_positions = self.text_y_positions(len(text_lines))
+        line_bounds = []
+        for line, y_position in zip(text_lines, y_positions, strict=True):
+            width = stringWidth(line, FONT_NAME, font_size)
+            x0 = self.text_x
+            if self.text_anchor == "middle":
+                x0 -= 0.5 * width
+            elif self.text_anchor == "end":
+                x0 -= width
+            baseline = -(top + y_position)
+            line_bounds.append(
+                _transform_bounds(
+                    (1, 0, 0, -1, 0, 0),
+                    (x0, baseline - 0.2 * font_size, x0 + width, baseline + font_size),
+                )
+            )
+        text_bounds = (
+            min(bounds[0] for bounds in line_bounds),
+            min(bounds[1] for bounds in line_bounds),
+            max(bounds[2] for bounds in line_bounds),
+            max(bounds[3] for bounds in line_bounds),
         )
-        return svg
+        objects.append(
+            ("text", _transform_bounds(self.text_group_transform, text_bounds))
+        )
+        return objects
+
+    def check_bounds(self, text_lines: list[str], datamatrix_modules: int) -> None:
+        """
+        Check that the objects on a label are within the label and do not overlap,
+        and that the text is within the text area.
+        Args:
+            text_lines: The text lines of the label.
+            datamatrix_modules: The number of modules along a side of the datamatrix,
+                including the quiet zone.
+        Raises:
+            Warning: If the objects are outside of the label or overlap.
+        """
+        objects = self.object_bounds(text_lines, datamatrix_modules)
+        for i, (id1, bounds1) in enumerate(objects):
+            # check that it is within the label
+            if (
+                bounds1[0] < 0
+                or bounds1[1] < 0
+                or bounds1[2] > self.width
+                or bounds1[3] > self.height
+            ):
+                msg = f"Object {id1} is outside of the label."
+                raise Warning(msg)
+            for id2, bounds2 in objects[i + 1 :]:
+                if are_overlapping(bounds1, bounds2):
+                    dx = min(bounds1[2], bounds2[2]) - max(bounds1[0], bounds2[0])
+                    dy = min(bounds1[3], bounds2[3]) - max(bounds1[1], bounds2[1])
+                    msg = f"Objects {id1} and {id2} are overlapping by {min(dx, dy)}mm."
+                    raise Warning(msg)
+            if id1 == "text":
+                # check that bounds are within the text area
+                if (
+                    bounds1[0] < self.text_area_margins[3]
+                    or bounds1[1] < self.text_area_margins[0]
+                    or bounds1[2] > self.width - self.text_area_margins[1]
+                    or bounds1[3] > self.height - self.text_area_margins[2]
+                ):
+                    msg = f"Text object {id1} is outside of the text area."
+                    raise Warning(msg)
 
-    def _add_datamatrix(self) -> ET.Element:
+    def _check_label_overlap(self, label: "Label") -> None:
+        shape = (
+            label.dm.shape[0],
+            tuple(len(line) for line in label.text_lines),
+        )
+        if shape in self._checked_shapes:
+            return
+        label._check_overlap()
+        self._checked_shapes.add(shape)
+
+    def _get_datamatrix_position(self) -> tuple[float, float]:
         if self.datamatrix_length > min(self.width, self.height):
             raise ValueError(f"datamatrix_length cannot be larger than width or height")
 
-        datamatrix = DataMatrix(self.data, size="SquareAuto")
-        datamatrix = datamatrix.create_svg()
-
-        datamatrix.tag = "g"
-        datamatrix.attrib = {
-            "id": "datamatrix",
-            "width": f"{datamatrix.attrib['width']}",
-            "height": f"{datamatrix.attrib['height']}",
-            "viewBox": datamatrix.attrib["viewBox"],
-        }
-
         if self.datamatrix_alignment in ["top_left", "center_left", "bottom_left"]:
             x = 0
         elif self.datamatrix_alignment in [
@@ -189,15 +461,9 @@ class Label:
 
         x += self.datamatrix_offset[0]
         y += self.datamatrix_offset[1]
+        return x, y
 
-        scale = self.datamatrix_length / float(datamatrix.attrib["width"])
-        datamatrix.attrib["transform"] = f"translate({x}, {y}) scale({scale})"
-        #        x_pos = self.width - float(datamatrix.attrib["width"]) * scale
-        #        datamatrix.attrib["transform"] = f"translate({x_pos}, 0) scale({scale})"
-        self.svg.append(datamatrix)
-        return datamatrix
-
-    def _add_dot(self) -> ET.Element:
+    def _get_dot_position(self) -> tuple[float, float]:
         if self.dot_alignment in ["top_left", "center_left", "bottom_left"]:
             x = 0
         elif self.dot_alignment in ["top_center", "center", "bottom_center"]:
@@ -222,20 +488,11 @@ class Label:
             raise ValueError(f"dot is outside of label width")
         if y < 0 or y > self.height:
             raise ValueError(f"dot is outside of label height")
+        return x, y
 
-        dot = ET.Element(
-            "circle",
-            {
-                "id": "pin_dot",
-                "cx": str(x),
-                "cy": str(y),
-                "r": str(self.dot_radius),
-            },
-        )
-        self.svg.append(dot)
-        return dot
-
-    def _add_text(self) -> ET.Element:
+    def _get_text_layout(
+        self,
+    ) -> tuple[str, float, tuple[float, float], tuple[float, float, float] | None]:
         angle = ORITENTATION_ROTATION_MAP.get(self.text_orientation, 0)
 
         text_anchor = TEXT_ALIGN_MAP.get(self.text_align, "end")
@@ -251,12 +508,11 @@ class Label:
         else:
             raise ValueError(f"text_align must be one of {TEXT_ALIGN_MAP.keys()}")
 
-        rotation = ""
-        translation = ""
+        rotation = None
         rot_y = top
         if self.text_orientation == "top":
             dy = (self.height - top - bottom) / 2
-            translation = f"translate(0 {dy})"
+            translation = (0, dy)
         elif self.text_orientation == "right":
             dx = 0
             dy = 0
@@ -270,8 +526,8 @@ class Label:
                 dx = -(self.width - left - right) / 2
                 dy = self.height - top - bottom
                 rot_x = self.width - right
-            rotation = f"rotate ({angle} {rot_x} {rot_y})"
-            translation = f"translate({dx} {dy})"
+            rotation = (angle, rot_x, rot_y)
+            translation = (dx, dy)
         elif self.text_orientation == "bottom":
             dx = 0
             dy = 0
@@ -286,8 +542,8 @@ class Label:
                 rot_x = self.width - right
                 dx = -(self.width - left - right)
                 dy = (self.height - top - bottom) / 2
-            rotation = f"rotate ({angle} {rot_x} {rot_y})"
-            translation = f"translate({dx} {dy})"
+            rotation = (angle, rot_x, rot_y)
+            translation = (dx, dy)
         else:  # self.text_orientation == "left":
             dx = 0
             dy = 0
@@ -299,33 +555,306 @@ class Label:
             else:  # text_anchor == "end":
                 dx = -(self.width - left - right) / 2
 
-            rotation = f"rotate ({angle} {x} {rot_y})"
-            translation = f"translate({dx} {dy})"
+            rotation = (angle, x, rot_y)
+            translation = (dx, dy)
+
+        return text_anchor, x, translation, rotation
+
+    def _get_text_group_transform(self) -> tuple[float, ...]:
+        # The text transform as a ReportLab transform matrix
+        transform = mmult((1, 0, 0, 1, 0, 0), translate(*self.text_translation))
+        if self.text_rotation is not None:
+            angle, rot_x, rot_y = self.text_rotation
+            transform = mmult(transform, translate(rot_x, rot_y))
+            transform = mmult(transform, rotate(angle))
+            transform = mmult(transform, translate(-rot_x, -rot_y))
+        return transform
+
+    def _get_text_transform(self) -> str:
+        translation = "translate({} {})".format(*self.text_translation)
+        rotation = ""
+        if self.text_rotation is not None:
+            rotation = "rotate ({} {} {})".format(*self.text_rotation)
+        return f"{translation} {rotation}"
+
+
+class _TemplateAttribute:
+    """A label attribute that is the same for all labels of a template."""
 
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, label: "Label | None", owner: type | None = None):
+        if label is None:
+            return self
+        return getattr(label.template, self.name)
+
+
+class Label:
+    # Runs can keep hundreds of thousands of labels, so a label only stores what
+    # differs between labels. The layout is read from the template, and the SVG is
+    # built when it is asked for.
+    __slots__ = ("template", "data", "text_lines", "dm", "_drawing_parts")
+
+    width = _TemplateAttribute()
+    height = _TemplateAttribute()
+    font_size = _TemplateAttribute()
+    text_orientation = _TemplateAttribute()
+    text_align = _TemplateAttribute()
+    text_area_margins = _TemplateAttribute()
+    text_line_spacing = _TemplateAttribute()
+    text_outlines = _TemplateAttribute()
+    datamatrix_length = _TemplateAttribute()
+    datamatrix_offset = _TemplateAttribute()
+    datamatrix_alignment = _TemplateAttribute()
+    datamatrix_path_mode = _TemplateAttribute()
+    dot_radius = _TemplateAttribute()
+    dot_offset = _TemplateAttribute()
+    dot_alignment = _TemplateAttribute()
+
+    def __init__(
+        self,
+        data: str,
+        width: float,
+        height: float,
+        text_lines: list[str],
+        font_size: float,
+        text_oritentation: str = "top",  # top, right, bottom, left
+        text_align="right",  # left, center, right
+        text_area_margins: tuple[float, float, float, float] = (
+            0,
+            5,
+            0,
+            1.3,
+        ),  # mm (top, right, bottom, left)
+        text_line_spacing: float = 0.5,  # mm
+        text_outlines: bool = False,  # draw the text as glyph outlines, not in the font
+        datamatrix_length: float = 5,  # 5x5 mm
+        datamatrix_alignment: str = "top_right",
+        datamatrix_offset: tuple[float, float] = (0, 0),  # (x, y) in mm
+        datamatrix_path_mode: str = "outline",  # modules, runs, outline
+        dot_radius: float = 0.25,  # 0.25 mm
+        dot_offset: tuple[float, float] = (0.7, 0),  # 0.7 mm from left side
+        dot_alignment: str | None = "center_left",
+        check_overlap: bool = True,
+    ):
+        template = LabelTemplate(
+            width=width,
+            height=height,
+            font_size=font_size,
+            text_oritentation=text_oritentation,
+            text_align=text_align,
+            text_area_margins=text_area_margins,
+            text_line_spacing=text_line_spacing,
+            text_outlines=text_outlines,
+            datamatrix_length=datamatrix_length,
+            datamatrix_alignment=datamatrix_alignment,
+            datamatrix_offset=datamatrix_offset,
+            datamatrix_path_mode=datamatrix_path_mode,
+            dot_radius=dot_radius,
+            dot_offset=dot_offset,
+            dot_alignment=dot_alignment,
+            check_overlap=check_overlap,
+        )
+        self._init_from_template(template, data, text_lines)
+
+    def _init_from_template(
+        self,
+        template: LabelTemplate,
+        data: str,
+        text_lines: list[str],
+        cache: LabelCache | None = None,
+        dm: DataMatrix | None = None,
+    ) -> None:
+        # dm is the datamatrix of the data, created beforehand for many labels
+        if len(text_lines) == 0:
+            raise ValueError("text_lines must contain at least one line")
+        if not all(isinstance(line, str) for line in text_lines):
+            raise TypeError("text_lines must contain only strings")
+
+        self.template = template
+        self.data = data
+        self.text_lines = text_lines
+        self._drawing_parts = None
+
+        if dm is not None:
+            self.dm = dm
+        else:
+            self._init_datamatrix(cache)
+
+        if template.check_overlap:
+            with timed("overlap"):
+                template._check_label_overlap(self)
+
+    def _init_datamatrix(self, cache: LabelCache | None) -> None:
+        cached = None
+        if cache is not None:
+            cache_key = self.template.cache_key(self.data)
+            cached = cache.get(cache_key)
+        dm_array, polygons = cached if cached is not None else (None, None)
+        self.dm = DataMatrix(
+            self.data,
+            size="SquareAuto",
+            path_mode=self.datamatrix_path_mode,
+            dm_array=dm_array,
+            polygons=polygons,
+        )
+        if cache is not None and cached is None:
+            cache.put(cache_key, self.dm.dm_array, self.dm._get_black_module_polygons())
+
+    @property
+    def svg(self) -> ET.Element:
+        """
+        The label as an SVG element. It is built anew on every access, so keep it
+        while it is used.
+        """
+        with timed("svg"):
+            svg = self._setup_svg()
+            svg.append(self._add_datamatrix())
+            if self.dot_alignment is not None:
+                svg.append(self._add_dot())
+            svg.append(self._add_text())
+        return svg
+
+    def svg_to_string(self) -> str:
+        return ET.tostring(self.svg, encoding="unicode")
+
+    def svg_to_file(self, path: str) -> None:
+        ET.ElementTree(self.svg).write(path)
+
+    def to_drawing(self) -> Drawing:
+        """
+        Draw the label as a ReportLab drawing directly from its geometry, without
+        serializing and parsing the SVG.
+        Returns:
+            The drawing, with the same size and content as the SVG converted by svglib.
+        """
+        drawing = Drawing(self.width * mm, self.height * mm)
+        # Use the coordinate system of the SVG: mm units with the origin in the top left
+        label = Group(transform=(mm, 0, 0, -mm, 0, self.height * mm))
+        label.add(self._get_datamatrix_group())
+        if self.dot_alignment is not None:
+            label.add(self._get_dot_shape())
+        label.add(self._get_text_group())
+        drawing.add(label)
+        return drawing
+
+    def drawing_parts(self) -> list[tuple[tuple | None, Group]]:
+        """
+        Split the drawing of the label into its datamatrix, dot and text lines, so
+        artwork shared between labels can be drawn once and reused.
+        Returns:
+            A list of (key, part) tuples, where each part is a group in the coordinate
+            system of the drawing. Parts with equal keys are drawn identically. The key
+            of the datamatrix is None, as it is unique to the label. The parts of a
+            label prepared with `prepare_drawing` are the same list on every call.
+        """
+        if self._drawing_parts is not None:
+            return self._drawing_parts
+        with timed("drawing"):
+            return self._build_drawing_parts()
+
+    def prepare_drawing(self) -> None:
+        """
+        Build the drawing parts now and keep them, so `drawing_parts` returns them
+        without building them again, e.g. to build them in a worker process while
+        other labels are drawn. A prepared label is several times larger, so only
+        prepare labels that are drawn soon.
+        """
+        self._drawing_parts = self.drawing_parts()
+
+    def _build_drawing_parts(self) -> list[tuple[tuple | None, Group]]:
+        label_transform = (mm, 0, 0, -mm, 0, self.height * mm)
+        parts = [(None, Group(self._get_datamatrix_group(), transform=label_transform))]
+        if self.dot_alignment is not None:
+            key = ("pin_dot", self.height, self.template.dot_position, self.dot_radius)
+            parts.append((key, Group(self._get_dot_shape(), transform=label_transform)))
+        y_positions = self.template.text_y_positions(len(self.text_lines))
+        for i, line in enumerate(self.text_lines):
+            key = (
+                "text_line",
+                self.height,
+                self.template.text_anchor,
+                self.template.text_x,
+                self.template.text_translation,
+                self.template.text_rotation,
+                self.text_area_margins[0] + y_positions[i],
+                self.font_size,
+                self.text_outlines,
+                line,
+            )
+            text_group = self._get_text_group(lines=[(i, line)])
+            parts.append((key, Group(text_group, transform=label_transform)))
+        return parts
+
+    def _setup_svg(self) -> ET.Element:
+        ET.register_namespace("", SVG_NAMESPACE)
+        svg = ET.Element(
+            "svg",
+            {
+                "baseProfile": "tiny",
+                "version": "1.2",
+                "viewBox": f"0 0 {self.width} {self.height}",
+                "width": f"{self.width}mm",
+                "height": f"{self.height}mm",
+                "style": "background-color: white",
+                "{http://www.w3.org/XML/1998/namespace}space": "preserve",
+            },
+        )
+        return svg
+
+    def _add_datamatrix(self) -> ET.Element:
+        datamatrix = self.dm.create_svg()
+
+        datamatrix.tag = "g"
+        datamatrix.attrib = {
+            "id": "datamatrix",
+            "width": f"{datamatrix.attrib['width']}",
+            "height": f"{datamatrix.attrib['height']}",
+            "viewBox": datamatrix.attrib["viewBox"],
+        }
+
+        x, y = self.template.datamatrix_position
+        scale = self.datamatrix_length / float(datamatrix.attrib["width"])
+        datamatrix.attrib["transform"] = f"translate({x}, {y}) scale({scale})"
+        return datamatrix
+
+    def _add_dot(self) -> ET.Element:
+        x, y = self.template.dot_position
+        dot = ET.Element(
+            "circle",
+            {
+                "id": "pin_dot",
+                "cx": str(x),
+                "cy": str(y),
+                "r": str(self.dot_radius),
+            },
+        )
+        return dot
+
+    def _add_text(self) -> ET.Element:
         text_group = ET.Element(
             "g",
-            {"id": "text", "transform": f"{translation} {rotation}"},
+            {"id": "text", "transform": self.template.text_transform},
         )
         font_size = self.font_size * PT_TO_MM
-
-        total_height = (font_size + self.text_line_spacing) * (len(self.text_lines) - 1)
-        y_positions = np.linspace(
-            -total_height / 2,
-            total_height / 2,
-            len(self.text_lines),
-        )
-        # svglib doesn't support dominant-baseline, so we have to manually adjust the y positions
-        y_positions += font_size * 0.3
+        top = self.text_area_margins[0]
+        y_positions = self.template.text_y_positions(len(self.text_lines))
 
         for i, line in enumerate(self.text_lines):
+            if self.text_outlines:
+                text_group.append(
+                    self._get_text_outline(i, line, top + y_positions[i], font_size)
+                )
+                continue
             text = ET.Element(
                 "text",
                 {
                     "id": f"text_line_{i}",
-                    "x": str(x),
+                    "x": str(self.template.text_x),
                     "y": str(top + y_positions[i]),
                     "font-family": "Inconsolata",
-                    "text-anchor": text_anchor,
+                    "text-anchor": self.template.text_anchor,
                     # "dominant-baseline": "middle",  # svglib doesn't support this
                     "font-style": "normal",
                     "font-weight": "800",
@@ -334,42 +863,90 @@ class Label:
             )
             text.text = line
             text_group.append(text)
-        self.svg.append(text_group)
+        return text_group
+
+    def _get_text_outline(
+        self, index: int, line: str, y: float, font_size: float
+    ) -> ET.Element:
+        # A text line as the path of its glyph outlines, which are in font units with
+        # the y axis up
+        from .glyphs import get_glyph_outlines
+
+        outlines = get_glyph_outlines()
+        scale = font_size / outlines.units_per_em
+        return ET.Element(
+            "path",
+            {
+                "id": f"text_line_{index}",
+                "d": outlines.svg_path(line, self.template.text_anchor),
+                "transform": (
+                    f"translate({self.template.text_x}, {y}) scale({scale}, {-scale})"
+                ),
+            },
+        )
+
+    def _get_datamatrix_group(self) -> Group:
+        x, y = self.template.datamatrix_position
+        scale = self.datamatrix_length / float(self.dm.shape[0])
+        group = Group(self.dm.create_rlg(), transform=(scale, 0, 0, scale, x, y))
+        group.setProperties({"svgid": "datamatrix"})
+        return group
+
+    def _get_dot_shape(self) -> Circle:
+        x, y = self.template.dot_position
+        dot = Circle(x, y, self.dot_radius, fillColor=black, strokeColor=None)
+        dot.setProperties({"svgid": "pin_dot"})
+        return dot
+
+    def _get_text_group(self, lines: list[tuple[int, str]] | None = None) -> Group:
+        """
+        Args:
+            lines: The (index, text) of the lines to draw. Defaults to all text lines.
+        """
+        if lines is None:
+            lines = list(enumerate(self.text_lines))
+        text_group = Group(transform=self.template.text_group_transform)
+        text_group.setProperties({"svgid": "text"})
+
+        font_size = self.font_size * PT_TO_MM
+        top = self.text_area_margins[0]
+        y_positions = self.template.text_y_positions(len(self.text_lines))
+        for i, line in lines:
+            if self.text_outlines:
+                from .glyphs import GlyphRun, get_glyph_outlines
+
+                text = GlyphRun(
+                    get_glyph_outlines(),
+                    self.template.text_x,
+                    -(top + y_positions[i]),
+                    line,
+                    font_size,
+                    anchor=self.template.text_anchor,
+                )
+            else:
+                text = String(
+                    self.template.text_x,
+                    -(top + y_positions[i]),
+                    line,
+                    fontName=FONT_NAME,
+                    fontSize=font_size,
+                    textAnchor=self.template.text_anchor,
+                    fillColor=black,
+                )
+            # Flip the text back upright in the y-down coordinate system
+            text_line = Group(text, transform=(1, 0, 0, -1, 0, 0))
+            text_line.setProperties({"svgid": f"text_line_{i}"})
+            text_group.add(text_line)
         return text_group
 
     def _check_overlap(self) -> None:
-        drawing = svg2rlg(io.StringIO(ET.tostring(self.svg, encoding="unicode")))
-        if drawing is None:
-            raise Exception("Could not convert SVG to ReportLab drawing.")
+        self.template.check_bounds(self.text_lines, self.dm.shape[0])
 
-        objs = drawing.contents[0].contents
-        for i in range(len(objs)):
-            bounds1: tuple[float, float, float, float] = objs[i].getBounds()
-            # check that it is within the label
-            if (
-                bounds1[0] < 0
-                or bounds1[1] < 0
-                or bounds1[2] > self.width
-                or bounds1[3] > self.height
-            ):
-                msg = f"Object {objs[i]} is outside of the label."
-                raise Warning(msg)
-            for j in range(i + 1, len(objs)):
-                bounds2: tuple[float, float, float, float] = objs[j].getBounds()
-                if are_overlapping(bounds1, bounds2):
-                    dx = min(bounds1[2], bounds2[2]) - max(bounds1[0], bounds2[0])
-                    dy = min(bounds1[3], bounds2[3]) - max(bounds1[1], bounds2[1])
-                    id1 = objs[i].getProperties().get("svgid", None)
-                    id2 = objs[j].getProperties().get("svgid", None)
-                    msg = f"Objects {id1} and {id2} are overlapping by {min(dx, dy)}mm."
-                    raise Warning(msg)
-            if objs[i].getProperties().get("svgid", None) == "text":
-                # check that bounds are within the text area
-                if (
-                    bounds1[0] < self.text_area_margins[3]
-                    or bounds1[1] < self.text_area_margins[0]
-                    or bounds1[2] > self.width - self.text_area_margins[1]
-                    or bounds1[3] > self.height - self.text_area_margins[2]
-                ):
-                    msg = f"Text object {objs[i]} is outside of the text area."
-                    raise Warning(msg)
+
+def _transform_bounds(
+    transform: tuple[float, ...], bounds: tuple[float, float, float, float]
+) -> tuple[float, float, float, float]:
+    # The bounds of the transformed corners, as in Group.getBounds
+    x0, y0, x1, y1 = bounds
+    corners = [(x0, y0), (x0, y1), (x1, y0), (x1, y1)]
+    return tuple(getPointsBounds([transformPoint(transform, c) for c in corners]))
@@ -0,0 +1,93 @@
+import math
+
+
+class SheetLayout:
+    """
+    The grid of label positions on the pages of a sheet. The grid is computed once from
+    the page and label sizes, so the position of any label is known without placing
+    the labels before it. All sizes and positions are in points.
+    """
+
+    def __init__(
+        self,
+        page_size: tuple[float, float],
+        page_margins: tuple[float, float, float, float],
+        label_size: tuple[float, float],
+        label_padding: float,
+    ):
+        """
+        Args:
+            page_size: The width and height of the page
+            page_margins: The top, right, bottom and left margins of the page
+            label_size: The width and height of a label, without padding
+            label_padding: The padding around each label
+        """
+        self.width, self.height = page_size
+        self.margin_top, self.margin_right, self.margin_bottom, self.margin_left = (
+            page_margins
+        )
+        self.label_width, self.label_height = label_size
+        self.label_padding = label_padding
+
+        self.columns = self._get_column_positions()
+        self.rows = self._get_row_positions()
+        if not self.columns:
+            raise ValueError("Page width is smaller than label width")
+        if not self.rows:
+            raise ValueError("Page height is smaller than label height")
+        self.labels_per_page = len(self.columns) * len(self.rows)
+
+    def _get_column_positions(self) -> list[float]:
+        # Positions are accumulated step by step, so they are identical to placing the
+        # labels one after another
+        columns = []
+        x = self.margin_left
+        while x + self.label_width <= self.width - self.margin_right:
+            columns.append(x)
+            x += self.label_width + self.label_padding * 2
+        return columns
+
+    def _get_row_positions(self) -> list[float]:
+        rows = []
+        y = self.height - self.margin_top
+        while y - self.label_height >= self.margin_bottom:
+            rows.append(y)
+            y -= self.label_height + self.label_padding * 2
+        return rows
+
+    def position(self, index: int) -> tuple[int, float, float]:
+        """
+        Get the position of a label on the front side of the pages
+        Args:
+            index: The index of the label
+        Returns:
+            The page number, and the x and y position of the top left corner of the label
+        """
+        if index < 0:
+            raise IndexError("label index must be non-negative")
+        page, cell = divmod(index, self.labels_per_page)
+        row, column = divmod(cell, len(self.columns))
+        return page, self.columns[column], self.rows[row]
+
+    def back_position(self, index: int) -> tuple[int, float, float]:
+        """
+        Get the position of a label on the back side of the pages, behind its front
+        side when the page is flipped along its vertical axis
+        Args:
+            index: The index of the label
+        Returns:
+            The page number, and the x and y position of the bottom left corner of the
+            label. As the label is rotated 180 degrees, this is its top right corner on
+            the page
+        """
+        page, x, y = self.position(index)
+        return page, self.width - x, y
+
+    def num_pages(self, num_labels: int) -> int:
+        """
+        Args:
+            num_labels: The number of labels
+        Returns:
+            The number of pages needed for the labels, not counting back sides
+        """
+        return max(1, math.ceil(num_labels / self.labels_per_page))
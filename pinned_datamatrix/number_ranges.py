@@ -0,0 +1,120 @@
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import accumulate, chain
+
+
+class NumberRanges(Sequence):
+    """
+    An ordered sequence of numbers, stored as ranges. Parsing "1-1000000" keeps a
+    single range instead of a million numbers, while the numbers can still be
+    iterated, counted, indexed and sliced, e.g. to split them between workers or to
+    resume from an offset.
+    """
+
+    def __init__(self, ranges: Iterable[range] = ()):
+        """
+        Args:
+            ranges: The ranges of numbers, in order. They must have a step of 1.
+                Empty ranges are left out and consecutive ranges are joined.
+        """
+        self.ranges: list[range] = []
+        for numbers in ranges:
+            if numbers.step != 1:
+                raise ValueError("ranges must have a step of 1")
+            if not numbers:
+                continue
+            if self.ranges and self.ranges[-1].stop == numbers.start:
+                self.ranges[-1] = range(self.ranges[-1].start, numbers.stop)
+            else:
+                self.ranges.append(numbers)
+        # The index after the last number of each range
+        self._ends = list(accumulate(len(numbers) for numbers in self.ranges))
+
+    @classmethod
+    def parse(cls, spec: str) -> "NumberRanges":
+        """
+        Parse a comma separated list of numbers and inclusive ranges, e.g.
+        "1-5,7,9-11".
+        Args:
+            spec: The numbers and ranges.
+        Returns:
+            The numbers, in the order of the spec.
+        Raises:
+            ValueError: If the spec is not a list of numbers and ranges, or a range
+                ends before it starts.
+        """
+        ranges = []
+        for part in spec.split(","):
+            start, separator, end = part.partition("-")
+            start = int(start)
+            end = int(end) if separator else start
+            if end < start:
+                raise ValueError(f"Range {part.strip()} ends before it starts")
+            ranges.append(range(start, end + 1))
+        return cls(ranges)
+
+    def merged(self) -> "NumberRanges":
+        """
+        Returns:
+            The numbers in ascending order, each number once.
+        """
+        merged: list[range] = []
+        for numbers in sorted(self.ranges, key=lambda numbers: numbers.start):
+            if merged and numbers.start <= merged[-1].stop:
+                last = merged[-1]
+                merged[-1] = range(last.start, max(last.stop, numbers.stop))
+            else:
+                merged.append(numbers)
+        return NumberRanges(merged)
+
+    def __len__(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(self.ranges)
+
+    def __contains__(self, number: object) -> bool:
+        return any(number in numbers for numbers in self.ranges)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return NumberRanges(
+                    range(number, number + 1)
+                    for number in (self[i] for i in range(start, stop, step))
+                )
+            return NumberRanges(self._slice(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("NumberRanges index out of range")
+        i = bisect_right(self._ends, index)
+        offset = self._ends[i - 1] if i > 0 else 0
+        return self.ranges[i][index - offset]
+
+    def _slice(self, start: int, stop: int) -> Iterator[range]:
+        offset = 0
+        for numbers, end in zip(self.ranges, self._ends, strict=True):
+            if end > start and offset < stop:
+                yield numbers[max(start - offset, 0) : min(stop, end) - offset]
+            offset = end
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, NumberRanges):
+            return NotImplemented
+        # Consecutive ranges are joined, so equal numbers have equal ranges
+        return self.ranges == other.ranges
+
+    def __str__(self) -> str:
+        return ",".join(
+            (
+                str(numbers.start)
+                if len(numbers) == 1
+                else f"{numbers.start}-{numbers.stop - 1}"
+            )
+            for numbers in self.ranges
+        )
+
+    def __repr__(self) -> str:
+        return f"NumberRanges({self.ranges!r})"
@@ -0,0 +1,257 @@
+import io
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import nullcontext
+from itertools import chain, islice
+from typing import Any
+
+from tqdm import tqdm
+
+from . import stats
+from .label_generator import Label
+from .number_ranges import NumberRanges
+from .sheet_generator import Sheet
+from .styles import create_labels
+
+# Upper bound on the numbers sent to a worker at a time. Larger chunks have less
+# dispatch overhead, smaller chunks keep all workers busy until the end of a run.
+MAX_CHUNKSIZE = 256
+# Number of chunks per worker that are submitted ahead of the consumer
+PENDING_CHUNKS_PER_WORKER = 2
+
+
+def get_chunksize(num_items: int, workers: int) -> int:
+    """
+    Get the number of items to send to a worker at a time.
+    Args:
+        num_items: The total number of items.
+        workers: The number of worker processes.
+    Returns:
+        The chunk size, giving each worker about four chunks.
+    """
+    return max(1, min(MAX_CHUNKSIZE, num_items // (workers * 4)))
+
+
+def map_labels(
+    label_func: Callable[[int], Label],
+    numbers: Iterable[int],
+    workers: int = 1,
+    chunksize: int | None = None,
+    executor: Executor | None = None,
+    pipeline: bool = False,
+) -> Iterator[Label]:
+    """
+    Create a label for each number, optionally in a pool of worker processes. The
+    labels are created in chunks, see `styles.create_labels`.
+    Args:
+        label_func: The function creating a label from a number. It must be picklable
+            when workers are used, e.g. a module level function or a partial of one.
+        numbers: The numbers to create labels for.
+        workers: The number of worker processes. 1 creates the labels in this process.
+        chunksize: The number of numbers sent to a worker at a time. Defaults to
+            `get_chunksize`.
+        executor: An existing executor to use instead of starting a new process pool.
+        pipeline: Whether to also build the drawing parts of the labels in the
+            workers, see `Label.prepare_drawing`, so a sheet drawing the labels only
+            draws them. With one worker, the labels are created in a background
+            thread, so creating them overlaps with drawing them.
+    Returns:
+        An iterator over the labels, in the same order as the numbers. The labels are
+        created while the iterator is consumed, at most a few chunks ahead of it.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if workers == 1 and executor is None and not pipeline:
+        chunks = _chunks(numbers, chunksize or MAX_CHUNKSIZE)
+        return chain.from_iterable(create_labels(label_func, chunk) for chunk in chunks)
+
+    if chunksize is None:
+        num_numbers = len(numbers) if hasattr(numbers, "__len__") else MAX_CHUNKSIZE
+        chunksize = get_chunksize(num_numbers, workers)
+    if executor is not None:
+        return _map_in_executor(
+            executor, label_func, numbers, workers, chunksize, pipeline
+        )
+    return _map_in_pool(label_func, numbers, workers, chunksize, pipeline)
+
+
+def _map_in_pool(
+    label_func: Callable[[int], Label],
+    numbers: Iterable[int],
+    workers: int,
+    chunksize: int,
+    pipeline: bool = False,
+) -> Iterator[Label]:
+    pool = (
+        ProcessPoolExecutor(max_workers=workers)
+        if workers > 1
+        else ThreadPoolExecutor(max_workers=1)
+    )
+    with pool as executor:
+        yield from _map_in_executor(
+            executor, label_func, numbers, workers, chunksize, pipeline
+        )
+
+
+def _map_in_executor(
+    executor: Executor,
+    label_func: Callable[[int], Label],
+    numbers: Iterable[int],
+    workers: int,
+    chunksize: int,
+    pipeline: bool = False,
+) -> Iterator[Label]:
+    results = _submit_bounded(
+        executor,
+        _create_labels,
+        ((label_func, chunk, pipeline) for chunk in _chunks(numbers, chunksize)),
+        max_pending=workers * PENDING_CHUNKS_PER_WORKER,
+    )
+    for labels in results:
+        yield from labels
+
+
+def _submit_bounded(
+    executor: Executor,
+    func: Callable,
+    args: Iterable[tuple],
+    max_pending: int,
+) -> Iterator[Any]:
+    # Unlike Executor.map, only submit a few tasks ahead of the consumer, so the
+    # results waiting to be consumed stay bounded however many tasks there are.
+    # Worker processes do not share the stats hooks, so they send back their timings.
+    # Threads report to the hooks directly.
+    collect_stats = stats.enabled() and isinstance(executor, ProcessPoolExecutor)
+    pending: deque[Future] = deque()
+    for task_args in args:
+        pending.append(executor.submit(_run_task, collect_stats, func, *task_args))
+        if len(pending) >= max_pending:
+            yield _task_result(pending.popleft())
+    while pending:
+        yield _task_result(pending.popleft())
+
+
+def _run_task(collect_stats: bool, func: Callable, *args) -> tuple[Any, list]:
+    if not collect_stats:
+        return func(*args), []
+    with stats.collect() as task_stats:
+        result = func(*args)
+    return result, task_stats.events()
+
+
+def _task_result(future: Future) -> Any:
+    result, events = future.result()
+    for stage, seconds, count in events:
+        stats.report(stage, seconds, count)
+    return result
+
+
+def _chunks(numbers: Iterable[int], chunksize: int) -> Iterator[Iterable[int]]:
+    if isinstance(numbers, NumberRanges):
+        # Slices of ranges are sent to the workers without expanding them
+        for start in range(0, len(numbers), chunksize):
+            yield numbers[start : start + chunksize]
+        return
+    numbers = iter(numbers)
+    while chunk := list(islice(numbers, chunksize)):
+        yield chunk
+
+
+def _create_labels(
+    label_func: Callable[[int], Label], numbers: Iterable[int], prepare: bool = False
+) -> list[Label]:
+    labels = create_labels(label_func, numbers)
+    if prepare:
+        for label in labels:
+            label.prepare_drawing()
+    return labels
+
+
+def render_sheet(
+    label_func: Callable[[int], Label],
+    numbers: Iterable[int],
+    output_path: str,
+    workers: int,
+    pages_per_task: int = 1,
+    executor: Executor | None = None,
+    **sheet_kwargs,
+) -> None:
+    """
+    Render a sheet of labels with the pages drawn in a pool of worker processes. Each
+    task creates the labels of a range of pages and renders them to a partial PDF, and
+    the partial PDFs are merged in page order, keeping each back side after its front.
+    Merging requires pypdf, available with the "parallel" extra.
+    Args:
+        label_func: The function creating a label from a number. It must be picklable,
+            e.g. a module level function or a partial of one.
+        numbers: The numbers to create labels for.
+        output_path: The path of the merged PDF.
+        workers: The number of worker processes.
+        pages_per_task: The number of pages rendered by a task.
+        executor: An existing executor to use instead of starting a new process pool.
+        **sheet_kwargs: Keyword arguments for `Sheet`, e.g. page_size or double_sided.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError as e:
+        raise ImportError(
+            "Rendering pages in parallel requires pypdf. Install it with "
+            "`pip install pinned_datamatrix[parallel]`."
+        ) from e
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if pages_per_task < 1:
+        raise ValueError("pages_per_task must be at least 1")
+
+    num_labels = len(numbers) if hasattr(numbers, "__len__") else None
+    remaining = iter(numbers)
+    first_number = next(remaining, None)
+    if first_number is None:
+        raise ValueError("numbers must contain at least one number")
+    # All labels have the size of the first, which sets the number of labels per page
+    first_sheet = Sheet([label_func(first_number)], io.BytesIO(), **sheet_kwargs)
+    labels_per_task = first_sheet.layout.labels_per_page * pages_per_task
+    num_tasks = None
+    if num_labels is not None:
+        num_tasks = -(-num_labels // labels_per_task)
+
+    if not isinstance(numbers, NumberRanges):
+        numbers = chain([first_number], remaining)
+    chunks = _chunks(numbers, labels_per_task)
+    tasks = ((label_func, chunk, sheet_kwargs) for chunk in chunks)
+    writer = PdfWriter()
+    pool = (
+        ProcessPoolExecutor(max_workers=workers)
+        if executor is None
+        else nullcontext(executor)
+    )
+    with pool as pool_executor:
+        partial_pdfs = _submit_bounded(
+            pool_executor,
+            _render_pages,
+            tasks,
+            max_pending=workers * PENDING_CHUNKS_PER_WORKER,
+        )
+        for pdf in tqdm(partial_pdfs, total=num_tasks, desc="Rendering pages"):
+            writer.append(PdfReader(io.BytesIO(pdf)))
+    # The partial PDFs each embed the font and the forms, keep a single copy of them
+    writer.compress_identical_objects()
+    with stats.timed("save"):
+        writer.write(output_path)
+
+
+def _render_pages(
+    label_func: Callable[[int], Label], numbers: Iterable[int], sheet_kwargs: dict
+) -> bytes:
+    output = io.BytesIO()
+    sheet = Sheet(create_labels(label_func, numbers), output, **sheet_kwargs)
+    sheet.generate(progress=False)
+    with stats.timed("save"):
+        sheet.c.save()
+    return output.getvalue()
@@ -0,0 +1,304 @@
+import math
+import os
+import re
+import zipfile
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from tqdm import tqdm
+
+from .label_generator import (
+    FONT_NAME,
+    FONT_PATH,
+    PT_TO_MM,
+    Label,
+    LabelTemplate,
+    _transform_bounds,
+)
+from .stats import timed
+
+MM_PER_INCH = 25.4
+# Glyphs are drawn this many times larger than their final size and scaled down, as
+# Pillow only draws fonts at whole pixel sizes
+GLYPH_SUPERSAMPLING = 4
+# The number of np.rot90 quarter turns for each text rotation, given by the first two
+# values of the transform matrix
+_QUARTER_TURNS = {(1, 0): 0, (0, 1): -1, (-1, 0): 2, (0, -1): 1}
+# The file formats of `save_label_images`, by file extension
+RASTER_FORMATS = {".zip": "zip", ".tif": "tiff", ".tiff": "tiff"}
+
+
+class LabelRasterizer:
+    """
+    Rasterize labels of a template to 1-bit images, e.g. for thermal label printers,
+    without drawing them with ReportLab.
+
+    The datamatrix is painted from the module matrix by nearest neighbour scaling, so
+    every module stays sharp at any resolution. The pin dot and the glyphs of the text
+    are rasterized once per template, and composited onto each label.
+    """
+
+    def __init__(self, template: LabelTemplate, dpi: int = 600):
+        """
+        Args:
+            template: The template of the labels.
+            dpi: The resolution of the images.
+        """
+        if dpi <= 0:
+            raise ValueError("dpi must be positive")
+        self.template = template
+        self.dpi = dpi
+        self.scale = dpi / MM_PER_INCH  # pixels per mm
+        self.width = round(template.width * self.scale)
+        self.height = round(template.height * self.scale)
+
+        self._dot = self._rasterize_dot() if template.dot_position is not None else None
+        self._font_size = template.font_size * PT_TO_MM  # mm
+        font_pixels = self._font_size * self.scale
+        supersampled_size = max(1, round(font_pixels * GLYPH_SUPERSAMPLING))
+        self._font = ImageFont.truetype(FONT_PATH, supersampled_size)
+        self._glyph_scale = font_pixels / supersampled_size
+        self._glyphs: dict[str, tuple[np.ndarray, int, int]] = {}
+        self._advances: dict[str, float] = {}
+
+        a, b, _, _, _, _ = (round(value, 9) for value in template.text_group_transform)
+        if (a, b) not in _QUARTER_TURNS:
+            raise ValueError("text can only be rasterized in steps of 90 degrees")
+        self._text_quarter_turns = _QUARTER_TURNS[(a, b)]
+
+    def rasterize(self, label: Label) -> Image.Image:
+        """
+        Args:
+            label: A label created from the template of the rasterizer.
+        Returns:
+            The label as a 1-bit image, with the resolution stored in its dpi info.
+        """
+        with timed("raster"):
+            # Ink coverage of each pixel, from 0 (white) to 255 (black)
+            canvas = np.zeros((self.height, self.width), dtype=np.uint8)
+            self._draw_datamatrix(canvas, label.dm.dm_array)
+            if self._dot is not None:
+                x, y, dot = self._dot
+                _composite(canvas, dot, x, y)
+            self._draw_text(canvas, label.text_lines)
+            image = Image.fromarray(canvas < 128)
+        image.info["dpi"] = (self.dpi, self.dpi)
+        return image
+
+    def _pixel_range(self, start: float, length: float) -> tuple[int, int]:
+        # The pixels whose centers are within [start, start + length) mm
+        return (
+            math.ceil(start * self.scale - 0.5),
+            math.ceil((start + length) * self.scale - 0.5),
+        )
+
+    def _draw_datamatrix(self, canvas: np.ndarray, dm_array: np.ndarray) -> None:
+        x, y = self.template.datamatrix_position
+        length = self.template.datamatrix_length
+        modules = dm_array.shape[0]
+        x0, x1 = self._pixel_range(x, length)
+        y0, y1 = self._pixel_range(y, length)
+        # The module under the center of each pixel
+        columns = ((np.arange(x0, x1) + 0.5) / self.scale - x) * modules / length
+        rows = ((np.arange(y0, y1) + 0.5) / self.scale - y) * modules / length
+        columns = np.clip(columns.astype(np.intp), 0, modules - 1)
+        rows = np.clip(rows.astype(np.intp), 0, modules - 1)
+        # The white quiet zone is painted as well, covering anything beneath it
+        modules_image = np.where(dm_array[np.ix_(rows, columns)], 255, 0)
+        _composite(canvas, modules_image.astype(np.uint8), x0, y0, replace=True)
+
+    def _rasterize_dot(self) -> tuple[int, int, np.ndarray]:
+        cx, cy = self.template.dot_position
+        r = self.template.dot_radius
+        x0, x1 = self._pixel_range(cx - r, 2 * r)
+        y0, y1 = self._pixel_range(cy - r, 2 * r)
+        xs = (np.arange(x0, x1) + 0.5) / self.scale - cx
+        ys = (np.arange(y0, y1) + 0.5) / self.scale - cy
+        inside = xs[np.newaxis, :] ** 2 + ys[:, np.newaxis] ** 2 <= r**2
+        return x0, y0, np.where(inside, 255, 0).astype(np.uint8)
+
+    def _glyph(self, char: str) -> tuple[np.ndarray, int, int]:
+        # The coverage of a glyph, and its offset in pixels from the pen position on
+        # the baseline
+        if char not in self._glyphs:
+            left, top, right, bottom = self._font.getbbox(char, anchor="ls")
+            if right <= left or bottom <= top:  # e.g. a space
+                self._glyphs[char] = (np.zeros((0, 0), dtype=np.uint8), 0, 0)
+                return self._glyphs[char]
+            image = Image.new("L", (right - left, bottom - top))
+            ImageDraw.Draw(image).text(
+                (-left, -top), char, font=self._font, fill=255, anchor="ls"
+            )
+            size = (
+                max(1, round(image.width * self._glyph_scale)),
+                max(1, round(image.height * self._glyph_scale)),
+            )
+            image = image.resize(size, Image.Resampling.BOX)
+            self._glyphs[char] = (
+                np.asarray(image),
+                round(left * self._glyph_scale),
+                round(top * self._glyph_scale),
+            )
+        return self._glyphs[char]
+
+    def _advance(self, char: str) -> float:
+        # The advance of a glyph in mm, as ReportLab lays out the text
+        if char not in self._advances:
+            self._advances[char] = stringWidth(char, FONT_NAME, self._font_size)
+        return self._advances[char]
+
+    def _draw_text(self, canvas: np.ndarray, text_lines: list[str]) -> None:
+        template = self.template
+        top = template.text_area_margins[0]
+        y_positions = template.text_y_positions(len(text_lines))
+
+        # Lay out the lines as in `LabelTemplate.object_bounds`, in the coordinates of
+        # the text before it is rotated into place
+        lines = []
+        for line, y_position in zip(text_lines, y_positions, strict=True):
+            x0 = template.text_x
+            width = sum(self._advance(char) for char in line)
+            if template.text_anchor == "middle":
+                x0 -= 0.5 * width
+            elif template.text_anchor == "end":
+                x0 -= width
+            lines.append((line, x0, top + y_position))
+        # The text block, with room for the glyphs reaching past the line bounds
+        margin = self._font_size
+        left = min(x0 for _, x0, _ in lines) - margin
+        right = (
+            max(x0 + sum(map(self._advance, line)) for line, x0, _ in lines) + margin
+        )
+        upper = min(baseline for _, _, baseline in lines) - 2 * margin
+        lower = max(baseline for _, _, baseline in lines) + margin
+        block = np.zeros(
+            (
+                math.ceil((lower - upper) * self.scale),
+                math.ceil((right - left) * self.scale),
+            ),
+            dtype=np.uint8,
+        )
+        for line, x0, baseline in lines:
+            pen = x0
+            y = round((baseline - upper) * self.scale)
+            for char in line:
+                glyph, dx, dy = self._glyph(char)
+                if glyph.size:
+                    x = round((pen - left) * self.scale)
+                    _composite(block, glyph, x + dx, y + dy)
+                pen += self._advance(char)
+
+        # Quarter turns map the block onto an axis aligned box on the label
+        height, width = block.shape
+        x0, y0, _, _ = _transform_bounds(
+            template.text_group_transform,
+            (left, upper, left + width / self.scale, upper + height / self.scale),
+        )
+        block = np.rot90(block, self._text_quarter_turns)
+        _composite(canvas, block, round(x0 * self.scale), round(y0 * self.scale))
+
+
+def rasterize_labels(labels: Iterable[Label], dpi: int = 600) -> Iterator[Image.Image]:
+    """
+    Rasterize labels, reusing a rasterizer for all labels of the same template.
+    Args:
+        labels: The labels to rasterize.
+        dpi: The resolution of the images.
+    Returns:
+        An iterator over the labels as 1-bit images, in the same order as the labels.
+    """
+    rasterizers: dict[str, LabelRasterizer] = {}
+    for label in labels:
+        yield _get_rasterizer(rasterizers, label, dpi).rasterize(label)
+
+
+def _get_rasterizer(
+    rasterizers: dict[str, LabelRasterizer], label: Label, dpi: int
+) -> LabelRasterizer:
+    # Labels created in worker processes have equal copies of the same template
+    key = label.template._cache_key_prefix
+    if key not in rasterizers:
+        rasterizers[key] = LabelRasterizer(label.template, dpi)
+    return rasterizers[key]
+
+
+def save_label_images(
+    labels: Iterable[Label],
+    output_path: str,
+    dpi: int = 600,
+    progress: bool = True,
+) -> int:
+    """
+    Rasterize labels and write them to a single file, one image per label. The format
+    follows the extension of the output path:
+
+    - .zip: a zip archive of PNG images, named by label index and data
+    - .tif or .tiff: a multi-page TIFF with CCITT Group 4 compression
+
+    Any other path is a directory, in which a PNG image is saved per label.
+    Args:
+        labels: The labels to rasterize.
+        output_path: The path of the archive, TIFF or directory.
+        dpi: The resolution of the images.
+        progress: Whether to show a progress bar.
+    Returns:
+        The number of images written.
+    """
+    if dpi <= 0:
+        raise ValueError("dpi must be positive")
+    total = len(labels) if hasattr(labels, "__len__") else None
+    labels = tqdm(labels, total=total, desc="Rasterizing labels", disable=not progress)
+    rasterizers: dict[str, LabelRasterizer] = {}
+    images = (
+        (label, _get_rasterizer(rasterizers, label, dpi).rasterize(label))
+        for label in labels
+    )
+    count = 0
+    output_format = RASTER_FORMATS.get(
+        os.path.splitext(output_path)[1].lower(), "directory"
+    )
+    if output_format == "tiff":
+        # Pages are appended one at a time, so the images are not all kept in memory
+        with TiffImagePlugin.AppendingTiffWriter(output_path, new=True) as tiff:
+            for _, image in images:
+                image.save(tiff, format="TIFF", compression="group4", dpi=(dpi, dpi))
+                tiff.newFrame()
+                count += 1
+    elif output_format == "zip":
+        # PNG images are compressed already
+        with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            for label, image in images:
+                with zf.open(_image_name(count, label), "w") as f:
+                    image.save(f, format="PNG", dpi=(dpi, dpi))
+                count += 1
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        for label, image in images:
+            path = os.path.join(output_path, _image_name(count, label))
+            image.save(path, format="PNG", dpi=(dpi, dpi))
+            count += 1
+    return count
+
+
+def _image_name(index: int, label: Label) -> str:
+    # Sort by index, and keep the data readable without allowing paths
+    return f"{index:06d}_{re.sub(r'[^A-Za-z0-9._-]', '_', label.data)}.png"
+
+
+def _composite(
+    canvas: np.ndarray, layer: np.ndarray, x: int, y: int, replace: bool = False
+) -> None:
+    # Paint a layer onto the canvas with its top left corner at (x, y), clipped to the
+    # canvas. Overlapping ink is combined, unless the layer replaces what is beneath.
+    height, width = layer.shape
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, canvas.shape[1]), min(y + height, canvas.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return
+    region = layer[y0 - y : y1 - y, x0 - x : x1 - x]
+    if replace:
+        canvas[y0:y1, x0:x1] = region
+    else:
+        np.maximum(canvas[y0:y1, x0:x1], region, out=canvas[y0:y1, x0:x1])
@@ -0,0 +1,441 @@
+import contextlib
+import io
+import json
+import math
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, fields
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .batch import STYLES
+from .cache import LabelCache
+from .number_ranges import NumberRanges
+from .parallel import map_labels
+from .sheet_generator import Sheet
+from .stats import collect, timed
+from .styles import NHMA, NHMD
+
+# The size of the pieces in which a PDF is written to the client
+RESPONSE_CHUNK_SIZE = 64 * 1024
+# The largest request body read, far more than a request object needs
+MAX_BODY_SIZE = 16 * 1024
+
+
+class QueueFull(Exception):
+    """Raised when a renderer cannot take another request."""
+
+
+class WorkerLost(Exception):
+    """Raised when a worker process died while rendering a request."""
+
+
+@dataclass
+class RenderRequest:
+    """A sheet of labels to render, as posted to /render."""
+
+    style: str
+    numbers: str  # a range or list, as given to --numbers
+    bottom_text: str = ""
+    label_padding: float = 0.25
+
+    def __post_init__(self):
+        if self.style not in STYLES:
+            raise ValueError(f"style must be one of {STYLES}")
+        if isinstance(self.numbers, int):
+            self.numbers = str(self.numbers)
+        elif isinstance(self.numbers, list):
+            self.numbers = ",".join(str(number) for number in self.numbers)
+        if not isinstance(self.numbers, str):
+            raise ValueError("numbers must be a range or list")
+        # Raises a ValueError for an invalid range or list
+        self.number_ranges = NumberRanges.parse(self.numbers)
+        if self.bottom_text is None:
+            self.bottom_text = ""
+        self.label_padding = float(self.label_padding)
+        # json.loads accepts NaN and Infinity, which pass the comparison
+        if not math.isfinite(self.label_padding) or self.label_padding < 0:
+            raise ValueError("label_padding must be a finite, non-negative number")
+
+    @classmethod
+    def from_json(cls, body: bytes) -> "RenderRequest":
+        """
+        Args:
+            body: The JSON body of a request, a mapping with the fields of the request.
+        Returns:
+            The request.
+        Raises:
+            ValueError: If the body is not valid JSON, or not a valid request.
+        """
+        try:
+            entry = json.loads(body)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+        if not isinstance(entry, dict):
+            raise ValueError("The request must be a JSON object")
+        unknown = set(entry) - {field.name for field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        try:
+            return cls(**entry)
+        except TypeError as e:
+            raise ValueError(str(e)) from e
+
+
+@dataclass
+class RenderResult:
+    """A rendered sheet, and the time spent on it."""
+
+    pdf: bytes
+    labels: int
+    queued: float  # seconds waiting for a worker
+    seconds: float  # seconds from receiving the request to the finished PDF
+    stats: dict  # the stages of the pipeline, as PipelineStats.to_dict
+
+    def server_timing(self) -> str:
+        """
+        Returns:
+            The timings as the value of a Server-Timing header, in milliseconds, which
+            browser developer tools and most HTTP clients can show.
+        """
+        timings = [("queue", self.queued)]
+        timings += [
+            (stage, stage_stats["seconds"])
+            for stage, stage_stats in self.stats["stages"].items()
+        ]
+        timings.append(("total", self.seconds))
+        return ", ".join(f"{name};dur={seconds * 1e3:.1f}" for name, seconds in timings)
+
+
+def render_pdf(
+    request: RenderRequest, cache: LabelCache | None = None
+) -> tuple[bytes, dict]:
+    """
+    Render the double sided sheet of a request.
+    Args:
+        request: The request.
+        cache: The cache of encoded datamatrices.
+    Returns:
+        The PDF, and the time spent in each stage as PipelineStats.to_dict.
+    """
+    label_func = (
+        partial(NHMD, cache=cache)
+        if request.style == "NHMD"
+        else partial(NHMA, bottom_text=request.bottom_text, cache=cache)
+    )
+    output = io.BytesIO()
+    with collect() as stats:
+        sheet = Sheet(
+            map_labels(label_func, request.number_ranges),
+            output,
+            label_padding=request.label_padding,
+            double_sided=True,
+        )
+        sheet.generate(progress=False)
+        with timed("save"):
+            sheet.c.save()
+    return output.getvalue(), stats.to_dict()
+
+
+def _render_in_worker(
+    request: RenderRequest, cache: LabelCache | None, submitted: float
+) -> tuple[bytes, dict, float]:
+    # The clocks of the processes are the same, as perf_counter is system wide
+    started = time.perf_counter()
+    pdf, stats = render_pdf(request, cache)
+    return pdf, stats, started - submitted
+
+
+def _warm_up() -> None:
+    # Create a label of each style, which loads the font and the encoder, so the first
+    # request does not pay for it
+    NHMD(1)
+    NHMA(1, bottom_text="")
+
+
+class Renderer:
+    """
+    A pool of warm worker processes rendering requests. At most `workers` requests
+    are rendered at a time, and at most `queue_size` more wait for a worker. Requests
+    beyond that are refused, rather than piling up behind a long queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        queue_size: int = 16,
+        max_labels: int = 10_000,
+        cache: LabelCache | None = None,
+    ):
+        """
+        Args:
+            workers: The number of worker processes, i.e. requests rendered at a time.
+            queue_size: The number of requests that may wait for a worker.
+            max_labels: The largest number of labels of a request.
+            cache: The cache of encoded datamatrices, shared by the workers.
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_size < 0:
+            raise ValueError("queue_size must not be negative")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_labels = max_labels
+        self.cache = cache
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.executor = self._start_executor()
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up)
+        # Start every worker now, rather than on the first requests
+        for future in [executor.submit(int) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def _restart_executor(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # The requests in the broken pool all fail, only the first restarts it
+            if self.executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start_executor()
+
+    def render(self, request: RenderRequest) -> RenderResult:
+        """
+        Render a request in a worker process, waiting for a free worker if needed.
+        Args:
+            request: The request.
+        Returns:
+            The PDF and its timings.
+        Raises:
+            ValueError: If the request has more than max_labels labels.
+            QueueFull: If all workers are busy and the queue is full.
+            WorkerLost: If a worker process died, e.g. killed for running out of
+                memory. The workers are restarted, so the request can be retried.
+        """
+        if len(request.number_ranges) > self.max_labels:
+            raise ValueError(
+                f"A request can have at most {self.max_labels:,} labels, "
+                f"not {len(request.number_ranges):,}"
+            )
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(
+                f"All {self.workers} workers are busy and "
+                f"{self.queue_size} requests are queued"
+            )
+        with self._lock:
+            self.pending += 1
+        try:
+            start = time.perf_counter()
+            executor = self.executor
+            try:
+                future = executor.submit(_render_in_worker, request, self.cache, start)
+                pdf, stats, queued = future.result()
+            except BrokenProcessPool as e:
+                self._restart_executor(executor)
+                raise WorkerLost(
+                    "A worker process died while rendering, the workers were restarted"
+                ) from e
+            with self._lock:
+                self.completed += 1
+            return RenderResult(
+                pdf=pdf,
+                labels=len(request.number_ranges),
+                queued=queued,
+                seconds=time.perf_counter() - start,
+                stats=stats,
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def status(self) -> dict:
+        """
+        Returns:
+            The number of workers, of requests being rendered or waiting for a
+            worker, and of requests completed, as a JSON serializable dict.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": self.pending,
+                "completed": self.completed,
+            }
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handle the requests of the render server:
+
+    - POST /render with a JSON object of style, numbers and optionally bottom_text
+      and label_padding, answered with the PDF of the double sided sheet
+    - GET /status, answered with the status of the renderer as JSON
+
+    Errors are answered with a JSON object with an "error" message.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Seconds before a client that stopped sending is disconnected
+    timeout = 60
+    server: "ThreadingHTTPServer | UnixRenderServer"
+
+    def do_GET(self):
+        if self.path != "/status":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        self._send_json(200, self.server.renderer.status())
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        content_length = self.headers.get("Content-Length")
+        if content_length is None:
+            self._send_json(411, {"error": "Content-Length is required"})
+            return
+        try:
+            length = int(content_length)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # The body cannot be skipped, so the connection cannot be reused
+            self._send_json(
+                400,
+                {"error": f"Invalid Content-Length: {content_length}"},
+                {"Connection": "close"},
+            )
+            return
+        if length > MAX_BODY_SIZE:
+            self._send_json(
+                413,
+                {"error": f"The request body must be at most {MAX_BODY_SIZE} bytes"},
+                {"Connection": "close"},
+            )
+            return
+        body = self.rfile.read(length)
+        try:
+            request = RenderRequest.from_json(body)
+            result = self.server.renderer.render(request)
+        except (ValueError, Warning) as e:
+            # A Warning is raised when the labels do not fit, e.g. a long bottom_text
+            self._send_json(400, {"error": str(e)})
+            return
+        except (QueueFull, WorkerLost) as e:
+            self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except Exception as e:
+            self.log_error("Rendering failed: %r", e)
+            self._send_json(500, {"error": str(e) or type(e).__name__})
+            return
+        self.log_message(
+            "Rendered %d %s labels in %.3fs, %.3fs of it queued",
+            result.labels,
+            request.style,
+            result.seconds,
+            result.queued,
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(result.pdf)))
+        self.send_header("Server-Timing", result.server_timing())
+        self.end_headers()
+        pdf = memoryview(result.pdf)
+        for start in range(0, len(pdf), RESPONSE_CHUNK_SIZE):
+            self.wfile.write(pdf[start : start + RESPONSE_CHUNK_SIZE])
+
+    def _send_json(self, status: int, content: dict, headers: dict | None = None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "unix"
+
+
+class UnixRenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """An HTTP server listening on a Unix socket, e.g. for curl --unix-socket."""
+
+    daemon_threads = True
+    # Whether this server created the socket file, and removes it when closed
+    _created_socket = False
+
+    def server_bind(self):
+        # A socket left behind by a server that was killed would block the address
+        if _is_stale_socket(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        self._created_socket = True
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if self._created_socket:
+            self._created_socket = False
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.server_address)
+
+
+def _is_stale_socket(path: str) -> bool:
+    # Only a socket that refuses connections is stale. Anything else at the path, a
+    # file or a socket another server listens on, is left alone, and binding fails
+    # with "Address already in use".
+    try:
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            return False
+    except FileNotFoundError:
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            return True
+        except OSError:
+            return False
+    return False
+
+
+def make_server(
+    renderer: Renderer,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    socket_path: str | None = None,
+) -> "ThreadingHTTPServer | UnixRenderServer":
+    """
+    Create a server answering render requests, see `RenderRequestHandler`.
+    Args:
+        renderer: The renderer of the requests.
+        host: The host to listen on, by default only local clients can connect.
+        port: The port to listen on, 0 picks a free port.
+        socket_path: The path of a Unix socket to listen on instead of a port.
+    Returns:
+        The server, which is started with serve_forever().
+    """
+    if socket_path is not None:
+        server = UnixRenderServer(socket_path, RenderRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.renderer = renderer
+    return server
@@ -2,25 +2,35 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
 from reportlab.lib.pagesizes import A4
 from reportlab.graphics import renderPDF
-from reportlab.graphics.shapes import Drawing, Rect
-from svglib.svglib import svg2rlg
-import io
+from reportlab.graphics.shapes import Drawing, Group, Rect
 from tqdm import tqdm
+from collections.abc import Iterable
+from typing import BinaryIO
+from itertools import chain
 
 from .label_generator import Label
+from .layout import SheetLayout
+from .stats import timed
+
+PADDING_BOX_FORM = "label_padding_box"
+ROW_FORM = "label_row"
 
 
 class Sheet:
     def __init__(
         self,
-        labels: list[Label],
-        output_path: str,
+        labels: Iterable[Label],
+        output_path: str | BinaryIO,
         label_padding: float = 0.5 / 2,  # mm
         page_size: tuple[float, float] = (297, 210),  # A4 landscape
         page_margins: tuple[float, float, float, float] = (15, 15, 15, 15),  # mm
         double_sided: bool = False,
     ):
         self.labels = labels
+        # Labels are only read one at a time in generate(), so any iterable works. The
+        # first label is read ahead, as it sets the size of every label on the sheet.
+        self._labels = iter(labels)
+        self._first_label = next(self._labels, None)
         self.width = page_size[0] * mm
         self.height = page_size[1] * mm
         self.margin_top = page_margins[0] * mm
@@ -34,11 +44,23 @@ class Sheet:
 
         self._validate_inputs()
 
-        # make a drawing of the label padding box
         label_width, label_height = (
-            self.labels[0].width * mm,
-            self.labels[0].height * mm,
+            self._first_label.width * mm,
+            self._first_label.height * mm,
+        )
+        self.layout = SheetLayout(
+            page_size=(self.width, self.height),
+            page_margins=(
+                self.margin_top,
+                self.margin_right,
+                self.margin_bottom,
+                self.margin_left,
+            ),
+            label_size=(label_width, label_height),
+            label_padding=self.label_padding,
         )
+
+        # make a drawing of the label padding box
         padding_box_width = label_width + self.label_padding * 2
         padding_box_height = label_height + self.label_padding * 2
         self.label_padding_box = Drawing(
@@ -64,12 +86,23 @@ class Sheet:
                 strokeColor=None,
             )
         )
-        self.label_padding_box_back = self.label_padding_box.copy()
-        self.label_padding_box_back.rotate(180)
+        # The padding box and the artwork shared between labels are drawn once per
+        # document as form XObjects, and each label only references them
+        self.c.beginForm(PADDING_BOX_FORM, 0, 0, padding_box_width, padding_box_height)
+        renderPDF.draw(self.label_padding_box, self.c, 0, 0)
+        self.c.endForm()
+        self._forms: dict[tuple, str] = {}
+        self._previous_part_keys: set[tuple] = set()
+        # On double sided sheets, each row of labels is drawn to a form, which is
+        # placed on the front page and mirrored onto the back page
+        self._num_rows = 0
+        self._row: tuple[str, float] | None = None
+        self._page_rows: list[tuple[str, float]] = []
 
     def _validate_inputs(self):
-        if not all(isinstance(label, Label) for label in self.labels):
-            raise TypeError("labels must be of type Label")
+        if self._first_label is None:
+            raise ValueError("labels must contain at least one label")
+        self._validate_label(self._first_label)
         if not all(
             isinstance(margin, (int, float))
             for margin in (
@@ -80,85 +113,167 @@ class Sheet:
             )
         ):
             raise TypeError("page_margins must be a tuple of numbers.")
-        if self.width - self.margin_left - self.margin_right < self.labels[0].width:
-            raise ValueError("Page width is smaller than label width")
-        if self.height - self.margin_top - self.margin_bottom < self.labels[0].height:
-            raise ValueError("Page height is smaller than label height")
 
-    def _draw_label(self, drawing: Drawing, x: float, y: float, is_back=False):
+    def _validate_label(self, label: Label):
+        if not isinstance(label, Label):
+            raise TypeError("labels must be of type Label")
+        if (label.width, label.height) != (
+            self._first_label.width,
+            self._first_label.height,
+        ):
+            raise ValueError("All labels must have the same size")
+
+    def _draw_label(self, label: Label, x: float, y: float):
         """
         Draw a label on the page
         Args:
-            drawing: The drawing to draw
-            x: The x position of the label
-            y: The y position of the label
-            is_back: Whether the label is on the back side of the page
+            label: The label to draw
+            x: The x position of the label, as given by the layout
+            y: The y position of the label, as given by the layout
         """
-        if is_back:
-            # Position the label on the back side of the page (rotated 180 degrees)
-            drawing.rotate(180)
-            x_back = self.width - x
-            renderPDF.draw(
-                self.label_padding_box_back,
-                self.c,
-                x_back + self.label_padding,
-                y + self.label_padding,
-            )
-            renderPDF.draw(drawing, self.c, x_back, y)
-        else:
-            # draw padding box first. substract padding from x and y
-            renderPDF.draw(
-                self.label_padding_box,
-                self.c,
-                x - self.label_padding,
-                y - self.label_padding - drawing.height,
-            )
-            renderPDF.draw(drawing, self.c, x, y - drawing.height)
+        parts = label.drawing_parts()
+        with timed("draw"):
+            self._draw_parts(parts, label.width * mm, label.height * mm, x, y)
+
+    def _draw_parts(
+        self,
+        parts: list[tuple[tuple | None, Group]],
+        width: float,
+        height: float,
+        x: float,
+        y: float,
+    ):
+        self.c.saveState()
+        self.c.translate(x, y - height)
+
+        # draw padding box first. substract padding from x and y
+        self.c.saveState()
+        self.c.translate(-self.label_padding, -self.label_padding)
+        self.c.doForm(PADDING_BOX_FORM)
+        self.c.restoreState()
+
+        # Only artwork repeated from the previous label gets a form, so the unique
+        # parts of each label are not wrapped in forms that are never reused
+        inline_parts, form_names, part_keys = [], [], set()
+        for key, part in parts:
+            if key is None:
+                inline_parts.append(part)
+            elif key in self._forms or key in self._previous_part_keys:
+                form_names.append(self._get_form(key, part))
+            else:
+                inline_parts.append(part)
+            part_keys.add(key)
+        self._previous_part_keys = part_keys
+        renderPDF.draw(Drawing(width, height, *inline_parts), self.c, 0, 0)
+        for name in form_names:
+            self.c.doForm(name)
+        self.c.restoreState()
 
-    def _handle_page_overflow(
-        self, drawing: Drawing, x: float, y: float, backs: list
-    ) -> tuple[float, float, list]:
+    def _get_form(self, key: tuple, part: Group) -> str:
         """
-        Handle page overflow by moving to the next page.
+        Get the name of the form XObject of a label part, defining it on first use
         Args:
-            drawing: The drawing to draw
-            x: The x position of the label
-            y: The y position of the label
-            backs: A list of drawings to print on the back side of the page
+            key: The key of the part, as returned by Label.drawing_parts
+            part: The group with the artwork of the part
         Returns:
-            The new x and y position and the list of drawings to print on the back side of the page
+            The name of the form
         """
-        if x + drawing.width > self.width - self.margin_right:
-            x = self.margin_left
-            y -= drawing.height + self.label_padding * 2
-            if y - drawing.height < self.margin_bottom:
-                self.c.showPage()
-                if self.double_sided:
-                    # Print the back side of the page
-                    for drawing_back, x_back, y_back in backs:
-                        self._draw_label(drawing_back, x_back, y_back, is_back=True)
-                    backs = []  # reset backs
-                    self.c.showPage()
-                y = self.height - self.margin_top
-        return x, y, backs
-
-    def generate(self) -> None:
-        """Generate the pdf with labels"""
-        backs = []
-        x = self.margin_left
-        y = self.height - self.margin_top
-        labels = tqdm(self.labels, desc="Drawing labels on pdf pages")
-        for label in labels:
-            # The conversion from svg to rlg is the slowest part of the process
-            drawing = svg2rlg(io.StringIO(label.svg_to_string()))
-            if drawing is None:
-                raise ValueError("Failed to create drawing from SVG data.")
-            x, y, backs = self._handle_page_overflow(drawing, x, y, backs)
-            self._draw_label(drawing, x, y)
-            backs.append((drawing, x, y))
-            x += drawing.width + self.label_padding * 2
-        self.c.showPage()
+        name = self._forms.get(key)
+        if name is None:
+            name = f"label_part_{len(self._forms)}"
+            x0, y0, x1, y1 = part.getBounds()
+            # Pad the bounding box slightly, as glyphs may reach past the font metrics
+            self.c.beginForm(name, x0 - 1, y0 - 1, x1 + 1, y1 + 1)
+            renderPDF.draw(Drawing(x1, y1, part), self.c, 0, 0)
+            self.c.endForm()
+            self._forms[key] = name
+        return name
+
+    def _begin_row(self, y: float) -> None:
+        """
+        Start drawing to the form of the row of labels at y, unless it is the current
+        row
+        Args:
+            y: The y position of the row, as given by the layout
+        """
+        if self._row is not None and self._row[1] == y:
+            return
+        self._end_row()
+        name = f"{ROW_FORM}_{self._num_rows}"
+        self._num_rows += 1
+        self.c.beginForm(name, 0, 0, self.width, self.height)
+        self._row = (name, y)
+
+    def _end_row(self) -> None:
+        """End the form of the current row of labels, and place it on the page"""
+        if self._row is None:
+            return
+        self.c.endForm()
+        self.c.doForm(self._row[0])
+        self._page_rows.append(self._row)
+        self._row = None
+
+    def _draw_back(self) -> None:
+        """
+        Draw the back side of the current page from the forms of its rows. Each row is
+        rotated 180 degrees about its centre line, after mirroring the page along its
+        vertical axis, so every label is behind its front side when the page is
+        flipped. This is where `SheetLayout.back_position` puts the labels.
+        """
+        with timed("draw"):
+            for name, y in self._page_rows:
+                self.c.saveState()
+                self.c.transform(
+                    -1, 0, 0, -1, self.width, 2 * y - self.layout.label_height
+                )
+                self.c.doForm(name)
+                self.c.restoreState()
+        self._page_rows = []
+
+    def _finish_page(self) -> None:
+        """Finish the current page, and print its back side if the sheet is double sided"""
+        self._end_row()
+        self._show_page()
         if self.double_sided:
-            for drawing, x, y in backs:
-                self._draw_label(drawing, x, y, is_back=True)
+            self._draw_back()
+            self._show_page()
+
+    def _show_page(self) -> None:
+        with timed("showPage"):
             self.c.showPage()
+
+    def page_count(self) -> int | None:
+        """
+        Returns:
+            The number of pages of the pdf, including back sides, or None if the number
+            of labels is not known up front
+        """
+        if not hasattr(self.labels, "__len__"):
+            return None
+        num_pages = self.layout.num_pages(len(self.labels))
+        return num_pages * 2 if self.double_sided else num_pages
+
+    def generate(self, progress: bool = True) -> None:
+        """
+        Generate the pdf with labels. The labels are read one at a time, and the back
+        sides of double sided sheets are drawn from the forms of the rows of the front.
+        Args:
+            progress: Whether to show a progress bar
+        """
+        page = 0
+        labels = tqdm(
+            chain([self._first_label], self._labels),
+            total=len(self.labels) if hasattr(self.labels, "__len__") else None,
+            desc="Drawing labels on pdf pages",
+            disable=not progress,
+        )
+        for index, label in enumerate(labels):
+            self._validate_label(label)
+            label_page, x, y = self.layout.position(index)
+            if label_page != page:
+                self._finish_page()
+                page = label_page
+            if self.double_sided:
+                self._begin_row(y)
+            self._draw_label(label, x, y)
+        self._finish_page()
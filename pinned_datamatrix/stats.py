@@ -0,0 +1,166 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+# The stages of the pipeline, in order:
+#   encode: encoding the data as a datamatrix module matrix
+#   svg: building the SVG of a label
+#   overlap: checking that the objects on a label do not overlap
+#   drawing: building the ReportLab drawing parts of a label
+#   draw: drawing a label on a page
+#   raster: rasterizing a label to an image
+#   showPage: finishing a page
+#   save: writing the PDF
+STAGES = ["encode", "svg", "overlap", "drawing", "draw", "raster", "showPage", "save"]
+
+# A hook is called with the stage, the seconds spent in it and the number of times the
+# stage ran in those seconds
+Hook = Callable[[str, float, int], None]
+
+_hooks: list[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Call a function with the timing of every pipeline stage from now on.
+    Args:
+        hook: A function called with the stage name, the seconds spent in the stage
+            and the number of times it ran, e.g. to log the timings of a print job.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Stop calling a function added with `add_hook`.
+    Args:
+        hook: The function to remove.
+    """
+    _hooks.remove(hook)
+
+
+def enabled() -> bool:
+    """
+    Returns:
+        Whether any hook is listening, i.e. whether stages are timed.
+    """
+    return bool(_hooks)
+
+
+def report(stage: str, seconds: float, count: int = 1) -> None:
+    """
+    Report the timing of a stage to the hooks, e.g. one measured in another process.
+    Args:
+        stage: The stage name.
+        seconds: The seconds spent in the stage.
+        count: The number of times the stage ran.
+    """
+    for hook in _hooks:
+        hook(stage, seconds, count)
+
+
+class timed:
+    """
+    Time a block of code as a pipeline stage, if any hook is listening:
+
+        with timed("encode"):
+            ...
+
+    A block running a stage for a batch of items is reported with the number of
+    items as the count, e.g. `timed("encode", count=len(payloads))`.
+    """
+
+    __slots__ = ("stage", "count", "start")
+
+    def __init__(self, stage: str, count: int = 1):
+        self.stage = stage
+        self.count = count
+        self.start = None
+
+    def __enter__(self) -> None:
+        if _hooks:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        if self.start is not None:
+            report(self.stage, time.perf_counter() - self.start, self.count)
+
+
+class PipelineStats:
+    """The total time and number of runs of each pipeline stage."""
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.wall_time = 0.0
+
+    def add(self, stage: str, seconds: float, count: int = 1) -> None:
+        """
+        Add the timing of a stage. Can be used as a hook.
+        Args:
+            stage: The stage name.
+            seconds: The seconds spent in the stage.
+            count: The number of times the stage ran.
+        """
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + count
+
+    def events(self) -> list[tuple[str, float, int]]:
+        """
+        Returns:
+            The (stage, seconds, count) of each stage, in pipeline order.
+        """
+        stages = [stage for stage in STAGES if stage in self.seconds]
+        stages += [stage for stage in self.seconds if stage not in STAGES]
+        return [(stage, self.seconds[stage], self.counts[stage]) for stage in stages]
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            The stats as a JSON serializable dict.
+        """
+        return {
+            "wall_time": self.wall_time,
+            "stages": {
+                stage: {"seconds": seconds, "count": count}
+                for stage, seconds, count in self.events()
+            },
+        }
+
+    def format(self) -> str:
+        """
+        Returns:
+            A table of the time spent in each stage.
+        """
+        lines = [f"{'stage':<10}{'count':>10}{'total':>12}{'per run':>12}{'share':>8}"]
+        for stage, seconds, count in self.events():
+            share = seconds / self.wall_time if self.wall_time else 0
+            lines.append(
+                f"{stage:<10}{count:>10,}{seconds:>11.3f}s"
+                f"{seconds / count * 1e3:>10.3f}ms{share:>8.1%}"
+            )
+        lines.append(f"{'wall time':<10}{'':>10}{self.wall_time:>11.3f}s")
+        return "\n".join(lines)
+
+
+@contextmanager
+def collect() -> Iterator[PipelineStats]:
+    """
+    Collect the timings of the pipeline stages run within the block:
+
+        with collect() as stats:
+            ...
+        print(stats.format())
+
+    Stages run by worker processes are collected as well, as the workers report them
+    back with their results. Stages that run in parallel workers can add up to more
+    than the wall time.
+    """
+    stats = PipelineStats()
+    add_hook(stats.add)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.wall_time = time.perf_counter() - start
+        remove_hook(stats.add)
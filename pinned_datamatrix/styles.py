@@ -1,37 +1,97 @@
-from .label_generator import Label
+from collections.abc import Callable, Iterable
+from functools import partial
 
+from .cache import LabelCache
+from .label_generator import Label, LabelTemplate
 
-def NHMD(number: int) -> Label:
-    return Label(
+NHMD_TEMPLATE = LabelTemplate(
+    width=12,
+    height=5,
+    font_size=3.55,
+    text_align="right",
+    text_area_margins=(0, 5, 0, 1.3),
+    text_oritentation="top",
+    check_overlap=True,
+    dot_alignment="center_left",
+    dot_offset=(0.7, 0),
+    datamatrix_alignment="top_right",
+    datamatrix_length=5.0,
+)
+
+NHMA_TEMPLATE = LabelTemplate(
+    width=14,
+    height=19,
+    font_size=5,
+    text_align="center",
+    text_area_margins=(0, 0.5, 0, 6.5),
+    text_oritentation="right",
+    check_overlap=True,
+    dot_alignment="center_left",
+    dot_offset=(0.2 * 14, 0),
+    datamatrix_alignment="bottom_left",
+    datamatrix_length=6.5,
+)
+
+
+def NHMD(number: int, cache: LabelCache | None = None) -> Label:
+    return NHMD_TEMPLATE.create_label(
         data=str(number).zfill(9),
-        width=12,
-        height=5,
-        font_size=3.55,
         text_lines=["NHMD", str(number)],
-        text_align="right",
-        text_area_margins=(0, 5, 0, 1.3),
-        text_oritentation="top",
-        check_overlap=True,
-        dot_alignment="center_left",
-        dot_offset=(0.7, 0),
-        datamatrix_alignment="top_right",
-        datamatrix_length=5.0,
+        cache=cache,
     )
 
 
-def NHMA(number: int, bottom_text: str) -> Label:
-    return Label(
+def NHMA(number: int, bottom_text: str, cache: LabelCache | None = None) -> Label:
+    return NHMA_TEMPLATE.create_label(
         data=str(number).zfill(9),
-        width=14,
-        height=19,
-        font_size=5,
         text_lines=["NHMA", str(number), bottom_text],
-        text_align="center",
-        text_area_margins=(0, 0.5, 0, 6.5),
-        text_oritentation="right",
-        check_overlap=True,
-        dot_alignment="center_left",
-        dot_offset=(0.2 * 14, 0),
-        datamatrix_alignment="bottom_left",
-        datamatrix_length=6.5,
+        cache=cache,
     )
+
+
+def NHMD_labels(numbers: Iterable[int], cache: LabelCache | None = None) -> list[Label]:
+    return NHMD_TEMPLATE.create_labels(
+        [(str(number).zfill(9), ["NHMD", str(number)]) for number in numbers],
+        cache=cache,
+    )
+
+
+def NHMA_labels(
+    numbers: Iterable[int], bottom_text: str, cache: LabelCache | None = None
+) -> list[Label]:
+    return NHMA_TEMPLATE.create_labels(
+        [
+            (str(number).zfill(9), ["NHMA", str(number), bottom_text])
+            for number in numbers
+        ],
+        cache=cache,
+    )
+
+
+# The function creating the labels of many numbers at once, for each style function
+_BATCH_STYLES: dict[Callable, Callable[..., list[Label]]] = {
+    NHMD: NHMD_labels,
+    NHMA: NHMA_labels,
+}
+
+
+def create_labels(
+    label_func: Callable[[int], Label], numbers: Iterable[int]
+) -> list[Label]:
+    """
+    Create the labels of many numbers. The datamatrices of a style, or of a partial
+    of a style with keyword arguments, are encoded as one block, see
+    `LabelTemplate.create_labels`. Other label functions create one label at a time.
+    Args:
+        label_func: The function creating a label from a number.
+        numbers: The numbers to create labels for.
+    Returns:
+        The labels, in the order of the numbers.
+    """
+    func, kwargs = label_func, {}
+    if isinstance(label_func, partial) and not label_func.args:
+        func, kwargs = label_func.func, label_func.keywords
+    batch_func = _BATCH_STYLES.get(func)
+    if batch_func is None:
+        return [label_func(number) for number in numbers]
+    return batch_func(numbers, **kwargs)
@@ -1,7 +1,5 @@
 import xml.etree.ElementTree as ET
 import io
-from reportlab.graphics import renderPM
-from svglib.svglib import svg2rlg
 from PIL import Image
 
 
@@ -14,6 +12,9 @@ def svg_to_pil(svg: ET.Element, dpi: int = 300) -> Image.Image:
     Returns:
         The PIL Image.
     """
+    from reportlab.graphics import renderPM
+    from svglib.svglib import svg2rlg
+
     svg_bytes = ET.tostring(svg, encoding="unicode")
     svg_file = io.StringIO(svg_bytes)
     drawing = svg2rlg(svg_file)
@@ -30,6 +31,9 @@ def svg_to_png(svg: ET.Element, dpi: int = 300) -> bytes:
     Returns:
         The PNG as a bytes object.
     """
+    from reportlab.graphics import renderPM
+    from svglib.svglib import svg2rlg
+
     svg_bytes = ET.tostring(svg, encoding="unicode")
     svg_file = io.StringIO(svg_bytes)
     drawing = svg2rlg(svg_file)
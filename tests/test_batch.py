@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from pinned_datamatrix.batch import BatchJob, load_manifest
+
+
+def write(path, content: str) -> str:
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+class TestBatchJob:
+    def test_defaults(self):
+        job = BatchJob(style="NHMD", numbers="1-5", output="labels.pdf")
+        assert job.bottom_text == ""
+        assert job.label_padding == 0.25
+        assert job.dpi == 600
+
+    def test_numbers_as_list(self):
+        assert BatchJob("NHMD", [1, 2, 5], "labels.pdf").numbers == "1,2,5"
+        assert BatchJob("NHMD", 7, "labels.pdf").numbers == "7"
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"style": "INVALID"},
+            {"numbers": ""},
+            {"output": ""},
+            {"label_padding": -1},
+            {"dpi": 0},
+        ],
+    )
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            BatchJob(**{"style": "NHMD", "numbers": "1", "output": "a.pdf", **kwargs})
+
+
+class TestLoadManifest:
+    def test_csv(self, tmpdir):
+        path = write(
+            tmpdir.join("jobs.csv"),
+            "style,numbers,bottom_text,output,label_padding\n"
+            'NHMD,"1-5,7",,a.pdf,\n'
+            "NHMA,10-20,ENTOMOLOGY,b.pdf,0.5\n",
+        )
+        jobs = load_manifest(path)
+        assert jobs == [
+            BatchJob("NHMD", "1-5,7", os.path.join(tmpdir, "a.pdf")),
+            BatchJob(
+                "NHMA",
+                "10-20",
+                os.path.join(tmpdir, "b.pdf"),
+                bottom_text="ENTOMOLOGY",
+                label_padding=0.5,
+            ),
+        ]
+
+    def test_json_with_defaults(self, tmpdir):
+        manifest = {
+            "defaults": {"style": "NHMA", "bottom_text": "ENTOMOLOGY", "dpi": 300},
+            "jobs": [
+                {"numbers": [1, 2], "output": "a.zip"},
+                {"numbers": "3-4", "output": "/tmp/b.pdf", "style": "NHMD"},
+            ],
+        }
+        path = write(tmpdir.join("jobs.json"), json.dumps(manifest))
+        jobs = load_manifest(path)
+        assert [job.style for job in jobs] == ["NHMA", "NHMD"]
+        assert [job.numbers for job in jobs] == ["1,2", "3-4"]
+        assert [job.dpi for job in jobs] == [300, 300]
+        assert jobs[0].output == os.path.join(tmpdir, "a.zip")
+        assert jobs[1].output == "/tmp/b.pdf"
+
+    def test_yaml(self, tmpdir):
+        pytest.importorskip("yaml")
+        path = write(
+            tmpdir.join("jobs.yaml"),
+            "- style: NHMD\n  numbers: 1-5\n  output: a.pdf\n",
+        )
+        assert load_manifest(path)[0].numbers == "1-5"
+
+    @pytest.mark.parametrize(
+        "name, content",
+        [
+            ("jobs.txt", ""),
+            ("jobs.json", "[]"),
+            ("jobs.json", '{"defaults": {}}'),
+            ("jobs.json", '["a.pdf"]'),
+            (
+                "jobs.json",
+                '[{"style": "NHMD", "numbers": "1", "output": "a.pdf", "x": 1}]',
+            ),
+            ("jobs.json", '[{"style": "NHMD", "numbers": "1"}]'),
+            ("jobs.csv", "style,numbers,output\nNHMX,1,a.pdf\n"),
+        ],
+    )
+    def test_invalid(self, tmpdir, name, content):
+        path = write(tmpdir.join(name), content)
+        with pytest.raises(ValueError):
+            load_manifest(path)
@@ -0,0 +1,168 @@
+import itertools
+import pickle
+
+import numpy as np
+import pytest
+
+from pinned_datamatrix import cache as cache_module
+from pinned_datamatrix.cache import LabelCache
+from pinned_datamatrix.datamatrix_generator import DataMatrix
+from pinned_datamatrix.styles import NHMA, NHMA_TEMPLATE, NHMD, NHMD_TEMPLATE
+
+
+@pytest.fixture
+def label_cache(tmpdir):
+    return LabelCache(str(tmpdir.join("cache")))
+
+
+def stored_bytes(label_cache: LabelCache) -> int:
+    return label_cache.connection.execute("SELECT bytes FROM stored_size").fetchone()[0]
+
+
+class TestLabelCache:
+    @pytest.mark.parametrize("path_mode", ["modules", "runs", "outline"])
+    def test_roundtrip(self, label_cache, path_mode):
+        dm = DataMatrix("123456789", path_mode=path_mode)
+        polygons = dm._get_black_module_polygons()
+        label_cache.put("key", dm.dm_array, polygons)
+        dm_array, cached_polygons = label_cache.get("key")
+        assert dm_array.dtype == bool
+        assert np.array_equal(dm_array, dm.dm_array)
+        assert cached_polygons == polygons
+
+    def test_missing_key(self, label_cache):
+        assert label_cache.get("missing") is None
+
+    def test_buffers_writes(self, label_cache):
+        dm = DataMatrix("123456789")
+        label_cache.put("key", dm.dm_array, dm._get_black_module_polygons())
+        other = LabelCache(label_cache.directory)
+        # Buffered entries are read back, but only committed when flushed
+        assert label_cache.get("key") is not None
+        assert other.get("key") is None
+        label_cache.flush()
+        assert other.get("key") is not None
+
+    def test_close_commits_writes(self, label_cache):
+        dm = DataMatrix("123456789")
+        label_cache.put("key", dm.dm_array, dm._get_black_module_polygons())
+        label_cache.close()
+        assert len(LabelCache(label_cache.directory)) == 1
+
+    def test_persists_between_instances(self, label_cache):
+        NHMD(42, cache=label_cache)
+        label_cache.close()
+        assert len(LabelCache(label_cache.directory)) == 1
+
+    def test_cached_label_matches_uncached(self, label_cache):
+        NHMA(42, "ENTOMOLOGY", cache=label_cache)
+        cached = NHMA(42, "ENTOMOLOGY", cache=label_cache)
+        assert len(label_cache) == 1
+        assert cached.svg_to_string() == NHMA(42, "ENTOMOLOGY").svg_to_string()
+
+    def test_key_depends_on_datamatrix_parameters(self):
+        from pinned_datamatrix.label_generator import LabelTemplate
+
+        runs_template = LabelTemplate(
+            width=12, height=5, font_size=3.55, datamatrix_path_mode="runs"
+        )
+        keys = {
+            NHMD_TEMPLATE.cache_key("000000042"),
+            NHMD_TEMPLATE.cache_key("000000043"),
+            runs_template.cache_key("000000042"),
+        }
+        assert len(keys) == 3
+
+    def test_key_is_shared_between_templates(self):
+        assert NHMD_TEMPLATE.cache_key("000000042") == NHMA_TEMPLATE.cache_key(
+            "000000042"
+        )
+
+    def test_key_depends_on_version(self, monkeypatch):
+        from pinned_datamatrix import label_generator
+
+        key = NHMD_TEMPLATE.cache_key("000000042")
+        monkeypatch.setattr(label_generator, "__version__", "0.0.0")
+        template = label_generator.LabelTemplate(
+            width=12,
+            height=5,
+            font_size=3.55,
+            text_align="right",
+            text_area_margins=(0, 5, 0, 1.3),
+            text_oritentation="top",
+            check_overlap=True,
+            dot_alignment="center_left",
+            dot_offset=(0.7, 0),
+            datamatrix_alignment="top_right",
+            datamatrix_length=5.0,
+        )
+        assert template.cache_key("000000042") != key
+
+    def test_evicts_least_recently_used(self, tmpdir, monkeypatch):
+        # Every call is an hour later, so each use of an entry is recorded
+        clock = itertools.count(step=cache_module.TOUCH_INTERVAL)
+        monkeypatch.setattr(cache_module.time, "time", lambda: next(clock))
+        dm = DataMatrix("123456789")
+        polygons = dm._get_black_module_polygons()
+        label_cache = LabelCache(str(tmpdir.join("cache")))
+        label_cache.put("a", dm.dm_array, polygons)
+        label_cache.flush()
+        (entry_size,) = label_cache.connection.execute(
+            "SELECT LENGTH(modules) + LENGTH(polygon_lengths) "
+            "+ LENGTH(polygon_corners) FROM labels"
+        ).fetchone()
+        # Room for two entries
+        label_cache.max_size = entry_size * 2
+        label_cache.put("b", dm.dm_array, polygons)
+        label_cache.get("a")
+        label_cache.put("c", dm.dm_array, polygons)
+        label_cache.evict()
+        assert label_cache.get("b") is None
+        assert label_cache.get("a") is not None
+        assert label_cache.get("c") is not None
+
+    @pytest.mark.parametrize("copy", ["instance", "pickle"])
+    def test_evicts_after_small_runs(self, tmpdir, copy):
+        # Runs and worker processes each store a few entries with their own instance
+        dm = DataMatrix("123456789")
+        polygons = dm._get_black_module_polygons()
+        directory = str(tmpdir.join("cache"))
+        first = LabelCache(directory)
+        first.put("size", dm.dm_array, polygons)
+        first.flush()
+        entry_size = stored_bytes(first)
+        first.clear()
+        label_cache = LabelCache(directory, max_size=entry_size * 3)
+        for run in range(5):
+            if copy == "pickle":
+                run_cache = pickle.loads(pickle.dumps(label_cache))
+            else:
+                run_cache = LabelCache(directory, max_size=entry_size * 3)
+            run_cache.put(f"{run}a", dm.dm_array, polygons)
+            run_cache.put(f"{run}b", dm.dm_array, polygons)
+            run_cache.close()
+        assert len(label_cache) == 3
+        assert stored_bytes(label_cache) == entry_size * 3
+
+    def test_tracks_stored_bytes(self, label_cache):
+        dm = DataMatrix("123456789")
+        polygons = dm._get_black_module_polygons()
+        for key in ["a", "b", "a"]:
+            label_cache.put(key, dm.dm_array, polygons)
+            label_cache.flush()
+        (size,) = label_cache.connection.execute(
+            "SELECT SUM(LENGTH(modules) + LENGTH(polygon_lengths) "
+            "+ LENGTH(polygon_corners)) FROM labels"
+        ).fetchone()
+        assert stored_bytes(label_cache) == size
+        label_cache.clear()
+        assert stored_bytes(label_cache) == 0
+
+    def test_pickle(self, label_cache):
+        NHMD(42, cache=label_cache)
+        unpickled = pickle.loads(pickle.dumps(label_cache))
+        assert len(unpickled) == 1
+
+    def test_invalid_max_size(self, tmpdir):
+        with pytest.raises(ValueError):
+            LabelCache(str(tmpdir), max_size=0)
@@ -0,0 +1,115 @@
+import json
+import os
+from io import BytesIO
+
+import pytest
+from pypdf import PdfReader
+
+from pinned_datamatrix import chunked
+from pinned_datamatrix.chunked import chunk_path, state_path, write_chunked
+from pinned_datamatrix.number_ranges import NumberRanges
+from pinned_datamatrix.sheet_generator import Sheet
+from pinned_datamatrix.styles import NHMD
+
+# Small pages, so a few labels fill a page
+SHEET_KWARGS = {"page_size": (40, 40), "page_margins": (0, 0, 0, 0)}
+
+
+def labels_per_page():
+    return Sheet([NHMD(1)], BytesIO(), **SHEET_KWARGS).layout.labels_per_page
+
+
+def test_chunk_and_state_paths():
+    assert chunk_path("out/labels.pdf", 0) == "out/labels_0001.pdf"
+    assert chunk_path("out/labels.pdf", 11) == "out/labels_0012.pdf"
+    assert state_path("out/labels.pdf") == "out/labels.state.json"
+
+
+def test_write_chunked(tmpdir):
+    output_path = str(tmpdir.join("labels.pdf"))
+    per_page = labels_per_page()
+    numbers = NumberRanges([range(1, 2 * per_page + 2)])
+    paths = write_chunked(NHMD, numbers, output_path, 1, progress=False, **SHEET_KWARGS)
+    assert paths == [chunk_path(output_path, index) for index in range(3)]
+    assert [len(PdfReader(path).pages) for path in paths] == [1, 1, 1]
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmpdir))
+    with open(state_path(output_path)) as f:
+        state = json.load(f)
+    assert state["numbers"] == str(numbers)
+    assert state["pages_per_file"] == 1
+    assert state["completed"] == 3
+
+
+def test_write_chunked_resumes_after_crash(tmpdir, monkeypatch):
+    output_path = str(tmpdir.join("labels.pdf"))
+    per_page = labels_per_page()
+    numbers = list(range(1, 3 * per_page + 1))
+    write_file = chunked._write_file
+    written = []
+    crash = True
+
+    def write_file_or_crash(label_func, numbers, path, *args):
+        if crash and len(written) == 1:
+            raise KeyboardInterrupt
+        written.append(numbers[0])
+        write_file(label_func, numbers, path, *args)
+
+    monkeypatch.setattr(chunked, "_write_file", write_file_or_crash)
+    with pytest.raises(KeyboardInterrupt):
+        write_chunked(NHMD, numbers, output_path, 1, progress=False, **SHEET_KWARGS)
+    with open(state_path(output_path)) as f:
+        assert json.load(f)["completed"] == 1
+    assert os.path.exists(chunk_path(output_path, 0))
+    assert not os.path.exists(chunk_path(output_path, 1))
+
+    written.clear()
+    crash = False
+    paths = write_chunked(
+        NHMD, numbers, output_path, 1, resume=True, progress=False, **SHEET_KWARGS
+    )
+    assert written == [1 + per_page, 1 + 2 * per_page]
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_write_chunked_resume_rewrites_missing_files(tmpdir):
+    output_path = str(tmpdir.join("labels.pdf"))
+    numbers = list(range(1, 2 * labels_per_page() + 1))
+    paths = write_chunked(NHMD, numbers, output_path, 1, progress=False, **SHEET_KWARGS)
+    os.remove(paths[1])
+    write_chunked(
+        NHMD, numbers, output_path, 1, resume=True, progress=False, **SHEET_KWARGS
+    )
+    assert os.path.exists(paths[1])
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"numbers": [1, 2, 4]},
+        {"pages_per_file": 2},
+        {"settings": {"style": "NHMA"}},
+        {"label_padding": 1},
+    ],
+)
+def test_write_chunked_resume_rejects_other_run(tmpdir, changes):
+    output_path = str(tmpdir.join("labels.pdf"))
+    kwargs = {
+        "numbers": [1, 2, 3],
+        "pages_per_file": 1,
+        "settings": {"style": "NHMD"},
+        **SHEET_KWARGS,
+    }
+    write_chunked(NHMD, output_path=output_path, progress=False, **kwargs)
+    with pytest.raises(ValueError, match="Cannot resume"):
+        write_chunked(
+            NHMD,
+            output_path=output_path,
+            resume=True,
+            progress=False,
+            **{**kwargs, **changes},
+        )
+
+
+def test_write_chunked_invalid_pages_per_file(tmpdir):
+    with pytest.raises(ValueError):
+        write_chunked(NHMD, [1], str(tmpdir.join("labels.pdf")), 0)
@@ -1,11 +1,16 @@
 import pytest
+import numpy as np
 from xml.etree import ElementTree as ET
 import zxingcpp
+from PIL import Image
 from pylibdmtx.pylibdmtx import PyLibDMTXError, ENCODING_SIZE_NAMES
 from pinned_datamatrix.datamatrix_generator import (
     DataMatrix,
+    PATH_MODES,
+    encode_modules,
 )
 from pinned_datamatrix.utils import svg_to_pil
+from reportlab.graphics.shapes import _CLOSEPATH
 
 DM_SILENT_ZONE_SIZE = 2  # 2 modules on each side of the datamatrix
 
@@ -68,6 +73,29 @@ class TestDataMatrix:
         assert result is not None
         assert result.text == data
 
+    @pytest.mark.parametrize(
+        "data, size",
+        [
+            ("1", "SquareAuto"),
+            ("000012345", "SquareAuto"),
+            ("123456789", "ShapeAuto"),
+            ("Hello world!", "16x16"),
+            ("Hello world! 1234567890", "RectAuto"),
+            ("Hello world! 1234567890", "12x36"),
+            ("a" * 500, "SquareAuto"),
+        ],
+    )
+    def test_bit_array_matches_bitmap(self, data, size):
+        dm = DataMatrix(data, size)
+        assert np.array_equal(dm.dm_array, dm._get_datamatrix_bit_array_from_bitmap())
+
+        # Decode the module matrix itself, drawn at 10 pixels per module
+        pixels = np.where(dm.dm_array, 0, 255).astype(np.uint8)
+        img = Image.fromarray(pixels.repeat(10, axis=0).repeat(10, axis=1))
+        result = zxingcpp.read_barcode(img, zxingcpp.BarcodeFormat.DataMatrix)
+        assert result is not None
+        assert result.text == data
+
     @pytest.mark.parametrize(
         "data, size, expected_error",
         [
@@ -98,3 +126,141 @@ class TestDataMatrix:
         width, height = self.extract_svg_dimensions(svg)
         assert width == expected_width
         assert height == expected_height
+
+    def test_create_rlg(self):
+        dm = DataMatrix("Hello world!", size="SquareAuto", path_mode="modules")
+        group = dm.create_rlg()
+        background, black_modules = group.contents
+        assert (background.width, background.height) == dm.dm_array.shape
+        # One closed subpath per black module
+        assert black_modules.operators.count(_CLOSEPATH) == dm.dm_array.sum()
+        assert black_modules.getBounds() == (
+            DM_SILENT_ZONE_SIZE,
+            DM_SILENT_ZONE_SIZE,
+            dm.dm_array.shape[1] - DM_SILENT_ZONE_SIZE,
+            dm.dm_array.shape[0] - DM_SILENT_ZONE_SIZE,
+        )
+
+    @pytest.mark.parametrize("path_mode", PATH_MODES)
+    @pytest.mark.parametrize(
+        "data",
+        ["123", "000012345", "Hello world! 1234567890", "a" * 200],
+    )
+    def test_path_modes_fill_the_same_modules(self, data, path_mode):
+        dm = DataMatrix(data, path_mode=path_mode)
+        polygons = dm._get_black_module_polygons()
+        for fill_rule in ["evenodd", "nonzero"]:
+            filled = self.rasterize(polygons, dm.dm_array.shape, fill_rule)
+            assert (filled == dm.dm_array).all()
+
+    def test_path_modes_shrink_the_path(self):
+        lengths = [
+            len(
+                DataMatrix("Hello world!", path_mode=mode)._get_black_modules().get("d")
+            )
+            for mode in ["modules", "runs", "outline"]
+        ]
+        assert lengths == sorted(lengths, reverse=True)
+
+    def test_modules_path(self):
+        dm = DataMatrix("123", path_mode="modules")
+        dm.dm_array = np.array([[True, False], [True, True]])
+        assert dm._get_black_modules().get("d") == (
+            "M0 0h1v1h-1zM0 1h1v1h-1zM1 1h1v1h-1z"
+        )
+
+    def test_outline_path(self):
+        dm = DataMatrix("123", path_mode="outline")
+        dm.dm_array = np.array([[True, False], [True, True]])
+        assert dm._get_black_modules().get("d") == "M0 0h1v1h1v1h-2z"
+
+    def test_modules_are_packed(self):
+        dm = DataMatrix("123")
+        assert np.array_equal(dm.dm_array, dm._get_datamatrix_bit_array())
+        # Sizes that are not a multiple of 8 are unpacked without padding
+        expected = np.random.default_rng(0).random((13, 17)) < 0.5
+        dm.dm_array = expected
+        assert dm.shape == (13, 17)
+        assert len(dm._packed_modules) == -(-13 * 17 // 8)
+        assert dm.dm_array.dtype == bool
+        assert np.array_equal(dm.dm_array, expected)
+
+    def test_encoding_is_memoized(self):
+        encode_modules.cache_clear()
+        first = DataMatrix("memoized")
+        second = DataMatrix("memoized", path_mode="modules")
+        assert encode_modules.cache_info().misses == 1
+        assert encode_modules.cache_info().hits == 1
+        assert second._packed_modules is first._packed_modules
+        assert np.array_equal(second.dm_array, second._get_datamatrix_bit_array())
+
+    def test_encode_many_packed(self):
+        payloads = [str(number).zfill(9) for number in [0, 1, 123456789]]
+        shape, packed = DataMatrix.encode_many_packed(payloads)
+        assert shape == DataMatrix(payloads[0]).shape
+        assert packed.dtype == np.uint8
+        assert len(packed) == 3
+        for payload, packed_modules in zip(payloads, packed, strict=True):
+            assert packed_modules.tobytes() == DataMatrix(payload)._packed_modules
+
+    def test_encode_many(self):
+        payloads = [str(number).zfill(9) for number in [0, 1, 123456789]]
+        modules = DataMatrix.encode_many(payloads)
+        assert modules.dtype == bool
+        assert modules.shape == (3, *DataMatrix(payloads[0]).shape)
+        for payload, symbol in zip(payloads, modules, strict=True):
+            assert np.array_equal(symbol, DataMatrix(payload).dm_array)
+
+    def test_encode_many_is_timed_once(self):
+        from pinned_datamatrix.stats import collect
+
+        with collect() as stats:
+            DataMatrix.encode_many(["1", "2", "3"])
+        assert stats.events() == [("encode", stats.seconds["encode"], 3)]
+
+    def test_encode_many_rejects_different_sizes(self):
+        for encode_many in [DataMatrix.encode_many, DataMatrix.encode_many_packed]:
+            with pytest.raises(ValueError, match="symbol"):
+                encode_many(["1", "a" * 100])
+            with pytest.raises(ValueError):
+                encode_many([])
+
+    def test_create_many(self):
+        payloads = ["000000001", "000000002"]
+        datamatrices = DataMatrix.create_many(payloads, path_mode="runs")
+        for payload, dm in zip(payloads, datamatrices, strict=True):
+            expected = DataMatrix(payload, path_mode="runs")
+            assert dm.data == payload
+            assert dm.shape == expected.shape
+            assert dm._packed_modules == expected._packed_modules
+            assert dm._get_black_modules().get("d") == (
+                expected._get_black_modules().get("d")
+            )
+
+    def test_invalid_path_mode(self):
+        with pytest.raises(ValueError):
+            DataMatrix("123", path_mode="pixels")
+
+    @staticmethod
+    def rasterize(
+        polygons: list[list[tuple[int, int]]], shape: tuple[int, int], fill_rule: str
+    ) -> np.ndarray:
+        """Fill the polygons by casting a ray to the right from each module center."""
+        center_y = np.arange(shape[0])[:, None] + 0.5
+        center_x = np.arange(shape[1])[None, :] + 0.5
+        winding = np.zeros(shape, dtype=int)
+        for polygon in polygons:
+            for (x0, y0), (x1, y1) in zip(
+                polygon, polygon[1:] + polygon[:1], strict=True
+            ):
+                if x0 != x1:
+                    continue
+                crossing = (
+                    (min(y0, y1) < center_y)
+                    & (center_y < max(y0, y1))
+                    & (x0 > center_x)
+                )
+                winding += crossing * (1 if y1 > y0 else -1)
+        if fill_rule == "evenodd":
+            return winding % 2 == 1
+        return winding != 0
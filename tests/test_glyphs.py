@@ -0,0 +1,92 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+from reportlab.graphics import renderPDF
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+
+from pinned_datamatrix.glyphs import GlyphRun, get_glyph_outlines
+from pinned_datamatrix.label_generator import FONT_NAME, LabelTemplate
+from pinned_datamatrix.sheet_generator import Sheet
+
+
+@pytest.fixture
+def outlines():
+    return get_glyph_outlines()
+
+
+@pytest.mark.parametrize("text", ["NHMD", "123456789", "ENTOMOLOGY ÆØÅ", ""])
+def test_string_width_matches_reportlab(outlines, text):
+    # The label font is registered by the first template
+    LabelTemplate(width=12, height=5, font_size=3.55)
+    assert outlines.string_width(text, 3.55) == pytest.approx(
+        stringWidth(text, FONT_NAME, 3.55)
+    )
+
+
+@pytest.mark.parametrize("anchor", ["start", "middle", "end"])
+def test_extents_contain_the_path(outlines, anchor):
+    extents = outlines.extents("NHMA 42", 10, 5, 3.55, anchor)
+    x0, y0, x1, y1 = outlines.text_path("NHMA 42", 10, 5, 3.55, anchor).getBounds()
+    assert extents[0] <= x0 and extents[1] <= y0
+    assert extents[2] >= x1 and extents[3] >= y1
+    # The ink reaches the baseline and the cap height
+    assert y0 == pytest.approx(5, abs=0.1)
+    assert y1 - y0 == pytest.approx(0.7 * 3.55, rel=0.2)
+
+
+def test_extents_of_blank_text(outlines):
+    assert outlines.extents("   ", 0, 0, 10) is None
+
+
+def test_composite_glyph(outlines):
+    # Å is the outline of A with a ring above it
+    ring = outlines.glyph("Å")
+    assert len(ring.contours) > len(outlines.glyph("A").contours)
+    assert ring.bounds[3] > outlines.glyph("A").bounds[3]
+
+
+def test_glyph_run_defines_a_form_per_glyph(outlines):
+    canvas = Canvas(io.BytesIO())
+    drawing = Drawing(100, 20, GlyphRun(outlines, 0, 5, "1121", 10))
+    renderPDF.draw(drawing, canvas, 0, 0)
+    names = [outlines.form_name(canvas, outlines.glyph(char)) for char in "12"]
+    assert all(canvas.hasForm(name) for name in names)
+    assert len(set(names)) == 2
+
+
+def test_glyph_run_bounds_match_string(outlines):
+    LabelTemplate(width=12, height=5, font_size=3.55)
+    run = GlyphRun(outlines, 10, 0, "123", 10, anchor="middle")
+    string = String(10, 0, "123", fontName=FONT_NAME, fontSize=10, textAnchor="middle")
+    x0, _, x1, _ = run.getBounds()
+    sx0, _, sx1, _ = string.getBounds()
+    assert sx0 <= x0 < x1 <= sx1
+
+
+@pytest.fixture
+def outline_template():
+    return LabelTemplate(width=12, height=5, font_size=3.55, text_outlines=True)
+
+
+def test_label_svg_uses_paths(outline_template):
+    label = outline_template.create_label("123456789", ["NHMD", "123456789"])
+    svg = label.svg_to_string()
+    assert "<text" not in svg
+    assert svg.count('id="text_line_') == 2
+
+
+def test_sheet_does_not_embed_the_font(outline_template, tmpdir):
+    output_path = str(tmpdir.join("labels.pdf"))
+    labels = [
+        outline_template.create_label(str(number), ["NHMD", str(number)])
+        for number in range(20)
+    ]
+    sheet = Sheet(labels, output_path)
+    sheet.generate(progress=False)
+    sheet.c.save()
+    with open(output_path, "rb") as f:
+        assert b"/FontFile2" not in f.read()
+    assert len(PdfReader(output_path).pages) == 1
@@ -1,9 +1,18 @@
 import pytest
-from pinned_datamatrix.label_generator import Label, SVG_NAMESPACE, PT_TO_MM
+from pinned_datamatrix.label_generator import (
+    Label,
+    LabelTemplate,
+    SVG_NAMESPACE,
+    PT_TO_MM,
+)
 import xml.etree.ElementTree as ET
 from pinned_datamatrix.utils import svg_to_pil
+import io
+import pickle
 import zxingcpp
 from svglib.fonts import find_font
+from svglib.svglib import svg2rlg
+from reportlab.graphics import renderPM
 
 
 class TestLabel:
@@ -18,7 +27,7 @@ class TestLabel:
             check_overlap=True,
         )
 
-    def test_font_is_registered(self):
+    def test_font_is_registered(self, test_label):
         assert find_font("Inconsolata", weight="800") == ("Inconsolata-800", True)
 
     def test_svg_to_string(self, test_label):
@@ -73,6 +82,71 @@ class TestLabel:
         except Warning as e:
             assert "are overlapping by" in str(e)
 
+    @pytest.mark.parametrize("text_oritentation", ["top", "right", "bottom", "left"])
+    @pytest.mark.parametrize("text_align", ["left", "center", "right"])
+    def test_to_drawing_matches_svg(self, text_oritentation, text_align):
+        label = Label(
+            data="123456789",
+            width=20,
+            height=20,
+            text_lines=["NHMD", "123456789"],
+            font_size=3.55,
+            text_oritentation=text_oritentation,
+            text_align=text_align,
+            check_overlap=False,
+        )
+        drawing = label.to_drawing()
+        expected = svg2rlg(io.StringIO(label.svg_to_string()))
+        assert drawing.width == pytest.approx(expected.width)
+        assert drawing.height == pytest.approx(expected.height)
+        objs = drawing.contents[0].contents
+        expected_objs = expected.contents[0].contents
+        assert len(objs) == len(expected_objs)
+        for obj, expected_obj in zip(objs, expected_objs, strict=True):
+            assert obj.getProperties()["svgid"] == expected_obj.getProperties()["svgid"]
+            assert obj.getBounds() == pytest.approx(expected_obj.getBounds())
+
+    def test_drawing_parts(self, test_label):
+        other = Label(
+            data="987654321",
+            width=12,
+            height=5,
+            text_lines=["NHMD", "987654321"],
+            font_size=3.55,
+        )
+        parts = test_label.drawing_parts()
+        other_parts = other.drawing_parts()
+        # datamatrix, dot and two text lines
+        assert len(parts) == 4
+        assert parts[0][0] is None
+        assert [key for key, _ in parts[1:3]] == [key for key, _ in other_parts[1:3]]
+        assert parts[3][0] != other_parts[3][0]
+        # The parts cover the same area as the full drawing
+        drawing_bounds = test_label.to_drawing().getBounds()
+        part_bounds = [part.getBounds() for _, part in parts]
+        assert min(b[0] for b in part_bounds) == pytest.approx(drawing_bounds[0])
+        assert max(b[2] for b in part_bounds) == pytest.approx(drawing_bounds[2])
+
+    def test_prepare_drawing(self, test_label):
+        parts = test_label.drawing_parts()
+        # The parts are built on every call, unless the label is prepared
+        assert test_label.drawing_parts() is not parts
+        test_label.prepare_drawing()
+        prepared = test_label.drawing_parts()
+        assert test_label.drawing_parts() is prepared
+        assert [key for key, _ in prepared] == [key for key, _ in parts]
+        # Prepared labels are sent to the sheet from worker processes
+        unpickled = pickle.loads(pickle.dumps(test_label))
+        assert [key for key, _ in unpickled.drawing_parts()] == [
+            key for key, _ in parts
+        ]
+
+    def test_to_drawing_decodes(self, test_label):
+        img = renderPM.drawToPIL(test_label.to_drawing(), dpi=600)
+        decoded_data = zxingcpp.read_barcode(img, zxingcpp.BarcodeFormat.DataMatrix)
+        assert decoded_data is not None
+        assert decoded_data.text == test_label.data
+
     @pytest.mark.parametrize(
         "data",
         [
@@ -181,3 +255,140 @@ class TestLabel:
             )
             svg = label.svg_to_string()
             assert svg is not None
+
+
+class TestLabelTemplate:
+    @pytest.fixture
+    def test_template(self):
+        return LabelTemplate(
+            width=12,
+            height=5,
+            font_size=3.55,
+            check_overlap=True,
+        )
+
+    def test_create_label_matches_label(self, test_template):
+        label = test_template.create_label("123456789", ["NHMD", "123456789"])
+        expected = Label(
+            data="123456789",
+            width=12,
+            height=5,
+            text_lines=["NHMD", "123456789"],
+            font_size=3.55,
+            check_overlap=True,
+        )
+        assert label.svg_to_string() == expected.svg_to_string()
+        assert label.template is test_template
+
+    def test_create_labels_matches_create_label(self, test_template, tmpdir):
+        from pinned_datamatrix.cache import LabelCache
+
+        # Copies of the same data, and data of two symbol sizes
+        entries = [
+            ("000000001", ["NHMD", "1"]),
+            ("000000001", ["NHMD", "1"]),
+            ("000000002", ["NHMD", "2"]),
+            ("1234567890123", ["NHMD", "3"]),
+        ]
+        cache = LabelCache(str(tmpdir.join("cache")))
+        for label_cache in [None, cache, cache]:
+            labels = test_template.create_labels(entries, cache=label_cache)
+            assert [label.svg_to_string() for label in labels] == [
+                test_template.create_label(data, text_lines).svg_to_string()
+                for data, text_lines in entries
+            ]
+            assert labels[0].dm is labels[1].dm
+        assert len(cache) == 3
+
+    def test_label_only_stores_its_own_fields(self, test_template):
+        label = test_template.create_label("123456789", ["NHMD", "123456789"])
+        assert not hasattr(label, "__dict__")
+        assert label.width == test_template.width
+        assert label.dot_alignment == test_template.dot_alignment
+        # The SVG is built on demand
+        assert label.svg is not label.svg
+        assert ET.tostring(label.svg) == ET.tostring(label.svg)
+
+    def test_label_pickles(self, test_template):
+        label = test_template.create_label("123456789", ["NHMD", "123456789"])
+        copy = pickle.loads(pickle.dumps(label))
+        assert copy.svg_to_string() == label.svg_to_string()
+
+    def test_overlap_checked_once_per_text_shape(self, test_template, monkeypatch):
+        calls = []
+        check_overlap = Label._check_overlap
+
+        def counting_check_overlap(label):
+            calls.append(label.text_lines)
+            check_overlap(label)
+
+        monkeypatch.setattr(Label, "_check_overlap", counting_check_overlap)
+        for number in range(100, 110):
+            test_template.create_label(str(number), ["NHMD", str(number)])
+        test_template.create_label("1000", ["NHMD", "1000"])
+        assert calls == [["NHMD", "100"], ["NHMD", "1000"]]
+
+    def test_overlap_is_reported_for_every_label(self, test_template):
+        for _ in range(2):
+            with pytest.raises(Warning):
+                test_template.create_label("1", ["NHMD", "123456789" * 100])
+
+    @pytest.mark.parametrize("text_oritentation", ["top", "right", "bottom", "left"])
+    @pytest.mark.parametrize("text_align", ["left", "center", "right"])
+    @pytest.mark.parametrize("dot_alignment", [None, "center_left"])
+    def test_object_bounds_match_drawing(
+        self, text_oritentation, text_align, dot_alignment
+    ):
+        label = Label(
+            data="123456789",
+            width=20,
+            height=20,
+            text_lines=["NHMD", "123456789"],
+            font_size=3.55,
+            text_oritentation=text_oritentation,
+            text_align=text_align,
+            dot_alignment=dot_alignment,
+            check_overlap=False,
+        )
+        objs = label.to_drawing().contents[0].contents
+        expected = [(obj.getProperties()["svgid"], obj.getBounds()) for obj in objs]
+        bounds = label.template.object_bounds(
+            label.text_lines, label.dm.dm_array.shape[0]
+        )
+        assert bounds == expected
+
+    def test_check_bounds(self, test_template):
+        test_template.check_bounds(["NHMD", "123456789"], 14)
+        with pytest.raises(Warning, match="Objects pin_dot and text are overlapping"):
+            test_template.check_bounds(["NHMD", "123456789" * 100], 14)
+        # The objects are named by their id
+        with pytest.raises(Warning, match="^Object text is outside of the label.$"):
+            test_template.check_bounds(["NHMD"] * 20, 14)
+
+    @pytest.mark.parametrize(
+        "text_lines, expected_error",
+        [
+            ([], ValueError),
+            (["NHMD", 1], TypeError),
+        ],
+    )
+    def test_invalid_text_lines(self, test_template, text_lines, expected_error):
+        with pytest.raises(expected_error):
+            test_template.create_label("1", text_lines)
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"width": 0},
+            {"font_size": -1},
+            {"text_oritentation": "up"},
+            {"datamatrix_alignment": "middle"},
+            {"datamatrix_length": 6},
+            {"dot_offset": (-1, 0)},
+        ],
+    )
+    def test_invalid_layout(self, kwargs):
+        layout = {"width": 12, "height": 5, "font_size": 3.55}
+        layout.update(kwargs)
+        with pytest.raises(ValueError):
+            LabelTemplate(**layout)
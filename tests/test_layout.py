@@ -0,0 +1,70 @@
+import pytest
+from reportlab.lib.units import mm
+
+from pinned_datamatrix.layout import SheetLayout
+
+
+@pytest.fixture
+def layout():
+    return SheetLayout(
+        page_size=(297 * mm, 210 * mm),
+        page_margins=(15 * mm, 15 * mm, 15 * mm, 15 * mm),
+        label_size=(12 * mm, 5 * mm),
+        label_padding=0.25 * mm,
+    )
+
+
+def place_incrementally(layout, num_labels):
+    """Place labels one after another, as in a row-by-row walk of the page"""
+    positions = []
+    page = 0
+    x = layout.margin_left
+    y = layout.height - layout.margin_top
+    for _ in range(num_labels):
+        if x + layout.label_width > layout.width - layout.margin_right:
+            x = layout.margin_left
+            y -= layout.label_height + layout.label_padding * 2
+            if y - layout.label_height < layout.margin_bottom:
+                page += 1
+                y = layout.height - layout.margin_top
+        positions.append((page, x, y))
+        x += layout.label_width + layout.label_padding * 2
+    return positions
+
+
+class TestSheetLayout:
+    def test_grid(self, layout):
+        assert len(layout.columns) == 21
+        assert len(layout.rows) == 32
+        assert layout.labels_per_page == 21 * 32
+
+    def test_positions_match_incremental_placement(self, layout):
+        num_labels = layout.labels_per_page * 2 + 5
+        expected = place_incrementally(layout, num_labels)
+        assert [layout.position(i) for i in range(num_labels)] == expected
+
+    def test_back_position(self, layout):
+        page, x, y = layout.position(700)
+        assert layout.back_position(700) == (page, layout.width - x, y)
+
+    def test_position_negative_index(self, layout):
+        with pytest.raises(IndexError):
+            layout.position(-1)
+
+    @pytest.mark.parametrize(
+        "num_labels, expected", [(0, 1), (1, 1), (672, 1), (673, 2), (2000, 3)]
+    )
+    def test_num_pages(self, layout, num_labels, expected):
+        assert layout.num_pages(num_labels) == expected
+
+    @pytest.mark.parametrize(
+        "page_size", [(20 * mm, 210 * mm), (297 * mm, 30 * mm), (0, 0)]
+    )
+    def test_label_does_not_fit(self, page_size):
+        with pytest.raises(ValueError):
+            SheetLayout(
+                page_size=page_size,
+                page_margins=(15 * mm, 15 * mm, 15 * mm, 15 * mm),
+                label_size=(12 * mm, 5 * mm),
+                label_padding=0.25 * mm,
+            )
@@ -1,22 +1,30 @@
+import http.client
+import json
+import os
+import pstats
+import subprocess
+import sys
 import tempfile
+import zipfile
 
 import pytest
 from click.exceptions import BadParameter
 from click.testing import CliRunner
 
-
 from pinned_datamatrix.__main__ import main, parse_number_range
+from pinned_datamatrix.datamatrix_generator import encode_modules
 
 
 def test_parse_number_range():
     # Test range
-    assert parse_number_range(None, None, "1-5") == [1, 2, 3, 4, 5]
+    assert list(parse_number_range(None, None, "1-5")) == [1, 2, 3, 4, 5]
 
     # Test individual numbers
-    assert parse_number_range(None, None, "1,2,3") == [1, 2, 3]
+    assert list(parse_number_range(None, None, "1,2,3")) == [1, 2, 3]
 
     # Test mixed
-    assert parse_number_range(None, None, "1-5,7,9-11") == [1, 2, 3, 4, 5, 7, 9, 10, 11]
+    numbers = parse_number_range(None, None, "1-5,7,9-11")
+    assert list(numbers) == [1, 2, 3, 4, 5, 7, 9, 10, 11]
 
     # Test invalid
     with pytest.raises(BadParameter):
@@ -28,6 +36,26 @@ def test_parse_number_range():
     with pytest.raises(BadParameter):
         parse_number_range(None, None, "abcdef")
 
+    with pytest.raises(BadParameter):
+        parse_number_range(None, None, "5-1")
+
+    # Large ranges are not expanded
+    assert len(parse_number_range(None, None, "1-1000000000")) == 1000000000
+
+
+def test_main_help():
+    runner = CliRunner()
+    # The help of the group lists every command
+    result = runner.invoke(main, ["--help"])
+    assert result.exit_code == 0
+    for command in ["generate", "batch", "serve"]:
+        assert command in result.output
+    assert "--style" not in result.output
+    # Help after an option of the default command is the help of generate
+    result = runner.invoke(main, ["-s", "NHMD", "--help"])
+    assert result.exit_code == 0
+    assert "--style" in result.output
+
 
 def test_main_command():
     runner = CliRunner()
@@ -58,6 +86,14 @@ def test_main_command():
         )
         assert result.exit_code == 0, "Failed to execute main command successfully"
 
+    # Multiple workers
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        result = runner.invoke(
+            main, ["-s", "NHMD", "-n", "1-20", "-o", output_path, "-w", "2"]
+        )
+        assert result.exit_code == 0, "Failed to execute with multiple workers"
+
     # Invalid number format
     with tempfile.TemporaryDirectory() as tempdir:
         output_path = tempdir + "/test.pdf"
@@ -89,3 +125,258 @@ def test_main_command():
             main, ["-s", "NHMD", "-n", "1-5", "-o", output_path, "-p", "-1"]
         )
         assert result.exit_code != 0, "Failed to handle negative label padding"
+
+    # Provide zero workers
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        result = runner.invoke(
+            main, ["-s", "NHMD", "-n", "1-5", "-o", output_path, "-w", "0"]
+        )
+        assert result.exit_code != 0, "Failed to handle zero workers"
+
+
+def test_main_command_parallel_pages():
+    pytest.importorskip("pypdf")
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        result = runner.invoke(
+            main,
+            [
+                "-s",
+                "NHMD",
+                "-n",
+                "1-5",
+                "-o",
+                output_path,
+                "-w",
+                "2",
+                "--parallel-pages",
+            ],
+        )
+        assert result.exit_code == 0, "Failed to execute main command successfully"
+
+
+def test_main_command_pipeline():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        result = runner.invoke(
+            main, ["-s", "NHMD", "-n", "1-5", "-o", output_path, "--pipeline"]
+        )
+        assert result.exit_code == 0, "Failed to execute main command successfully"
+        assert os.path.exists(output_path)
+
+        # The labels of images are not drawn on pages
+        result = runner.invoke(
+            main,
+            ["-s", "NHMD", "-n", "1-5", "-o", tempdir + "/test.zip", "--pipeline"],
+        )
+        assert result.exit_code == 2, "Failed to reject --pipeline for images"
+
+
+def test_main_command_cache_dir():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        cache_dir = tempdir + "/cache"
+        args = ["-s", "NHMD", "-n", "1-5", "-o", output_path, "--cache-dir", cache_dir]
+        for _ in range(2):
+            result = runner.invoke(main, args)
+            assert result.exit_code == 0, "Failed to execute main command successfully"
+        assert os.path.exists(os.path.join(cache_dir, "labels.sqlite3"))
+
+
+def test_main_command_pipeline_cache_dir():
+    from pinned_datamatrix.cache import FLUSH_INTERVAL, LabelCache
+
+    runner = CliRunner()
+    count = FLUSH_INTERVAL + 44
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache_dir = tempdir + "/cache"
+        # The cache is written from the thread creating the labels, and closed in
+        # the main thread
+        result = runner.invoke(
+            main,
+            [
+                "-s",
+                "NHMD",
+                "-n",
+                f"1-{count}",
+                "-o",
+                tempdir + "/test.pdf",
+                "--pipeline",
+                "--cache-dir",
+                cache_dir,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        assert len(LabelCache(cache_dir)) == count
+
+
+def test_main_command_stats():
+    encode_modules.cache_clear()
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/test.pdf"
+        stats_path = tempdir + "/stats.json"
+        profile_path = tempdir + "/profile.prof"
+        result = runner.invoke(
+            main,
+            [
+                "-s",
+                "NHMD",
+                "-n",
+                "1-5",
+                "-o",
+                output_path,
+                "--stats",
+                "--stats-json",
+                stats_path,
+                "--profile",
+                profile_path,
+            ],
+        )
+        assert result.exit_code == 0, "Failed to execute main command successfully"
+        assert "wall time" in result.output
+        with open(stats_path) as f:
+            stats = json.load(f)
+        assert stats["stages"]["encode"]["count"] == 5
+        assert stats["stages"]["save"]["count"] == 1
+        pstats.Stats(profile_path)
+
+
+def test_main_imports_no_heavy_dependencies():
+    # A fresh process, as the tests have imported everything already
+    code = (
+        "import sys, pinned_datamatrix.__main__; "
+        "print(sorted({'reportlab', 'numpy', 'pylibdmtx', 'svglib', 'pkg_resources'} "
+        "& set(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_main_command_raster():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/labels.zip"
+        result = runner.invoke(
+            main, ["-s", "NHMD", "-n", "1-5", "-o", output_path, "--dpi", "300"]
+        )
+        assert result.exit_code == 0, "Failed to execute main command successfully"
+        with zipfile.ZipFile(output_path) as archive:
+            assert len(archive.namelist()) == 5
+
+        result = runner.invoke(
+            main,
+            [
+                "-s",
+                "NHMD",
+                "-n",
+                "1-5",
+                "-o",
+                output_path,
+                "-w",
+                "2",
+                "--parallel-pages",
+            ],
+        )
+        assert result.exit_code != 0, "Failed to reject --parallel-pages"
+
+
+def test_main_command_pages_per_file():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        output_path = tempdir + "/labels.pdf"
+        args = ["-s", "NHMD", "-n", "1-5", "-o", output_path, "--pages-per-file", "1"]
+        result = runner.invoke(main, args)
+        assert result.exit_code == 0, "Failed to execute main command successfully"
+        assert os.path.exists(tempdir + "/labels_0001.pdf")
+        assert os.path.exists(tempdir + "/labels.state.json")
+
+        result = runner.invoke(main, [*args, "--resume"])
+        assert result.exit_code == 0, "Failed to resume a completed run"
+
+        result = runner.invoke(main, [*args[:-2], "--resume"])
+        assert result.exit_code != 0, "Failed to reject --resume without files"
+
+        args[3] = "1-6"
+        result = runner.invoke(main, [*args, "--resume"])
+        assert result.exit_code != 0, "Failed to reject resuming another run"
+
+
+def test_batch_command():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tempdir:
+        manifest = {
+            "jobs": [
+                {"style": "NHMD", "numbers": "1-5", "output": "a.pdf"},
+                {
+                    "style": "NHMA",
+                    "numbers": [6, 7],
+                    "bottom_text": "ENTOMOLOGY",
+                    "output": "b.zip",
+                },
+            ]
+        }
+        manifest_path = os.path.join(tempdir, "jobs.json")
+        summary_path = os.path.join(tempdir, "summary.json")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        result = runner.invoke(
+            main, ["batch", manifest_path, "--summary", summary_path]
+        )
+        assert result.exit_code == 0, "Failed to execute batch command successfully"
+        assert os.path.exists(os.path.join(tempdir, "a.pdf"))
+        assert os.path.exists(os.path.join(tempdir, "b.zip"))
+        with open(summary_path) as f:
+            summary = json.load(f)
+        assert [job["labels"] for job in summary] == [5, 2]
+        assert all(job["error"] is None for job in summary)
+
+        # A failed job is reported, and does not stop the others
+        manifest["jobs"].insert(
+            0, {"style": "NHMD", "numbers": "1", "output": "missing/dir/c.pdf"}
+        )
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        result = runner.invoke(
+            main, ["batch", manifest_path, "--summary", summary_path]
+        )
+        assert result.exit_code != 0, "Failed to report the failed job"
+        with open(summary_path) as f:
+            summary = json.load(f)
+        assert [job["error"] is None for job in summary] == [False, True, True]
+
+        # Invalid numbers are rejected before any job runs
+        manifest["jobs"][0]["numbers"] = "1-abc"
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        result = runner.invoke(main, ["batch", manifest_path])
+        assert result.exit_code == 2, "Failed to reject invalid numbers"
+
+
+def test_serve_command():
+    process = subprocess.Popen(
+        [sys.executable, "-m", "pinned_datamatrix", "serve", "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        # The address is printed once the workers are warm
+        address = process.stdout.readline().split()[-1]
+        host, port = address.removeprefix("http://").split(":")
+        connection = http.client.HTTPConnection(host, int(port), timeout=60)
+        connection.request(
+            "POST", "/render", json.dumps({"style": "NHMD", "numbers": "1-5"})
+        )
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.read().startswith(b"%PDF")
+        connection.close()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
@@ -0,0 +1,80 @@
+import pickle
+
+import pytest
+
+from pinned_datamatrix.number_ranges import NumberRanges
+
+
+class TestNumberRanges:
+    def test_parse(self):
+        numbers = NumberRanges.parse("1-5,7,9-11")
+        assert list(numbers) == [1, 2, 3, 4, 5, 7, 9, 10, 11]
+        assert len(numbers) == 9
+        assert numbers.ranges == [range(1, 6), range(7, 8), range(9, 12)]
+        assert str(numbers) == "1-5,7,9-11"
+
+    def test_parse_keeps_order_and_duplicates(self):
+        numbers = NumberRanges.parse("10-12,1,11")
+        assert list(numbers) == [10, 11, 12, 1, 11]
+
+    def test_consecutive_ranges_are_joined(self):
+        numbers = NumberRanges.parse("1-5,6,7-10")
+        assert numbers.ranges == [range(1, 11)]
+        assert numbers == NumberRanges([range(1, 11)])
+
+    def test_large_range_is_not_expanded(self):
+        numbers = NumberRanges.parse("1-1000000000")
+        assert len(numbers) == 1000000000
+        assert numbers[-1] == 1000000000
+        assert 500000000 in numbers
+        assert len(pickle.dumps(numbers)) < 200
+
+    @pytest.mark.parametrize("spec", ["", "a", "1-2-3", "5-1", "1,,2", "-5", "1-"])
+    def test_parse_invalid(self, spec):
+        with pytest.raises(ValueError):
+            NumberRanges.parse(spec)
+
+    def test_invalid_step(self):
+        with pytest.raises(ValueError):
+            NumberRanges([range(0, 10, 2)])
+
+    def test_indexing(self):
+        numbers = NumberRanges.parse("1-5,7,9-11")
+        expected = list(numbers)
+        assert [numbers[i] for i in range(len(numbers))] == expected
+        assert [numbers[-i] for i in range(1, len(numbers) + 1)] == expected[::-1]
+        with pytest.raises(IndexError):
+            numbers[9]
+        with pytest.raises(IndexError):
+            numbers[-10]
+
+    @pytest.mark.parametrize(
+        "index",
+        [
+            slice(None),
+            slice(3, None),
+            slice(None, 6),
+            slice(2, 7),
+            slice(5, 6),
+            slice(8, 3),
+            slice(-4, -1),
+            slice(None, None, 2),
+            slice(None, None, -1),
+        ],
+    )
+    def test_slicing(self, index):
+        numbers = NumberRanges.parse("1-5,7,9-11")
+        sliced = numbers[index]
+        assert isinstance(sliced, NumberRanges)
+        assert list(sliced) == list(numbers)[index]
+
+    def test_merged(self):
+        numbers = NumberRanges.parse("20-30,1-5,3-8,9,25-40,50")
+        assert str(numbers.merged()) == "1-9,20-40,50"
+        assert list(numbers.merged()) == sorted(set(numbers))
+
+    def test_empty(self):
+        numbers = NumberRanges()
+        assert len(numbers) == 0
+        assert list(numbers) == []
+        assert numbers[:] == numbers
@@ -0,0 +1,158 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial as Partial
+
+import pytest
+from reportlab import rl_config
+
+from pinned_datamatrix.__main__ import generate_labels, generate_pdf
+from pinned_datamatrix.datamatrix_generator import encode_modules
+from pinned_datamatrix.number_ranges import NumberRanges
+from pinned_datamatrix.parallel import get_chunksize, map_labels, render_sheet
+from pinned_datamatrix.sheet_generator import Sheet
+from pinned_datamatrix.stats import collect
+from pinned_datamatrix.styles import NHMA, NHMD, create_labels
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_map_labels_keeps_order(workers):
+    numbers = [5, 3, 123456789, 1, 42]
+    labels = list(map_labels(NHMD, numbers, workers=workers, chunksize=2))
+    assert [label.data for label in labels] == [str(n).zfill(9) for n in numbers]
+
+
+def test_map_labels_encodes_chunks():
+    encode_modules.cache_clear()
+    with collect() as stats:
+        labels = list(map_labels(Partial(NHMD), range(1, 11), chunksize=4))
+    assert [label.data for label in labels] == [str(n).zfill(9) for n in range(1, 11)]
+    # Encoded in blocks, not one at a time through the memo
+    assert stats.counts["encode"] == 10
+    assert encode_modules.cache_info().misses == 0
+
+
+def test_create_labels_of_other_functions():
+    def label_func(number):
+        return NHMD(number + 1)
+
+    labels = create_labels(label_func, [1, 2])
+    assert [label.data for label in labels] == ["000000002", "000000003"]
+
+
+def test_map_labels_with_executor():
+    label_func = Partial(NHMA, bottom_text="ENTOMOLOGY")
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        labels = list(map_labels(label_func, range(10), executor=executor))
+    expected = [label_func(n) for n in range(10)]
+    assert [label.svg_to_string() for label in labels] == [
+        label.svg_to_string() for label in expected
+    ]
+
+
+def test_map_labels_invalid_workers():
+    with pytest.raises(ValueError):
+        map_labels(NHMD, [1, 2, 3], workers=0)
+
+
+@pytest.mark.parametrize(
+    "num_items, workers, expected",
+    [(0, 4, 1), (10, 4, 1), (1000, 4, 62), (1_000_000, 32, 256)],
+)
+def test_get_chunksize(num_items, workers, expected):
+    assert get_chunksize(num_items, workers) == expected
+
+
+def test_parallel_pdf_is_identical_to_serial(tmpdir, monkeypatch):
+    monkeypatch.setattr(rl_config, "invariant", 1)
+    numbers = list(range(100))
+    pdfs = []
+    for workers, pipeline in [(1, False), (4, False), (1, True), (2, True)]:
+        output_path = str(tmpdir.join(f"labels_{workers}_{pipeline}.pdf"))
+        labels = generate_labels(
+            Partial(NHMD), numbers, workers=workers, pipeline=pipeline
+        )
+        generate_pdf(labels, output_path, double_sided=True, label_padding=0.25)
+        with open(output_path, "rb") as f:
+            pdfs.append(f.read())
+    assert all(pdf == pdfs[0] for pdf in pdfs[1:])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_map_labels_pipeline_prepares_drawings(workers):
+    numbers = range(1, 8)
+    labels = list(map_labels(NHMD, numbers, workers=workers, pipeline=True))
+    assert [label.data for label in labels] == [str(n).zfill(9) for n in numbers]
+    assert all(label._drawing_parts is not None for label in labels)
+
+
+def test_map_labels_pipeline_thread_submits_lazily():
+    submitted = []
+
+    def numbers():
+        for n in range(1000):
+            submitted.append(n)
+            yield n
+
+    labels = map_labels(NHMD, numbers(), pipeline=True, chunksize=10)
+    next(labels)
+    # The background thread stays a few chunks ahead of the consumer
+    assert len(submitted) < 100
+    labels.close()
+
+
+def test_map_labels_submits_lazily():
+    submitted = []
+
+    def numbers():
+        for n in range(1000):
+            submitted.append(n)
+            yield n
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        labels = map_labels(NHMD, numbers(), executor=executor, chunksize=10)
+        next(labels)
+        # Only a few chunks ahead of the consumer are submitted to the pool
+        assert len(submitted) < 100
+        labels.close()
+
+
+@pytest.mark.parametrize(
+    "pages_per_task, numbers",
+    [(1, list(range(20))), (2, NumberRanges([range(20)]))],
+)
+def test_render_sheet_matches_serial(tmpdir, pages_per_task, numbers):
+    pypdf = pytest.importorskip("pypdf")
+    label_func = Partial(NHMA, bottom_text="ENTOMOLOGY")
+    # A small page, so the labels span a few pages
+    sheet_kwargs = dict(page_size=(80, 60), double_sided=True)
+    serial_path = str(tmpdir.join("serial.pdf"))
+    parallel_path = str(tmpdir.join("parallel.pdf"))
+    sheet = Sheet(map(label_func, numbers), serial_path, **sheet_kwargs)
+    sheet.generate()
+    sheet.c.save()
+    render_sheet(
+        label_func,
+        numbers,
+        parallel_path,
+        workers=2,
+        pages_per_task=pages_per_task,
+        **sheet_kwargs,
+    )
+    serial = pypdf.PdfReader(serial_path)
+    parallel = pypdf.PdfReader(parallel_path)
+    assert len(parallel.pages) == len(serial.pages) == 14
+    # Same labels on the same pages, with each back side after its front
+    for serial_page, parallel_page in zip(serial.pages, parallel.pages, strict=True):
+        parallel_text = parallel_page.extract_text().split()
+        assert sorted(parallel_text) == sorted(serial_page.extract_text().split())
+
+
+def test_render_sheet_no_numbers(tmpdir):
+    pytest.importorskip("pypdf")
+    with pytest.raises(ValueError):
+        render_sheet(NHMD, [], str(tmpdir.join("labels.pdf")), workers=2)
+
+
+def test_map_labels_with_number_ranges():
+    numbers = NumberRanges.parse("1-5,100,7-9")
+    labels = list(map_labels(NHMD, numbers, workers=2, chunksize=3))
+    assert [label.data for label in labels] == [str(n).zfill(9) for n in numbers]
@@ -0,0 +1,144 @@
+import math
+import os
+import zipfile
+
+import numpy as np
+import pytest
+import zxingcpp
+from PIL import Image
+
+from pinned_datamatrix.label_generator import Label
+from pinned_datamatrix.raster import (
+    LabelRasterizer,
+    rasterize_labels,
+    save_label_images,
+)
+from pinned_datamatrix.styles import NHMA, NHMD
+
+
+def rotated_label(orientation: str, align: str) -> Label:
+    return Label(
+        "12345",
+        20,
+        20,
+        ["AB", "123456", "xyz"],
+        font_size=3,
+        text_oritentation=orientation,
+        text_align=align,
+        text_area_margins=(0, 0, 0, 0),
+        datamatrix_alignment="bottom_right",
+        dot_alignment=None,
+        check_overlap=False,
+    )
+
+
+def module_centers(image: Image.Image, label: Label) -> np.ndarray:
+    # Whether the pixel at the center of each module is black
+    pixels_per_mm = image.info["dpi"][0] / 25.4
+    x, y = label.template.datamatrix_position
+    modules = label.dm.shape[0]
+    length = label.template.datamatrix_length
+    centers = (np.arange(modules) + 0.5) * length / modules
+    columns = ((x + centers) * pixels_per_mm).astype(int)
+    rows = ((y + centers) * pixels_per_mm).astype(int)
+    return ~np.asarray(image)[np.ix_(rows, columns)]
+
+
+class TestLabelRasterizer:
+    def test_image(self):
+        label = NHMD(123456)
+        image = LabelRasterizer(label.template, dpi=600).rasterize(label)
+        assert image.mode == "1"
+        assert image.size == (round(12 / 25.4 * 600), round(5 / 25.4 * 600))
+        assert image.info["dpi"] == (600, 600)
+
+    @pytest.mark.parametrize("dpi", [300, 600, 1200])
+    def test_decodes(self, dpi):
+        label = NHMA(42, "ENTOMOLOGY")
+        image = LabelRasterizer(label.template, dpi=dpi).rasterize(label)
+        decoded = zxingcpp.read_barcode(image, zxingcpp.BarcodeFormat.DataMatrix)
+        assert decoded is not None
+        assert decoded.text == label.data
+
+    @pytest.mark.parametrize(
+        "label",
+        [NHMD(123456), NHMA(42, "ENTOMOLOGY")]
+        + [
+            rotated_label(orientation, align)
+            for orientation in ["top", "right", "bottom", "left"]
+            for align in ["left", "center", "right"]
+        ],
+    )
+    def test_matches_layout(self, label):
+        # Compared with the layout rather than a ReportLab rendering, whose
+        # antialiasing depends on the state other tests leave behind
+        rasterizer = LabelRasterizer(label.template, dpi=600)
+        image = rasterizer.rasterize(label)
+        ink = ~np.asarray(image)
+        covered = np.zeros_like(ink)
+        objects = label.template.object_bounds(label.text_lines, label.dm.shape[0])
+        for name, bounds in objects:
+            x0, y0, x1, y1 = (bound * rasterizer.scale for bound in bounds)
+            box = (
+                slice(max(0, math.floor(y0)), math.ceil(y1)),
+                slice(max(0, math.floor(x0)), math.ceil(x1)),
+            )
+            covered[box] = True
+            assert ink[box].any(), f"{name} is missing"
+        # All ink is within the bounds of the objects
+        assert not (ink & ~covered).any()
+        assert np.array_equal(module_centers(image, label), label.dm.dm_array)
+        decoded = zxingcpp.read_barcode(image, zxingcpp.BarcodeFormat.DataMatrix)
+        assert decoded is not None
+        assert decoded.text == label.data
+
+    def test_modules_are_exact(self):
+        label = NHMD(123456)
+        image = LabelRasterizer(label.template, dpi=25.4 * 10).rasterize(label)
+        assert np.array_equal(module_centers(image, label), label.dm.dm_array)
+
+    def test_invalid_dpi(self):
+        with pytest.raises(ValueError):
+            LabelRasterizer(NHMD(1).template, dpi=0)
+
+
+def test_rasterize_labels():
+    labels = [NHMD(1), NHMA(2, "ENTOMOLOGY"), NHMD(3)]
+    images = list(rasterize_labels(labels, dpi=300))
+    assert [image.size for image in images] == [
+        LabelRasterizer(label.template, dpi=300).rasterize(label).size
+        for label in labels
+    ]
+
+
+class TestSaveLabelImages:
+    def test_zip(self, tmpdir):
+        path = str(tmpdir.join("labels.zip"))
+        labels = [NHMD(number) for number in range(1, 4)]
+        assert save_label_images(iter(labels), path, progress=False) == 3
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            assert names == [
+                "000000_000000001.png",
+                "000001_000000002.png",
+                "000002_000000003.png",
+            ]
+            with archive.open(names[0]) as f:
+                assert Image.open(f).mode == "1"
+
+    def test_tiff(self, tmpdir):
+        path = str(tmpdir.join("labels.tif"))
+        labels = [NHMD(number) for number in range(1, 4)]
+        assert save_label_images(labels, path, dpi=1200, progress=False) == 3
+        with Image.open(path) as image:
+            assert image.n_frames == 3
+            assert image.info["compression"] == "group4"
+            assert image.info["dpi"] == (1200, 1200)
+
+    def test_directory(self, tmpdir):
+        path = str(tmpdir.join("labels"))
+        assert save_label_images([NHMD(1), NHMD(2)], path, progress=False) == 2
+        assert sorted(os.listdir(path)) == [
+            "000000_000000001.png",
+            "000001_000000002.png",
+        ]
@@ -0,0 +1,297 @@
+import http.client
+import io
+import json
+import os
+import signal
+import socket
+import threading
+
+import pytest
+from pypdf import PdfReader
+
+from pinned_datamatrix.server import (
+    MAX_BODY_SIZE,
+    QueueFull,
+    Renderer,
+    RenderRequest,
+    make_server,
+    render_pdf,
+)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def post(connection, path: str, content) -> tuple[http.client.HTTPResponse, bytes]:
+    body = content if isinstance(content, bytes) else json.dumps(content).encode()
+    connection.request("POST", path, body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    renderer = Renderer(workers=1, queue_size=1, max_labels=100)
+    yield renderer
+    renderer.close()
+
+
+@pytest.fixture
+def server(renderer):
+    server = make_server(renderer, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connection(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    yield connection
+    connection.close()
+
+
+class TestRenderRequest:
+    def test_defaults(self):
+        request = RenderRequest(style="NHMD", numbers="1-5,7")
+        assert request.bottom_text == ""
+        assert request.label_padding == 0.25
+        assert list(request.number_ranges) == [1, 2, 3, 4, 5, 7]
+
+    def test_from_json(self):
+        request = RenderRequest.from_json(
+            b'{"style": "NHMA", "numbers": [3, 4], "bottom_text": "ENTOMOLOGY"}'
+        )
+        assert request == RenderRequest("NHMA", "3,4", bottom_text="ENTOMOLOGY")
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            b"not json",
+            b"[1, 2]",
+            b'{"style": "NHMD"}',
+            b'{"style": "NHMD", "numbers": "1", "output": "a.pdf"}',
+            b'{"style": "INVALID", "numbers": "1"}',
+            b'{"style": "NHMD", "numbers": "5-1"}',
+            b'{"style": "NHMD", "numbers": "1", "label_padding": -1}',
+            b'{"style": "NHMD", "numbers": "1", "label_padding": NaN}',
+            b'{"style": "NHMD", "numbers": "1", "label_padding": Infinity}',
+        ],
+    )
+    def test_invalid(self, body):
+        with pytest.raises(ValueError):
+            RenderRequest.from_json(body)
+
+
+def test_render_pdf():
+    pdf, stats = render_pdf(RenderRequest("NHMD", "1-10"))
+    # Front and back side
+    assert len(PdfReader(io.BytesIO(pdf)).pages) == 2
+    assert stats["stages"]["save"]["count"] == 1
+
+
+class TestServer:
+    def test_render(self, connection):
+        response, body = post(
+            connection,
+            "/render",
+            {"style": "NHMA", "numbers": "1-20", "bottom_text": "ENTOMOLOGY"},
+        )
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "application/pdf"
+        assert body.startswith(b"%PDF")
+        assert len(PdfReader(io.BytesIO(body)).pages) == 2
+        timing = dict(
+            entry.split(";dur=")
+            for entry in response.getheader("Server-Timing").split(", ")
+        )
+        assert {"queue", "drawing", "draw", "save", "total"} <= set(timing)
+        assert float(timing["total"]) >= float(timing["save"])
+
+    def test_requests_share_a_connection(self, connection):
+        for numbers in ["1-3", "4-6"]:
+            response, body = post(
+                connection, "/render", {"style": "NHMD", "numbers": numbers}
+            )
+            assert response.status == 200
+            assert body.startswith(b"%PDF")
+
+    def test_invalid_request(self, connection):
+        response, body = post(connection, "/render", {"style": "NHMD"})
+        assert response.status == 400
+        assert "numbers" in json.loads(body)["error"]
+
+    def test_too_many_labels(self, connection):
+        response, body = post(
+            connection, "/render", {"style": "NHMD", "numbers": "1-101"}
+        )
+        assert response.status == 400
+        assert "at most 100 labels" in json.loads(body)["error"]
+
+    def test_queue_full(self, connection, renderer):
+        # Take the slots of the worker and the queue
+        renderer._slots.acquire()
+        renderer._slots.acquire()
+        try:
+            with pytest.raises(QueueFull):
+                renderer.render(RenderRequest("NHMD", "1"))
+            response, body = post(
+                connection, "/render", {"style": "NHMD", "numbers": "1"}
+            )
+        finally:
+            renderer._slots.release()
+            renderer._slots.release()
+        assert response.status == 503
+        assert response.getheader("Retry-After") == "1"
+        assert "busy" in json.loads(body)["error"]
+
+    def test_concurrent_requests_are_queued(self, server):
+        results = []
+
+        def request():
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            response, _ = post(
+                connection, "/render", {"style": "NHMD", "numbers": "1-50"}
+            )
+            results.append(response.status)
+            connection.close()
+
+        # One request is rendered while the other waits for the worker
+        threads = [threading.Thread(target=request) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [200, 200]
+
+    def test_worker_lost(self):
+        renderer = Renderer(workers=1, queue_size=0)
+        server = make_server(renderer, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        try:
+            # As if the worker was killed for running out of memory
+            for pid in list(renderer.executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            response, body = post(
+                connection, "/render", {"style": "NHMD", "numbers": "1"}
+            )
+            assert response.status == 503
+            assert "restarted" in json.loads(body)["error"]
+            # The restarted workers render the next request
+            response, body = post(
+                connection, "/render", {"style": "NHMD", "numbers": "1"}
+            )
+            assert response.status == 200
+            assert body.startswith(b"%PDF")
+        finally:
+            connection.close()
+            server.shutdown()
+            server.server_close()
+            renderer.close()
+
+    def test_status(self, connection, renderer):
+        completed = renderer.status()["completed"]
+        post(connection, "/render", {"style": "NHMD", "numbers": "1"})
+        connection.request("GET", "/status")
+        response = connection.getresponse()
+        status = json.loads(response.read())
+        assert response.status == 200
+        assert status["workers"] == 1
+        assert status["pending"] == 0
+        assert status["completed"] == completed + 1
+
+    def test_labels_do_not_fit(self, connection):
+        response, body = post(
+            connection,
+            "/render",
+            {"style": "NHMA", "numbers": "1", "bottom_text": "ENTOMOLOGY" * 5},
+        )
+        assert response.status == 400
+        assert "outside of the label" in json.loads(body)["error"]
+
+    def test_missing_content_length(self, connection):
+        connection.putrequest("POST", "/render")
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 411
+        assert "Content-Length" in json.loads(response.read())["error"]
+
+    @pytest.mark.parametrize("content_length", ["abc", "-1"])
+    def test_invalid_content_length(self, connection, content_length):
+        connection.putrequest("POST", "/render")
+        connection.putheader("Content-Length", content_length)
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400
+        assert response.getheader("Connection") == "close"
+        assert "Content-Length" in json.loads(response.read())["error"]
+
+    def test_body_too_large(self, connection):
+        connection.putrequest("POST", "/render")
+        connection.putheader("Content-Length", str(MAX_BODY_SIZE + 1))
+        connection.endheaders()
+        # The body is not read
+        response = connection.getresponse()
+        assert response.status == 413
+        assert response.getheader("Connection") == "close"
+        assert "at most" in json.loads(response.read())["error"]
+
+    def test_not_found(self, connection):
+        response, _ = post(connection, "/print", {})
+        assert response.status == 404
+
+    def test_unix_socket(self, renderer, tmpdir):
+        path = str(tmpdir.join("render.sock"))
+        server = make_server(renderer, socket_path=path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            connection = UnixHTTPConnection(path)
+            response, body = post(
+                connection, "/render", {"style": "NHMD", "numbers": "1-5"}
+            )
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert response.status == 200
+        assert body.startswith(b"%PDF")
+        assert not tmpdir.join("render.sock").exists()
+
+    def test_unix_socket_replaces_stale_socket(self, renderer, tmpdir):
+        path = str(tmpdir.join("render.sock"))
+        # A socket left behind by a server that is gone
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = make_server(renderer, socket_path=path)
+        server.server_close()
+        assert not tmpdir.join("render.sock").exists()
+
+    def test_unix_socket_in_use(self, renderer, tmpdir):
+        path = str(tmpdir.join("render.sock"))
+        server = make_server(renderer, socket_path=path)
+        try:
+            with pytest.raises(OSError, match="in use"):
+                make_server(renderer, socket_path=path)
+            # The socket of the running server is kept
+            assert tmpdir.join("render.sock").exists()
+        finally:
+            server.server_close()
+
+    def test_unix_socket_keeps_other_files(self, renderer, tmpdir):
+        tmpdir.join("render.sock").write("data")
+        with pytest.raises(OSError, match="in use"):
+            make_server(renderer, socket_path=str(tmpdir.join("render.sock")))
+        assert tmpdir.join("render.sock").read() == "data"
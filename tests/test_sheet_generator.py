@@ -1,8 +1,12 @@
-import pytest
 from unittest.mock import Mock
+
+import pytest
+from pypdf import PdfReader
+from reportlab.lib.rl_accel import fp_str
 from reportlab.lib.units import mm
-from pinned_datamatrix.sheet_generator import Sheet
+
 from pinned_datamatrix.label_generator import Label
+from pinned_datamatrix.sheet_generator import Sheet
 
 
 @pytest.fixture
@@ -137,3 +141,163 @@ class TestSheet:
                 label_padding=label_padding,
                 double_sided=double_sided,
             )
+
+    def test_generate(self, sheet_fixture):
+        (
+            labels,
+            output_path,
+            page_size,
+            page_margins,
+            label_padding,
+            double_sided,
+            _,
+            _,
+        ) = sheet_fixture
+        sheet = Sheet(
+            labels=labels,
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+            double_sided=double_sided,
+        )
+        sheet.generate()
+        sheet.c.save()
+        with open(output_path, "rb") as f:
+            pdf = f.read()
+        assert pdf.startswith(b"%PDF")
+        # Front and back side
+        assert pdf.count(b"/Type /Page\n") == 2
+
+    def test_generate_from_iterator(self, sheet_fixture):
+        (
+            labels,
+            output_path,
+            page_size,
+            page_margins,
+            label_padding,
+            double_sided,
+            _,
+            _,
+        ) = sheet_fixture
+        # The labels are read lazily, one at a time
+        sheet = Sheet(
+            labels=(label for label in labels),
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+            double_sided=double_sided,
+        )
+        sheet.generate()
+        sheet.c.save()
+        with open(output_path, "rb") as f:
+            pdf = f.read()
+        assert pdf.count(b"/Type /Page\n") == 2
+
+    def test_init_no_labels(self, sheet_fixture):
+        _, output_path, page_size, page_margins, label_padding, _, _, _ = sheet_fixture
+        with pytest.raises(ValueError):
+            Sheet(
+                labels=iter([]),
+                output_path=output_path,
+                page_size=page_size,
+                page_margins=page_margins,
+                label_padding=label_padding,
+            )
+
+    def test_generate_bad_label_type(self, sheet_fixture):
+        labels, output_path, page_size, page_margins, label_padding, _, _, _ = (
+            sheet_fixture
+        )
+        # Only the first label is checked up front, the rest while generating
+        sheet = Sheet(
+            labels=iter([labels[0], 1]),  # type: ignore
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+        )
+        with pytest.raises(TypeError):
+            sheet.generate()
+
+    def test_generate_reuses_static_artwork(self, sheet_fixture):
+        labels, output_path, page_size, page_margins, label_padding, _, _, _ = (
+            sheet_fixture
+        )
+        sheet = Sheet(
+            labels=labels,
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+            double_sided=True,
+        )
+        sheet.generate()
+        sheet.c.save()
+        with open(output_path, "rb") as f:
+            pdf = f.read()
+        # The padding box, the pin dot and the "NHMD" line are each defined once, and
+        # the single row of labels is a form shared by the front and the back
+        assert pdf.count(b"/Subtype /Form") == 4
+        assert sorted(sheet._forms.values()) == ["label_part_0", "label_part_1"]
+
+    def test_page_count(self, sheet_fixture):
+        labels, output_path, page_size, page_margins, label_padding, _, _, _ = (
+            sheet_fixture
+        )
+        kwargs = dict(
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+        )
+        assert Sheet(labels=labels, double_sided=True, **kwargs).page_count() == 2
+        assert Sheet(labels=labels, **kwargs).page_count() == 1
+        assert Sheet(labels=iter(labels), **kwargs).page_count() is None
+
+    def test_generate_mixed_label_sizes(self, sheet_fixture):
+        labels, output_path, page_size, page_margins, label_padding, _, _, _ = (
+            sheet_fixture
+        )
+        other = Label(
+            data="1",
+            width=20,
+            height=10,
+            font_size=3.7,
+            text_lines=["NHMD", "1"],
+            check_overlap=False,
+        )
+        sheet = Sheet(
+            labels=[labels[0], other],
+            output_path=output_path,
+            page_size=page_size,
+            page_margins=page_margins,
+            label_padding=label_padding,
+        )
+        with pytest.raises(ValueError):
+            sheet.generate()
+
+    def test_generate_back_from_row_forms(self, sheet_fixture):
+        labels, output_path, _, _, label_padding, _, _, _ = sheet_fixture
+        # Three rows of labels, the last one partly filled
+        sheet = Sheet(
+            labels=labels,
+            output_path=output_path,
+            page_size=(70, 40),
+            page_margins=(2, 2, 2, 2),
+            label_padding=label_padding,
+            double_sided=True,
+        )
+        assert len(sheet.layout.columns) == 5 and len(sheet.layout.rows) >= 4
+        sheet.generate()
+        sheet.c.save()
+        front, back = PdfReader(output_path).pages
+        rows = sorted(front["/Resources"]["/XObject"])
+        assert len(rows) == 4
+        assert sorted(back["/Resources"]["/XObject"]) == rows
+        # Each row is rotated about its centre line, mirrored along the page
+        content = back.get_contents().get_data().decode()
+        for y in sheet.layout.rows[:4]:
+            origin = 2 * y - sheet.layout.label_height
+            assert f"-1 0 0 -1 {fp_str(sheet.width, origin)} cm" in content
@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from pinned_datamatrix import stats
+from pinned_datamatrix.datamatrix_generator import encode_modules
+from pinned_datamatrix.parallel import map_labels
+from pinned_datamatrix.styles import NHMD
+
+
+def test_timed_without_hooks():
+    assert not stats.enabled()
+    timer = stats.timed("encode")
+    with timer:
+        pass
+    assert timer.start is None
+
+
+def test_hooks():
+    events = []
+
+    def hook(stage, seconds, count):
+        events.append((stage, seconds, count))
+
+    stats.add_hook(hook)
+    try:
+        assert stats.enabled()
+        with stats.timed("encode"):
+            pass
+        stats.report("draw", 2.0, 3)
+    finally:
+        stats.remove_hook(hook)
+    assert not stats.enabled()
+    assert [(stage, count) for stage, _, count in events] == [
+        ("encode", 1),
+        ("draw", 3),
+    ]
+    assert events[1][1] == 2.0
+
+
+def test_collect():
+    # Data encoded by earlier tests is not encoded again
+    encode_modules.cache_clear()
+    with stats.collect() as collected:
+        NHMD(1)
+        NHMD(2)
+        stats.report("custom", 1.0)
+    assert not stats.enabled()
+    stages = [stage for stage, _, _ in collected.events()]
+    assert stages == ["encode", "overlap", "custom"]
+    assert collected.counts["encode"] == 2
+    assert collected.wall_time >= collected.seconds["encode"]
+
+    result = collected.to_dict()
+    assert result["stages"]["custom"] == {"seconds": 1.0, "count": 1}
+    assert "wall time" in collected.format()
+
+
+def test_collect_from_worker_processes():
+    encode_modules.cache_clear()
+    with stats.collect() as collected, ProcessPoolExecutor(max_workers=2) as executor:
+        list(map_labels(NHMD, range(6), chunksize=2, executor=executor))
+    assert collected.counts["encode"] == 6
+    assert collected.counts["overlap"] == 6